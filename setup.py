@@ -22,9 +22,9 @@ setup(
     install_requires=[
         "numpy",
         "matplotlib",
-        "qsharp",
     ],
     extras_require={
+        "qsharp": ["qsharp"],
         "qiskit": ["qiskit", "qiskit-aer"],
     },
 )
@@ -0,0 +1,177 @@
+"""
+This module estimates the resources of a program without simulating it.
+
+`estimate` walks the kernels of a program once and counts qubits, allocations, measurements,
+gates by name, two-qubit gates, syndrome rounds and callback sites. Results are memoized by
+kernel, so the shared sub-kernels of QEC codes are only counted once, and `layers` reports the
+resources of a program after each compiler of a chain.
+
+Continuation kernels returned by callbacks are only known at runtime. When `continuations`
+gives, for a callback name, the kernel it returns and the expected number of times it is
+returned at each call, the resources of that kernel are added, scaled by that expectation.
+"""
+
+from collections import Counter
+
+from .ast import Kernel
+from .program import Program
+from .cache import LRUCache
+from .compiler import Compiler
+
+# Callbacks that consume the outcomes of a syndrome-extraction round.
+SYNDROME_CALLBACKS = {"correct_x", "correct_z", "frame_correct_x", "frame_correct_z"}
+
+# Upper bound on the kernels whose resources are kept.
+MAX_ANALYZED_KERNELS = 4096
+
+type Continuations = dict[str, tuple[Kernel, float]]
+
+
+def base_name(callback_name: str) -> str:
+    """The name of a callback before compilers prefixed it with `_<compiler>_:`."""
+    return callback_name.rsplit(":", 1)[-1]
+
+
+class Resources:
+    """
+    Resource counts of a program or kernel. Counts that include continuations are expectations.
+
+    Attributes:
+        qubits (int): Most qubits allocated at once.
+        allocations (float): Number of qubit allocations.
+        measurements (float): Number of measurements.
+        gates (Counter): Number of gates, by name.
+        two_qubit_gates (float): Number of gates on two qubits.
+        syndrome_rounds (float): Number of syndrome-extraction measurements rounds.
+        callbacks (Counter): Number of callback sites, by callback name.
+    """
+
+    def __init__(self):
+        self.qubits = 0
+        self.allocations = 0
+        self.measurements = 0
+        self.gates = Counter()
+        self.two_qubit_gates = 0
+        self.syndrome_rounds = 0
+        self.callbacks = Counter()
+
+    def add(self, other: "Resources", times: float = 1) -> "Resources":
+        """Add the counts of `other`, `times` times. Peak qubits are not added: they depend on the scope."""
+        self.allocations += other.allocations * times
+        self.measurements += other.measurements * times
+        for name, count in other.gates.items():
+            self.gates[name] += count * times
+        self.two_qubit_gates += other.two_qubit_gates * times
+        self.syndrome_rounds += other.syndrome_rounds * times
+        for name, count in other.callbacks.items():
+            self.callbacks[name] += count * times
+        return self
+
+    @property
+    def total_gates(self) -> float:
+        return sum(self.gates.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "qubits": self.qubits,
+            "allocations": self.allocations,
+            "measurements": self.measurements,
+            "gates": dict(self.gates),
+            "two_qubit_gates": self.two_qubit_gates,
+            "syndrome_rounds": self.syndrome_rounds,
+            "callbacks": dict(self.callbacks),
+        }
+
+    def __str__(self):
+        gates = ", ".join(f"{name}: {count:g}" for name, count in sorted(self.gates.items()))
+        return (
+            f"qubits: {self.qubits}, allocations: {self.allocations:g}, measurements: {self.measurements:g}, "
+            f"gates: {self.total_gates:g} ({gates}), two-qubit gates: {self.two_qubit_gates:g}, "
+            f"syndrome rounds: {self.syndrome_rounds:g}, callback sites: {sum(self.callbacks.values()):g}"
+        )
+
+
+class Estimator:
+    """
+    Counts the resources of kernels, memoized by kernel.
+
+    Constructor Arguments:
+        continuations (dict[str, tuple[Kernel, float]] | None):
+            For each callback (by name, without compiler prefixes), the kernel it continues with and
+            the expected number of times it does at each call.
+    """
+
+    def __init__(self, continuations: Continuations | None = None):
+        self.continuations = continuations or {}
+        self.cache = LRUCache(MAX_ANALYZED_KERNELS)
+        # Continuations are counted once, not the continuations of their own callbacks.
+        self.single = Estimator() if self.continuations else self
+
+    def kernel(self, kernel: Kernel) -> Resources:
+        try:
+            hash(kernel)
+        except TypeError:
+            # Parameters with unhashable values.
+            return self._kernel(kernel)
+        return self.cache.get(kernel, lambda: self._kernel(kernel))
+
+    def _kernel(self, kernel: Kernel) -> Resources:
+        resources = Resources()
+        # Peak qubits are counted from the start of the kernel: its target is live during its children.
+        own = 1 if kernel.target else 0
+        resources.qubits = own
+
+        for instruction in kernel.instructions:
+            if isinstance(instruction, Kernel):
+                child = self.kernel(instruction)
+                resources.add(child)
+                resources.qubits = max(resources.qubits, own + child.qubits)
+            else:
+                resources.gates[instruction.name] += 1
+                if len(instruction.targets) == 2:
+                    resources.two_qubit_gates += 1
+
+        if kernel.target:
+            resources.allocations += 1
+            resources.measurements += 1
+
+        if kernel.callback:
+            name = base_name(kernel.callback.name)
+            resources.callbacks[kernel.callback.name] += 1
+            if name in SYNDROME_CALLBACKS:
+                resources.syndrome_rounds += 1
+            if name in self.continuations:
+                continuation, expected = self.continuations[name]
+                counts = self.single.kernel(continuation)
+                resources.add(counts, expected)
+                # The callback runs once the target is measured, on top of the qubits of the enclosing scope.
+                resources.qubits = max(resources.qubits, counts.qubits)
+        return resources
+
+    def program(self, program: Program) -> Resources:
+        resources = Resources()
+        for kernel in program.kernels:
+            counts = self.kernel(kernel)
+            resources.add(counts)
+            resources.qubits = max(resources.qubits, counts.qubits)
+        return resources
+
+
+def estimate(program: Program, continuations: Continuations | None = None) -> Resources:
+    """The resources of `program`, counted without simulating it."""
+    return Estimator(continuations).program(program)
+
+
+def layers(
+    program: Program, *compilers: Compiler, continuations: Continuations | None = None
+) -> list[tuple[str, Resources]]:
+    """The resources of `program` and of its compilation after each compiler in turn, by layer name.
+    Continuation kernels are compiled along with the program."""
+    continuations = dict(continuations or {})
+    report = [(str(program.instruction_set), estimate(program, continuations))]
+    callbacks = set()
+    for compiler in compilers:
+        program, callbacks = compiler.compile(program, callbacks)
+        continuations = {name: (compiler.compile_kernel(k), e) for name, (k, e) in continuations.items()}
+        report.append((compiler.name, estimate(program, continuations)))
+    return report
@@ -1,15 +1,41 @@
+"""
+The nodes of a qstack program.
+
+Nodes are immutable and hashable: instructions and kernels keep their children in tuples and
+their parameters in a read-only `Parameters` mapping, `QubitId`s are interned so equal ids are
+the same object, and each node caches its structural hash. Compilers and lowering passes can
+then memoize their results by node, and programs made of many copies of the same sub-kernel
+only pay for the distinct ones.
+"""
+
+import weakref
+from collections.abc import Mapping
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Optional
 
 type Outcome = tuple[int]
 
 type ParameterValue = complex | float | int | QubitId | str
 
+# Live QubitIds by value, so creating an id that already exists returns the existing one.
+_qubit_ids = weakref.WeakValueDictionary()
+
 
 @dataclass(frozen=True)
 class QubitId:
     value: str
 
+    def __new__(cls, value: str):
+        qubit = _qubit_ids.get(value)
+        if qubit is None:
+            qubit = super().__new__(cls)
+            _qubit_ids[value] = qubit
+        return qubit
+
+    def __reduce__(self):
+        return (QubitId, (self.value,))
+
     @staticmethod
     def wrap(id):
         if isinstance(id, QubitId):
@@ -20,11 +46,79 @@ class QubitId:
         return str(self.value)
 
 
+class Parameters(Mapping):
+    """A read-only, hashable mapping of parameter names to values, in the order they were given."""
+
+    __slots__ = ("_items", "_dict", "_hash")
+
+    def __init__(self, parameters: Mapping | None = None):
+        self._dict = dict(parameters or {})
+        self._items = tuple(self._dict.items())
+        self._hash = None
+
+    @staticmethod
+    def wrap(parameters) -> "Parameters | None":
+        if parameters is None or isinstance(parameters, Parameters):
+            return parameters
+        return Parameters(parameters)
+
+    def __getitem__(self, name: str) -> ParameterValue:
+        return self._dict[name]
+
+    def __iter__(self):
+        return iter(self._dict)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __eq__(self, other):
+        if isinstance(other, Parameters):
+            return self._dict == other._dict
+        return isinstance(other, Mapping) and self._dict == dict(other)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self._items))
+        return self._hash
+
+    def __reduce__(self):
+        return (Parameters, (self._dict,))
+
+    def __repr__(self):
+        return repr(self._dict)
+
+
+def cached_hash(cls):
+    """Cache the dataclass-generated structural hash of `cls` on each instance after the first call."""
+    structural_hash = cls.__hash__
+
+    def __hash__(self):
+        try:
+            return self.__dict__["_hash"]
+        except KeyError:
+            value = structural_hash(self)
+            object.__setattr__(self, "_hash", value)
+            return value
+
+    def __getstate__(self):
+        # String hashes are salted per process, so the cached value is not pickled.
+        return {k: v for k, v in self.__dict__.items() if k != "_hash"}
+
+    cls.__hash__ = __hash__
+    cls.__getstate__ = __getstate__
+    return cls
+
+
+@cached_hash
 @dataclass(frozen=True)
 class QuantumInstruction:
     name: str
     targets: tuple[QubitId]
-    parameters: dict[str, ParameterValue] | None = None
+    parameters: Parameters | None = None
+
+    def __post_init__(self):
+        object.__setattr__(self, "targets", tuple(QubitId.wrap(t) for t in self.targets))
+        object.__setattr__(self, "parameters", Parameters.wrap(self.parameters))
 
     def print(self, indent=0):
         pre = "  " * indent
@@ -43,10 +137,14 @@ class QuantumInstruction:
         return self.print()
 
 
+@cached_hash
 @dataclass(frozen=True)
 class ClassicInstruction:
     name: str
-    parameters: dict[str, ParameterValue] | None = None
+    parameters: Parameters | None = None
+
+    def __post_init__(self):
+        object.__setattr__(self, "parameters", Parameters.wrap(self.parameters))
 
     @property
     def depth(self):
@@ -65,13 +163,21 @@ class ClassicInstruction:
         return self.print()
 
 
+@cached_hash
 @dataclass(frozen=True)
 class Kernel:
     target: QubitId | None
     instructions: tuple[QuantumInstruction]
     callback: ClassicInstruction | None = None
 
-    @property
+    def __post_init__(self):
+        # Callbacks often return continuations with `target=[]`: any falsy target means no target.
+        object.__setattr__(self, "target", QubitId.wrap(self.target) if self.target else None)
+        if not isinstance(self.instructions, tuple):
+            object.__setattr__(self, "instructions", tuple(self.instructions))
+
+    # Cached on the node: kernels are immutable and `single_shot` asks for the depth of every program.
+    @cached_property
     def depth(self):
         sub_kernels = [k for k in self.instructions if isinstance(k, Kernel)]
         if len(sub_kernels) == 0:
@@ -0,0 +1,210 @@
+"""
+This module defines `BranchCachingEmulator`, a QPU that caches the simulation of
+feed-forward programs across shots.
+
+For a noiseless program whose callbacks are deterministic, everything a shot does between
+two measurements is a function of the outcomes measured so far. The emulator keeps a tree of
+measurement points keyed by that outcome prefix: each node records the probability of the
+next outcome and, while it fits in memory, the state right before the measurement. Gates
+are buffered instead of applied; when a shot reaches a measurement whose prefix is already
+in the tree, the outcome is sampled from the stored probability without touching the state.
+Only prefixes that were never seen are simulated, resuming from the nearest cached ancestor.
+"""
+
+import logging
+from collections import OrderedDict
+
+from .processors import QPU
+from .ast import QuantumInstruction, QubitId
+from .statevector import NumpyEmulator
+
+
+logger = logging.getLogger("qstack")
+
+
+class BranchNode:
+    """A measurement point, reached by a given prefix of outcomes."""
+
+    __slots__ = ("children", "segment", "probability", "state", "allocations", "cached")
+
+    def __init__(self, cached: bool):
+        self.children = {}
+        # Operations executed between the parent's measurement and this one.
+        self.segment = None
+        # Probability of measuring 1 here, once known.
+        self.probability = None
+        # Pre-measurement state and allocation stack, while they stay in the LRU cache.
+        self.state = None
+        self.allocations = None
+        # Whether the node is part of the tree; nodes created when the tree is full are not.
+        self.cached = cached
+
+
+class BranchCachingEmulator(QPU):
+    """
+    Wraps a noiseless `NumpyEmulator`, replaying cached measurement branches instead of simulating them.
+
+    Constructor Arguments:
+        emulator (NumpyEmulator):
+            The emulator used to simulate new branches; its noise channel must be noiseless.
+        max_bytes (int):
+            Memory bound for the cached states. Least recently used states are evicted first.
+        max_nodes (int):
+            Maximum number of measurement points kept in the tree. Once reached, new
+            branches are still simulated correctly but not cached.
+    """
+
+    def __init__(self, emulator: NumpyEmulator, max_bytes: int = 1 << 28, max_nodes: int = 1 << 16):
+        super().__init__()
+
+        if not emulator.noiseless:
+            raise ValueError("Branch caching requires a noiseless emulator.")
+
+        self.emulator = emulator
+        self.rng = emulator.rng
+        self.max_bytes = max_bytes
+        self.max_nodes = max_nodes
+        self.num_qubits = None
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def seed(self, seed):
+        self.emulator.seed(seed)
+        self.rng = self.emulator.rng
+
+    def clear(self):
+        """Drop the whole branch tree."""
+        self.root = BranchNode(cached=True)
+        self.nodes = 1
+        self.lru = OrderedDict()
+        self.cached_bytes = 0
+
+    def restart(self, num_qubits: int):
+        if num_qubits != self.num_qubits:
+            self.clear()
+            self.num_qubits = num_qubits
+
+        # Path of nodes visited by this shot, the segments leading into each of them,
+        # and the outcomes measured at all but the last one.
+        self.path = [self.root]
+        self.segments = []
+        self.outcomes = []
+        self.pending = []
+
+    def allocate(self, target: QubitId):
+        self.pending.append((self.emulator.allocate, target))
+
+    def eval(self, instruction: QuantumInstruction):
+        self.pending.append((self.emulator.eval, instruction))
+
+    def measure(self):
+        node = self.path[-1]
+        segment = tuple(self.pending)
+        self.pending = []
+
+        if node.segment is None:
+            node.segment = segment
+        elif node.segment != segment:
+            # Different operations reached this point (a different program or a non-deterministic
+            # callback), so everything cached below it is stale.
+            logger.debug("branch cache: segment mismatch, dropping the branch")
+            node = self._replace(len(self.path) - 1)
+            node.segment = segment
+        self.segments.append(segment)
+
+        if node.probability is None:
+            self.misses += 1
+            self._materialize(len(self.path) - 1)
+        else:
+            self.hits += 1
+            if node.cached and node.state is not None:
+                self.lru.move_to_end(node)
+
+        outcome = int(self.rng.random() < node.probability)
+        logger.debug("outcome: %s", outcome)
+
+        child = node.children.get(outcome)
+        if child is None:
+            cached = node.cached and self.nodes < self.max_nodes
+            child = BranchNode(cached=cached)
+            if cached:
+                node.children[outcome] = child
+                self.nodes += 1
+
+        self.outcomes.append(outcome)
+        self.path.append(child)
+        return outcome
+
+    def _replace(self, depth: int) -> BranchNode:
+        """Replace path[depth] with an empty node, dropping its subtree from the tree."""
+        if depth == 0:
+            self.clear()
+            self.path[0] = self.root
+            return self.root
+
+        self._drop(self.path[depth])
+        node = BranchNode(cached=self.path[depth].cached)
+        if node.cached:
+            self.path[depth - 1].children[self.outcomes[depth - 1]] = node
+            self.nodes += 1
+        self.path[depth] = node
+        return node
+
+    def _drop(self, root: BranchNode):
+        """Release the nodes of the subtree at `root` and their cached states."""
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children.values())
+            if not node.cached:
+                continue
+            self.nodes -= 1
+            if node in self.lru:
+                del self.lru[node]
+                self.cached_bytes -= node.state.nbytes
+            node.state = None
+            node.allocations = None
+
+    def _materialize(self, depth: int):
+        """Compute the pre-measurement state of path[depth], resuming from the nearest cached ancestor."""
+        emulator = self.emulator
+
+        start = depth - 1
+        while start >= 0 and self.path[start].state is None:
+            start -= 1
+
+        if start < 0:
+            emulator.restart(self.num_qubits)
+        else:
+            self._load(self.path[start])
+            emulator.collapse(self.outcomes[start])
+
+        for i in range(start + 1, depth + 1):
+            if i > start + 1:
+                emulator.collapse(self.outcomes[i - 1])
+            for apply, arg in self.segments[i]:
+                apply(arg)
+            self._store(self.path[i])
+
+    def _load(self, node: BranchNode):
+        self.emulator.state = node.state.copy()
+        self.emulator.allocations = list(node.allocations)
+        self.emulator.slots = {t: i for i, t in enumerate(node.allocations)}
+
+    def _store(self, node: BranchNode):
+        state = self.emulator.state
+        node.probability = self.emulator.probability()
+        node.state = state.copy()
+        node.allocations = tuple(self.emulator.allocations)
+
+        if not node.cached:
+            return
+
+        self.lru[node] = None
+        self.cached_bytes += state.nbytes
+        while self.cached_bytes > self.max_bytes and len(self.lru) > 1:
+            evicted, _ = self.lru.popitem(last=False)
+            self.cached_bytes -= evicted.state.nbytes
+            evicted.state = None
+            evicted.allocations = None
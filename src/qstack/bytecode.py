@@ -0,0 +1,109 @@
+"""
+This module lowers a `Program` into a flat instruction stream for a given QPU.
+
+Walking the AST on every shot repeats the same work: `isinstance` checks, qubit-id lookups
+and per-gate dictionary lookups. Lowering does it once: kernels are flattened into tuples
+of `(opcode, a, b)`, gate targets are resolved to allocation-stack slots, and every gate is
+pre-bound to the QPU's own operation object through `QPU.prepare`. `QuantumMachine` then
+interprets the stream with a tight loop.
+
+Continuation kernels returned by callbacks are only known at runtime; they are lowered the
+first time they are seen, with the qubits alive at the callback, and cached by kernel.
+"""
+
+import logging
+
+from .processors import QPU
+from .program import Program
+from .ast import Kernel, QubitId
+from .compilers.scheduling import is_moment
+
+logger = logging.getLogger("qstack")
+
+# Opcodes and their operands:
+#   ALLOCATE  target    -
+#   GATE      prepared  slots
+#   MEASURE   callback  scope    measure, then run the callback with the outcome
+#   CALLBACK  callback  scope    run the callback without an outcome
+# A callback that returns a kernel jumps to its lowered code, lowered within `scope`.
+ALLOCATE = 0
+GATE = 1
+MEASURE = 2
+CALLBACK = 3
+
+# Upper bound on the number of continuation kernels kept lowered.
+MAX_CONTINUATIONS = 4096
+
+type Code = tuple[tuple[int, object, object], ...]
+
+
+class Bytecode:
+    """
+    A program lowered for a QPU.
+
+    Constructor Arguments:
+        program (Program): The program to lower.
+        qpu (QPU): The QPU the gates are prepared for; the code only runs on this QPU.
+    """
+
+    def __init__(self, program: Program, qpu: QPU):
+        self.qpu = qpu
+        self.num_qubits = program.depth
+        self.continuations = {}
+        self.code = self.lower(program.kernels, ())
+
+    def lower(self, kernels: tuple[Kernel], scope: tuple[QubitId, ...]) -> Code:
+        """Lower `kernels`, starting with the qubits in `scope` allocated, bottom of the stack first."""
+        code = []
+        stack = list(scope)
+        for kernel in kernels:
+            self._lower_kernel(kernel, stack, code)
+        return tuple(code)
+
+    def continuation(self, kernel: Kernel, scope: tuple[QubitId, ...]) -> Code:
+        """The code of a continuation kernel returned by a callback."""
+        try:
+            key = (kernel, scope)
+            code = self.continuations.get(key)
+        except TypeError:
+            # Parameters with unhashable values.
+            return self.lower((kernel,), scope)
+
+        if code is None:
+            code = self.lower((kernel,), scope)
+            if len(self.continuations) < MAX_CONTINUATIONS:
+                self.continuations[key] = code
+        return code
+
+    def _lower_kernel(self, kernel: Kernel, stack: list[QubitId], code: list):
+        if not kernel:
+            return
+
+        if kernel.target:
+            target = QubitId.wrap(kernel.target)
+            assert target not in stack, f"Qubit {target} is already allocated"
+            code.append((ALLOCATE, target, None))
+            stack.append(target)
+
+        if is_moment(kernel):
+            # Gates on disjoint qubits: the QPU may apply them as fewer operations.
+            gates = [self._prepare(instruction, stack) for instruction in kernel.instructions]
+            code.extend((GATE, prepared, slots) for prepared, slots in self.qpu.combine(gates))
+            return
+
+        for instruction in kernel.instructions:
+            if isinstance(instruction, Kernel):
+                self._lower_kernel(instruction, stack, code)
+            else:
+                code.append((GATE, *self._prepare(instruction, stack)))
+
+        if kernel.target:
+            stack.pop()
+            code.append((MEASURE, kernel.callback, tuple(stack)))
+        elif kernel.callback:
+            code.append((CALLBACK, kernel.callback, tuple(stack)))
+
+    def _prepare(self, instruction, stack: list[QubitId]) -> tuple[object, tuple[int, ...]]:
+        for t in instruction.targets:
+            assert t in stack, f"Qubit {t} is not allocated: {instruction}"
+        return self.qpu.prepare(instruction), tuple(stack.index(t) for t in instruction.targets)
@@ -0,0 +1,94 @@
+"""
+This module defines `LRUCache`, the bounded cache used for operations built at runtime,
+and `normalize_parameters`, which turns instruction parameters into cache keys, and
+`parse_parameters`, which turns them into the values gates are built from.
+"""
+
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from .ast import ParameterValue
+
+# Parameters are rounded to this many decimals, so "1.5707963" and math.pi / 2 are the same angle.
+PARAMETER_DECIMALS = 7
+
+
+class LRUCache:
+    """
+    A mapping bounded to `maxsize` entries that evicts the least recently used one first.
+
+    Constructor Arguments:
+        maxsize (int):
+            Maximum number of entries kept.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, create: Callable[[], object]):
+        """Return the entry for `key`, calling `create` to build it on a miss."""
+        entries = self.entries
+        if key in entries:
+            self.hits += 1
+            entries.move_to_end(key)
+            return entries[key]
+
+        self.misses += 1
+        value = create()
+        entries[key] = value
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return (
+            f"{len(self)}/{self.maxsize} entries, {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+        )
+
+
+def parse_value(value: ParameterValue) -> ParameterValue:
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return complex(value)
+            except ValueError:
+                return value
+    return value
+
+
+def normalize_value(value: ParameterValue) -> ParameterValue:
+    value = parse_value(value)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return round(float(value), PARAMETER_DECIMALS)
+    if isinstance(value, complex):
+        if value.imag == 0:
+            return normalize_value(value.real)
+        return complex(round(value.real, PARAMETER_DECIMALS), round(value.imag, PARAMETER_DECIMALS))
+    return value
+
+
+def normalize_parameters(parameters: dict[str, ParameterValue] | None) -> tuple[tuple[str, ParameterValue], ...]:
+    """Parameters as a sorted tuple of (name, value) pairs, with numbers (or numeric strings) rounded."""
+    if not parameters:
+        return ()
+    return tuple(sorted((name, normalize_value(value)) for name, value in parameters.items()))
+
+
+def parse_parameters(parameters: dict[str, ParameterValue] | None) -> dict[str, ParameterValue]:
+    """Parameters with numeric strings turned into numbers, not rounded."""
+    return {name: parse_value(value) for name, value in (parameters or {}).items()}
@@ -1,15 +1,33 @@
-from dataclasses import dataclass, replace
+import itertools
+from dataclasses import dataclass, field, replace
 from typing import Any, Callable
 
 from .processors import CPU, Outcome
-from .ast import ClassicInstruction, Kernel, ParameterValue
+from .ast import ClassicInstruction, Kernel, ParameterValue, QubitId
+from .cache import LRUCache, normalize_parameters
+
+# Upper bound on the results kept by each pure callback.
+MAX_CALLBACK_RESULTS = 1024
 
 
 @dataclass(frozen=True)
 class ClassicDefinition:
+    """
+    A classical callback. A callback is pure when `consumes` is set: it consumes exactly that many
+    outcomes, has no other effect on the context, and its result only depends on its parameters
+    and those outcomes. Results of pure callbacks are cached, so each distinct (parameters,
+    outcomes) pair runs the callback once and later shots only look the result up.
+    """
+
     name: str
     parameters: tuple[str]
     callback: Callable[[tuple[Outcome]], Kernel]
+    consumes: int | None = None
+    results: LRUCache | None = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self):
+        if self.consumes is not None and self.results is None:
+            object.__setattr__(self, "results", LRUCache(MAX_CALLBACK_RESULTS))
 
     def __call__(
         self,
@@ -20,7 +38,7 @@ class ClassicDefinition:
         return ClassicInstruction(name=self.name, parameters=parameters)
 
     @staticmethod
-    def from_callback(callback: Callable[[Any], Kernel]):
+    def from_callback(callback: Callable[[Any], Kernel], consumes: int | None = None):
         import inspect
 
         signature = inspect.signature(callback)
@@ -28,12 +46,83 @@ class ClassicDefinition:
             [p.name for p in signature.parameters.values() if p.kind == inspect.Parameter.KEYWORD_ONLY]
         )
 
-        return ClassicDefinition(name=callback.__name__, callback=callback, parameters=parameters_names)
+        return ClassicDefinition(
+            name=callback.__name__, callback=callback, parameters=parameters_names, consumes=consumes
+        )
+
+    def call(self, context: "ClassicContext", parameters: dict[str, ParameterValue]) -> Kernel | None:
+        if self.consumes is None:
+            return self.callback(context, **parameters)
+
+        outcomes = tuple(context.consume() for _ in range(self.consumes))
+        try:
+            key = (normalize_parameters(parameters), outcomes)
+            hash(key)
+        except TypeError:
+            return self.callback(ClassicContext.replay(outcomes), **parameters)
+        return self.results.get(key, lambda: self.callback(ClassicContext.replay(outcomes), **parameters))
+
+    def precompute(self, **parameters: ParameterValue):
+        """Fill the results of a pure callback for every combination of outcomes, ahead of the shots."""
+        assert self.consumes is not None, f"Callback {self.name} is not pure."
+        for outcomes in itertools.product((0, 1), repeat=self.consumes):
+            self.call(ClassicContext.replay(outcomes), parameters)
+
+
+def bit_table(width: int, function: Callable[[tuple[Outcome, ...]], Any]) -> tuple:
+    """The values of `function` on every tuple of `width` outcomes, indexed by the outcomes packed as
+    by `ClassicContext.consume_bits`. Decoders look their result up instead of computing it per shot."""
+    return tuple(function(tuple((index >> i) & 1 for i in range(width))) for index in range(1 << width))
+
+
+class PauliFrame:
+    """
+    Pauli corrections tracked classically instead of applied on the QPU: the qubits with a
+    pending X and with a pending Z. Clifford gates applied after a correction must update the
+    frame, and outcomes measured on a qubit with a pending X are flipped.
+    """
+
+    def __init__(self):
+        self.x = set()
+        self.z = set()
+
+    def flip_x(self, qubit: QubitId):
+        self.x ^= {qubit}
+
+    def flip_z(self, qubit: QubitId):
+        self.z ^= {qubit}
+
+    def h(self, qubit: QubitId):
+        in_x, in_z = qubit in self.x, qubit in self.z
+        if in_x != in_z:
+            self.flip_x(qubit)
+            self.flip_z(qubit)
+
+    def cx(self, control: QubitId, target: QubitId):
+        if control in self.x:
+            self.flip_x(target)
+        if target in self.z:
+            self.flip_z(control)
+
+    def clear(self, qubits):
+        self.x.difference_update(qubits)
+        self.z.difference_update(qubits)
+
+    def __bool__(self):
+        return bool(self.x or self.z)
 
 
 class ClassicContext:
     def __init__(self):
         self.measurements = []
+        self.frame = PauliFrame()
+
+    @staticmethod
+    def replay(outcomes: tuple[Outcome, ...]) -> "ClassicContext":
+        """A context whose `consume` returns `outcomes` in order."""
+        context = ClassicContext()
+        context.measurements = list(reversed(outcomes))
+        return context
 
     def collect(self, result: Outcome):
         self.measurements.append(result)
@@ -42,6 +131,13 @@ class ClassicContext:
         if len(self.measurements) > 0:
             return self.measurements.pop()
 
+    def consume_bits(self, count: int) -> int:
+        """Consume `count` outcomes packed into an int, the first one consumed in the lowest bit."""
+        bits = 0
+        for i in range(count):
+            bits |= self.measurements.pop() << i
+        return bits
+
     def __str__(self):
         return str(self.measurements)
 
@@ -73,7 +169,7 @@ class ClassicProcessor(CPU):
         info = self.operations[name]
         parameters = {name: instruction.parameters[name] for name in info.parameters}
 
-        result = info.callback(self.context, **parameters)
+        result = info.call(self.context, parameters)
 
         if isinstance(result, Kernel):
             return result
@@ -5,11 +5,17 @@ from qstack.classic_processor import ClassicDefinition
 
 from .instruction_set import InstructionSet
 from .ast import Kernel, ClassicInstruction
+from .cache import LRUCache
 
 logger = logging.getLogger("qstack")
 
+# Upper bound on the compiled kernels each compiler keeps.
+MAX_COMPILED_KERNELS = 4096
+
 
 class Compiler:
+    # Parameters the compiler adds to the callbacks it compiles, for `compile_continuation`.
+    site_parameters: tuple[str, ...] = ()
 
     def __init__(
         self,
@@ -24,6 +30,7 @@ class Compiler:
         self.source = source
         self.target = target
         self.compiler_callbacks = compiler_callbacks or set()
+        self.compiled = LRUCache(MAX_COMPILED_KERNELS)
 
         for instr in source.quantum_definitions:
             if instr.name not in self.handlers:
@@ -42,6 +49,28 @@ class Compiler:
         return replace(callback, name=f"_{self.name}_:{callback.name}")
 
     def compile_kernel(self, kernel: Kernel):
+        """Compile `kernel`, memoized: kernels are immutable, so equal kernels compile to the same result
+        and repeated sub-kernels (and continuations returned by callbacks) are only translated once."""
+        try:
+            hash(kernel)
+        except TypeError:
+            # Parameters with unhashable values.
+            return self.translate_kernel(kernel)
+        return self.compiled.get(kernel, lambda: self.translate_kernel(kernel))
+
+    def compile_continuation(self, kernel: Kernel, parameters: dict):
+        """Compile a continuation returned by a callback, given the parameters of its call site,
+        including the ones compilers added (see `callback_parameters`)."""
+        return self.compile_kernel(kernel)
+
+    def callback_parameters(self, parameters: dict) -> dict:
+        """The parameters a callback is called with: those of its call site, without `site_parameters`."""
+        if not self.site_parameters:
+            return parameters
+        return {name: value for name, value in parameters.items() if name not in self.site_parameters}
+
+    def translate_kernel(self, kernel: Kernel):
+        """Compile `kernel` without memoization; compilers override this to change the translation."""
         instructions = []
         for inst in kernel.instructions:
             if isinstance(inst, Kernel):
@@ -51,27 +80,33 @@ class Compiler:
 
         callback = self.compile_callback(kernel.callback)
 
-        return replace(kernel, instructions=instructions, callback=callback)
+        return replace(kernel, instructions=tuple(instructions), callback=callback)
 
     def wrap_callbacks(self, source_callbacks: set[ClassicDefinition]):
         def new_definition(class_definition: ClassicDefinition):
             def call_and_compile(context, **parameters):
                 self.decode(context)
-                result = class_definition.callback(context, **parameters)
+                result = class_definition.call(context, self.callback_parameters(parameters))
                 if isinstance(result, Kernel):
-                    return self.compile_kernel(result)
+                    return self.compile_continuation(result, parameters)
                 else:
                     return result
 
             return ClassicDefinition(
                 name=f"_{self.name}_:{class_definition.name}",
                 callback=call_and_compile,
-                parameters=class_definition.parameters,
+                parameters=class_definition.parameters + self.site_parameters,
             )
 
         return {new_definition(callback) for callback in source_callbacks}
 
+    def prepare(self, program):
+        """Called by `compile` before the kernels of `program` are compiled, on every run; compilers fill
+        the tables of their callbacks here rather than as a side effect of memoized translations."""
+        pass
+
     def compile(self, program, callbacks: set[ClassicDefinition] | None = None):
+        self.prepare(program)
         new_definitions = self.wrap_callbacks(callbacks or set()) | self.compiler_callbacks
-        new_kernels = [self.compile_kernel(kernel) for kernel in program.kernels]
+        new_kernels = tuple(self.compile_kernel(kernel) for kernel in program.kernels)
         return replace(program, instruction_set=self.target, kernels=new_kernels), new_definitions
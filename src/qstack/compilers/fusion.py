@@ -0,0 +1,217 @@
+"""
+This module defines `FusionCompiler`, an optimization pass that fuses gates before simulation.
+
+Within a run of gates, consecutive single-qubit gates on the same qubit are multiplied into
+one 2x2 matrix, single-qubit gates next to a two-qubit gate are absorbed into its 4x4 matrix,
+and consecutive two-qubit gates on the same pair are merged. Each fused block costs one sweep
+over the state vector instead of one per gate. Fused blocks are emitted as `unitary1` and
+`unitary2` instructions, whose parameter is the matrix itself; blocks of a single gate keep
+the original instruction.
+
+Kernels without a target or callback only group instructions, so gates flow through them.
+Kernels that allocate and measure a qubit, or that run a callback, are barriers: every
+pending block is emitted before them, and they are fused on their own.
+
+Fusion is only exact when gates are noiseless: the noise channels apply their Kraus
+operators after every gate, and dropping the noise of the fused gates would change the
+simulation. When a noise channel is given, the pass leaves the instructions unchanged.
+"""
+
+import logging
+from dataclasses import replace
+
+import numpy as np
+
+from ..compiler import Compiler
+from ..ast import QuantumInstruction, Kernel, QubitId
+from ..cache import normalize_parameters
+from ..instruction_set import InstructionSet, QuantumDefinition, Matrix
+from ..noise import NoiseChannel, NoiselessChannel
+
+logger = logging.getLogger("qstack")
+
+
+def unitary1(matrix: Matrix) -> Matrix:
+    return matrix
+
+
+def unitary2(matrix: Matrix) -> Matrix:
+    return matrix
+
+
+UNITARY1 = QuantumDefinition.with_parameters(name="unitary1", targets=1, factory=unitary1)
+
+UNITARY2 = QuantumDefinition.with_parameters(name="unitary2", targets=2, factory=unitary2)
+
+SWAP = np.array([[1, 0, 0, 0], [0, 0, 1, 0], [0, 1, 0, 0], [0, 0, 0, 1]], dtype=np.complex128)
+
+IDENTITY = np.eye(2, dtype=np.complex128)
+
+
+def as_matrix(matrix: np.ndarray) -> Matrix:
+    return tuple(tuple(complex(x) for x in row) for row in matrix)
+
+
+def is_identity(matrix: np.ndarray) -> bool:
+    """Whether a 2x2 matrix is the identity up to a global phase."""
+    return abs(matrix[0, 1]) < 1e-12 and abs(matrix[1, 0]) < 1e-12 and abs(matrix[0, 0] - matrix[1, 1]) < 1e-12
+
+
+class Block:
+    """A fused block: the instructions it replaces and their product on `qubits`."""
+
+    __slots__ = ("qubits", "matrix", "sources")
+
+    def __init__(self, qubits: tuple[QubitId, ...], matrix: np.ndarray | None, source: QuantumInstruction):
+        self.qubits = qubits
+        # None for gates that are never fused (more than two targets).
+        self.matrix = matrix
+        self.sources = [source]
+
+
+class Segment:
+    """The blocks of a run of gates, in the order they are emitted."""
+
+    def __init__(self, compiler: "FusionCompiler"):
+        self.compiler = compiler
+        self.blocks = []
+        # Index of the last block acting on each qubit.
+        self.last = {}
+        # Single-qubit gates waiting for a block to absorb them, after the last block of their qubit.
+        self.pending = {}
+
+    def add(self, instruction: QuantumInstruction):
+        targets = tuple(instruction.targets)
+
+        if len(targets) == 1:
+            self.add_single(targets[0], self.compiler.matrix_of(instruction), instruction)
+        elif len(targets) == 2:
+            self.add_pair(targets, self.compiler.matrix_of(instruction), instruction)
+        else:
+            for q in targets:
+                self.release(q)
+            self.append(Block(targets, None, instruction))
+
+    def add_single(self, q: QubitId, matrix: np.ndarray, instruction: QuantumInstruction):
+        block = self.blocks[self.last[q]] if q in self.last else None
+        if block is not None and block.matrix is not None and len(block.qubits) == 2:
+            # Nothing touched q since the two-qubit block, so the gate can be absorbed.
+            factor = np.kron(matrix, IDENTITY) if block.qubits[0] == q else np.kron(IDENTITY, matrix)
+            block.matrix = factor @ block.matrix
+            block.sources.append(instruction)
+        elif q in self.pending:
+            pending = self.pending[q]
+            pending.matrix = matrix @ pending.matrix
+            pending.sources.append(instruction)
+        else:
+            self.pending[q] = Block((q,), matrix, instruction)
+
+    def add_pair(self, targets: tuple[QubitId, QubitId], matrix: np.ndarray, instruction: QuantumInstruction):
+        a, b = targets
+        index = self.last.get(a)
+        if index is not None and index == self.last.get(b) and self.blocks[index].matrix is not None:
+            block = self.blocks[index]
+            if len(block.qubits) == 2:
+                if block.qubits != targets:
+                    matrix = SWAP @ matrix @ SWAP
+                block.matrix = matrix @ block.matrix
+                block.sources.append(instruction)
+                return
+
+        block = Block(targets, matrix, instruction)
+        before = [self.pending.pop(q, None) for q in targets]
+        if any(before):
+            block.matrix = matrix @ np.kron(
+                before[0].matrix if before[0] else IDENTITY, before[1].matrix if before[1] else IDENTITY
+            )
+            block.sources = [s for p in before if p for s in p.sources] + block.sources
+        self.append(block)
+
+    def release(self, q: QubitId):
+        """Emit the pending gates of q as their own block."""
+        pending = self.pending.pop(q, None)
+        if pending is not None:
+            self.append(pending)
+
+    def append(self, block: Block):
+        index = len(self.blocks)
+        self.blocks.append(block)
+        for q in block.qubits:
+            self.last[q] = index
+
+    def flush(self, instructions: list):
+        for q in list(self.pending):
+            self.release(q)
+
+        for block in self.blocks:
+            if len(block.qubits) == 1 and is_identity(block.matrix):
+                # The gates cancel out.
+                self.compiler.fused += len(block.sources)
+                continue
+
+            if len(block.sources) == 1:
+                instructions.append(block.sources[0])
+            elif len(block.qubits) == 1:
+                instructions.append(UNITARY1(*block.qubits, matrix=as_matrix(block.matrix)))
+            else:
+                instructions.append(UNITARY2(*block.qubits, matrix=as_matrix(block.matrix)))
+            self.compiler.fused += len(block.sources) - 1
+
+        self.blocks = []
+        self.last = {}
+
+
+class FusionCompiler(Compiler):
+    """
+    Fuses adjacent gates into `unitary1`/`unitary2` blocks.
+
+    Constructor Arguments:
+        instruction_set (InstructionSet):
+            The instruction set of the programs to optimize. The target instruction set extends it
+            with `unitary1` and `unitary2`.
+        noise_channel (NoiseChannel | None):
+            The noise channel the program will run with. Gates are only fused when it is noiseless.
+    """
+
+    def __init__(self, instruction_set: InstructionSet, noise_channel: NoiseChannel | None = None):
+        super().__init__(
+            name="fusion",
+            source=instruction_set,
+            target=instruction_set.extend_with({UNITARY1, UNITARY2}),
+            handlers={d.name: lambda inst: inst for d in instruction_set.quantum_definitions},
+        )
+        self.definitions = {d.name.lower(): d for d in self.target.quantum_definitions}
+        self.enabled = noise_channel is None or isinstance(noise_channel, NoiselessChannel)
+        if not self.enabled:
+            logger.info(f"fusion: disabled, {type(noise_channel).__name__} does not compose across gates")
+        # Number of gates removed by fusion so far; memoized kernels are only counted once.
+        self.fused = 0
+
+    def matrix_of(self, instruction: QuantumInstruction) -> np.ndarray:
+        definition = self.definitions[instruction.name.lower()]
+        if definition.matrix is not None:
+            return np.asarray(definition.matrix, dtype=np.complex128)
+        parameters = dict(normalize_parameters(instruction.parameters))
+        return np.asarray(definition.factory(**parameters), dtype=np.complex128)
+
+    def translate_kernel(self, kernel: Kernel):
+        if not self.enabled:
+            return super().translate_kernel(kernel)
+
+        instructions = []
+        segment = Segment(self)
+        self.fuse(kernel.instructions, segment, instructions)
+        segment.flush(instructions)
+
+        callback = self.compile_callback(kernel.callback)
+        return replace(kernel, instructions=instructions, callback=callback)
+
+    def fuse(self, source: list, segment: Segment, instructions: list):
+        for inst in source:
+            if not isinstance(inst, Kernel):
+                segment.add(inst)
+            elif inst.target is None and inst.callback is None:
+                self.fuse(inst.instructions, segment, instructions)
+            else:
+                segment.flush(instructions)
+                instructions.append(self.compile_kernel(inst))
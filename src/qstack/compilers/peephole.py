@@ -0,0 +1,177 @@
+"""
+This module defines `CliffordOptimizer`, a peephole pass over cliffords-min programs.
+
+Compiled programs often contain gates that cancel out: H·H or X·X from consecutive logical
+gates, back-to-back CX on the same pair, S·S that is a Z. For each new gate, the pass looks
+back through the earlier gates on the same qubits, skipping the ones it commutes with, for a
+gate it can combine with:
+
+  - equal self-inverse gates (X, Y, Z, H, CX, CZ) cancel,
+  - two different Paulis merge into the third (up to a global phase),
+  - S·S merges into Z.
+
+The result of a merge takes the place of the earlier gate. Commutation covers diagonal gates
+(Z, S, CZ) among themselves and on the control of a CX, X on the target of a CX, and CX gates
+that share only their control or only their target.
+
+As in `FusionCompiler`, kernels without a target or callback only group instructions and gates
+flow through them; kernels that allocate and measure a qubit, or that run a callback, are
+barriers that are optimized on their own.
+"""
+
+import heapq
+from dataclasses import replace
+
+from ..compiler import Compiler
+from ..ast import QuantumInstruction, Kernel
+from ..instruction_sets import cliffords_min as cliffords
+
+# Number of earlier gates a new gate is compared with, at most.
+MAX_LOOKBACK = 32
+
+SELF_INVERSE = {"x", "y", "z", "h", "cx", "cz"}
+
+# Products of single-qubit gates, up to a global phase.
+PRODUCTS = {
+    ("x", "y"): cliffords.Z,
+    ("y", "x"): cliffords.Z,
+    ("x", "z"): cliffords.Y,
+    ("z", "x"): cliffords.Y,
+    ("y", "z"): cliffords.X,
+    ("z", "y"): cliffords.X,
+    ("s", "s"): cliffords.Z,
+}
+
+DIAGONAL = {"z", "s", "cz"}
+
+
+def commutes(a: QuantumInstruction, b: QuantumInstruction) -> bool:
+    """Whether two gates on overlapping qubits commute; False when unsure."""
+    if a.name in DIAGONAL and b.name in DIAGONAL:
+        return True
+    if len(a.targets) > len(b.targets):
+        a, b = b, a
+
+    if len(a.targets) == 1:
+        (q,) = a.targets
+        if b.name == "cx":
+            control, target = b.targets
+            return (q == control and a.name in DIAGONAL) or (q == target and a.name == "x")
+        return a.name == b.name
+
+    if a.name == "cx" and b.name == "cx":
+        # CX gates commute unless the control of one is the target of the other.
+        (c1, t1), (c2, t2) = a.targets, b.targets
+        return c1 != t2 and t1 != c2
+    if "cz" in (a.name, b.name) and "cx" in (a.name, b.name):
+        cz, cx = (a, b) if a.name == "cz" else (b, a)
+        return cx.targets[1] not in cz.targets
+    return False
+
+
+def combine(earlier: QuantumInstruction, later: QuantumInstruction) -> QuantumInstruction | None | bool:
+    """The gate equivalent to `earlier` followed by `later`: None when they cancel, False when they
+    cannot be combined."""
+    if earlier.name == later.name and earlier.name in SELF_INVERSE:
+        if earlier.targets == later.targets:
+            return None
+        if earlier.name == "cz" and set(earlier.targets) == set(later.targets):
+            return None
+        return False
+    if len(earlier.targets) == 1 and earlier.targets == later.targets:
+        product = PRODUCTS.get((earlier.name, later.name))
+        if product is not None:
+            return product(*earlier.targets)
+    return False
+
+
+class Window:
+    """The gates of a run between barriers, with the indices of the gates on each qubit."""
+
+    def __init__(self, optimizer: "CliffordOptimizer"):
+        self.optimizer = optimizer
+        self.gates = []
+        self.history = {}
+
+    def add(self, gate: QuantumInstruction):
+        for index in self.candidates(gate):
+            earlier = self.gates[index]
+            result = combine(earlier, gate)
+            if result is not False:
+                self.gates[index] = result
+                self.optimizer.removed += 1 if result is not None else 2
+                return
+            if not commutes(earlier, gate):
+                break
+
+        index = len(self.gates)
+        self.gates.append(gate)
+        for q in gate.targets:
+            self.history.setdefault(q, []).append(index)
+
+    def candidates(self, gate: QuantumInstruction):
+        """Indices of the earlier gates on the qubits of `gate`, latest first."""
+        histories = [reversed(self.history.get(q, ())) for q in gate.targets]
+        previous = None
+        seen = 0
+        for index in heapq.merge(*histories, reverse=True):
+            if index == previous or self.gates[index] is None:
+                continue
+            previous = index
+            seen += 1
+            if seen > MAX_LOOKBACK:
+                return
+            yield index
+
+    def flush(self, instructions: list):
+        instructions.extend(gate for gate in self.gates if gate is not None)
+        self.gates = []
+        self.history = {}
+
+
+class CliffordOptimizer(Compiler):
+    """
+    Cancels, merges and commutes cliffords-min gates within kernels. `removed` counts the gates
+    removed so far, once per occurrence of a kernel even when its optimization is memoized.
+    """
+
+    def __init__(self):
+        super().__init__(
+            name="peephole",
+            source=cliffords.instruction_set,
+            target=cliffords.instruction_set,
+            handlers={d.name: lambda inst: inst for d in cliffords.instruction_set.quantum_definitions},
+        )
+        self.removed = 0
+
+    def compile_kernel(self, kernel: Kernel):
+        # Memoized with the number of gates removed from the kernel, sub-kernels included, so that
+        # repeated kernels are counted each time.
+        before = self.removed
+        try:
+            hash(kernel)
+        except TypeError:
+            # Parameters with unhashable values.
+            return self.translate_kernel(kernel)
+        result, removed = self.compiled.get(kernel, lambda: (self.translate_kernel(kernel), self.removed - before))
+        self.removed = before + removed
+        return result
+
+    def translate_kernel(self, kernel: Kernel):
+        instructions = []
+        window = Window(self)
+        self.optimize(kernel.instructions, window, instructions)
+        window.flush(instructions)
+
+        callback = self.compile_callback(kernel.callback)
+        return replace(kernel, instructions=tuple(instructions), callback=callback)
+
+    def optimize(self, source: tuple, window: Window, instructions: list):
+        for inst in source:
+            if not isinstance(inst, Kernel):
+                window.add(inst)
+            elif inst.target is None and inst.callback is None:
+                self.optimize(inst.instructions, window, instructions)
+            else:
+                window.flush(instructions)
+                instructions.append(self.compile_kernel(inst))
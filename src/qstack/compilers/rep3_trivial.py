@@ -2,7 +2,7 @@ from dataclasses import replace
 from ..compiler import Compiler
 from ..ast import QuantumInstruction, Kernel, QubitId
 from ..instruction_sets import cliffords_min as cliffords
-from ..classic_processor import ClassicContext, ClassicDefinition
+from ..classic_processor import ClassicContext, ClassicDefinition, bit_table
 
 
 def handle_x(inst: QuantumInstruction):
@@ -13,14 +13,16 @@ def handle_h(inst: QuantumInstruction):
     return Kernel(target=None, instructions=[cliffords.H(f"{inst.targets[0]}.{i}") for i in range(3)])
 
 
+def majority(outcome: tuple[int, ...]) -> int:
+    return int(sum(outcome) > 1)
+
+
+# The logical outcome of the 3 physical outcomes, packed by `ClassicContext.consume_bits`.
+LOGICAL_OUTCOMES = bit_table(3, majority)
+
+
 def decode(context: ClassicContext):
-    m0 = context.consume()
-    m1 = context.consume()
-    m2 = context.consume()
-    if m0 + m1 + m2 > 1:
-        context.collect(1)
-    else:
-        context.collect(0)
+    context.collect(LOGICAL_OUTCOMES[context.consume_bits(3)])
 
 
 Decode = ClassicDefinition.from_callback(decode)
@@ -40,15 +42,9 @@ class TrivialRepetitionCompiler(Compiler):
         )
 
     def decode(self, context):
-        m0 = context.consume()
-        m1 = context.consume()
-        m2 = context.consume()
-        if m0 + m1 + m2 > 1:
-            context.collect(1)
-        else:
-            context.collect(0)
+        decode(context)
 
-    def compile_kernel(self, kernel: Kernel):
+    def translate_kernel(self, kernel: Kernel):
         # Build list of compiled instructions
         instructions = []
         for inst in kernel.instructions:
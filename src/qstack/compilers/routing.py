@@ -0,0 +1,229 @@
+"""
+This module defines `RoutingCompiler`, which fits a program to a device with restricted
+coupling by inserting SWAPs, so that every two-qubit gate acts on coupled sites.
+
+Qubits are allocated and measured in stack order, so the site of a qubit is its slot in the
+allocation stack: the first qubit allocated sits on site 0, and the site freed by a measurement
+is the one the next allocation takes. The coupling graph is given on these sites, and only the
+sites of live qubits, a prefix of the device, are used to route.
+
+Between barriers, the pass moves qubits across sites. A two-qubit gate on sites that are not
+coupled is preceded by SWAPs along a shortest path until they are; among the SWAPs that bring
+its qubits closer, the pass picks the one that leaves the next `LOOKAHEAD` two-qubit gates of
+the run closest, so the SWAPs of one gate also serve the next ones. Gates are emitted on the
+qubits allocated at the sites they act on. Before each barrier the SWAPs of the run are undone,
+so every qubit is back on its own site when it is measured, when a callback runs, and when a
+nested kernel starts; nested kernels are then routed on their own, memoized by kernel and
+scope. The cost of a gate is bounded by the distance and degree of the device, so routing
+time is linear in the size of the program.
+
+Undoing the SWAPs at each barrier doubles the SWAPs of a run, so the pass does not insert the
+fewest SWAPs: carrying the layout across barriers would save the undo, but every nested kernel
+and continuation would then be routed, and memoized, per layout instead of per scope, and a
+measurement would still need its qubit moved to the top site. The pass trades these SWAPs for
+kernels routed once per scope and a layout every callback can rely on; lookahead only keeps
+the SWAPs of each run, and so their undo, few.
+
+As in `FusionCompiler`, kernels without a target or callback only group instructions and gates
+flow through them; kernels that allocate and measure a qubit, or that run a callback, are
+barriers.
+
+Continuations returned by callbacks run on top of the qubits live at the callback, which
+depend on the call site. The pass adds these qubits to the parameters of each callback it
+routes, under `SCOPE`, as their names separated by spaces so that routed programs still print
+and parse; they are removed before the callback runs, and its continuation is routed on them.
+"""
+
+from collections import deque
+from dataclasses import replace
+from typing import Iterable
+
+from ..compiler import Compiler
+from ..ast import QuantumInstruction, Kernel, QubitId
+from ..instruction_set import InstructionSet
+from .scheduling import flatten
+
+# Number of upcoming two-qubit gates that weigh in the choice of a SWAP.
+LOOKAHEAD = 8
+
+# Callback parameter holding the names of the qubits live at the call site, separated by spaces.
+SCOPE = "_routing_scope"
+
+type Coupling = Iterable[tuple[int, int]]
+
+
+def line(sites: int) -> list[tuple[int, int]]:
+    """Coupling of sites on a line, each coupled to the next."""
+    return [(i, i + 1) for i in range(sites - 1)]
+
+
+def grid(rows: int, columns: int) -> list[tuple[int, int]]:
+    """Coupling of sites on a grid, numbered row by row, each coupled to its 4 neighbours."""
+    edges = []
+    for r in range(rows):
+        for c in range(columns):
+            site = r * columns + c
+            if c + 1 < columns:
+                edges.append((site, site + 1))
+            if r + 1 < rows:
+                edges.append((site, site + columns))
+    return edges
+
+
+class RoutingCompiler(Compiler):
+    """
+    Inserts SWAPs so that the two-qubit gates of a program act on coupled sites. `swaps` counts
+    the SWAPs in the programs routed so far, including the ones that undo a run, once per
+    occurrence of a kernel.
+
+    Constructor Arguments:
+        instruction_set (InstructionSet):
+            The instruction set of the programs to route; it needs a `swap` or a `cx` gate.
+        coupling (list[tuple[int, int]]):
+            The pairs of coupled sites of the device, sites being numbered from 0 in allocation order.
+    """
+
+    site_parameters = (SCOPE,)
+
+    def __init__(self, instruction_set: InstructionSet, coupling: Coupling):
+        super().__init__(
+            name="routing",
+            source=instruction_set,
+            target=instruction_set,
+            handlers={d.name: lambda inst: inst for d in instruction_set.quantum_definitions},
+        )
+        definitions = {d.name: d for d in instruction_set.quantum_definitions}
+        if "swap" in definitions:
+            self.swap_gates = lambda a, b: (definitions["swap"](a, b),)
+        elif "cx" in definitions:
+            cx = definitions["cx"]
+            self.swap_gates = lambda a, b: (cx(a, b), cx(b, a), cx(a, b))
+        else:
+            raise ValueError(f"Instruction set {instruction_set} has no swap or cx gate to route with.")
+
+        self.adjacency = {}
+        for a, b in coupling:
+            self.adjacency.setdefault(a, set()).add(b)
+            self.adjacency.setdefault(b, set()).add(a)
+        self.sites = max(self.adjacency, default=-1) + 1
+        self.swaps = 0
+
+        # Distances between the first k sites, through those sites only, by k.
+        self.distances = {}
+
+    def compile_kernel(self, kernel: Kernel):
+        return self.place(kernel, ())
+
+    def translate_kernel(self, kernel: Kernel):
+        return self.translate(kernel, ())
+
+    def compile_continuation(self, kernel: Kernel, parameters: dict):
+        return self.place(kernel, tuple(QubitId(name) for name in parameters[SCOPE].split()))
+
+    def place(self, kernel: Kernel, scope: tuple[QubitId, ...]) -> Kernel:
+        """Route `kernel` starting with the qubits in `scope` on the first sites, memoized with the
+        number of SWAPs inserted in it, so that repeated kernels are counted each time."""
+        key = (kernel, scope)
+        try:
+            hash(key)
+        except TypeError:
+            # Parameters with unhashable values.
+            return self.translate(kernel, scope)
+        before = self.swaps
+        result, swaps = self.compiled.get(key, lambda: (self.translate(kernel, scope), self.swaps - before))
+        self.swaps = before + swaps
+        return result
+
+    def translate(self, kernel: Kernel, scope: tuple[QubitId, ...]) -> Kernel:
+        if kernel.target:
+            if len(scope) == self.sites:
+                raise ValueError(f"Allocating {kernel.target} needs more than the {self.sites} sites of the device.")
+            scope = scope + (kernel.target,)
+
+        instructions = []
+        run = []
+        for inst in flatten(kernel.instructions):
+            if isinstance(inst, Kernel):
+                self.route(run, scope, instructions)
+                run = []
+                instructions.append(self.place(inst, scope))
+            else:
+                run.append(inst)
+        self.route(run, scope, instructions)
+
+        callback = self.compile_callback(kernel.callback)
+        if callback:
+            # The callback runs once the target is measured.
+            site = scope[:-1] if kernel.target else scope
+            callback = replace(
+                callback, parameters={**(callback.parameters or {}), SCOPE: " ".join(str(q) for q in site)}
+            )
+        return replace(kernel, instructions=tuple(instructions), callback=callback)
+
+    def route(self, run: list[QuantumInstruction], scope: tuple[QubitId, ...], instructions: list):
+        """Append the gates of `run` to `instructions`, with the SWAPs they need and the ones that
+        bring every qubit back to its site, as many again; see the module docstring."""
+        pairs = [gate for gate in run if len(gate.targets) == 2]
+        if not pairs:
+            instructions.extend(run)
+            return
+
+        distance = self.distance(len(scope))
+        # The site of each qubit, and the qubit on each site.
+        site = {q: i for i, q in enumerate(scope)}
+        on = list(scope)
+        swaps = []
+
+        upcoming = 0
+        for gate in run:
+            if len(gate.targets) == 2:
+                upcoming += 1
+                a, b = gate.targets
+                lookahead = pairs[upcoming : upcoming + LOOKAHEAD]
+                if distance[site[a]][site[b]] == float("inf"):
+                    raise ValueError(f"No path between the sites of {a} and {b} among the first {len(scope)} sites.")
+                while distance[site[a]][site[b]] > 1:
+                    u, v = self.best_swap(site[a], site[b], site, distance, lookahead)
+                    swaps.append((u, v))
+                    instructions.extend(self.swap_gates(scope[u], scope[v]))
+                    on[u], on[v] = on[v], on[u]
+                    site[on[u]], site[on[v]] = u, v
+            instructions.append(replace(gate, targets=tuple(scope[site[q]] for q in gate.targets)))
+
+        for u, v in reversed(swaps):
+            instructions.extend(self.swap_gates(scope[u], scope[v]))
+        self.swaps += 2 * len(swaps)
+
+    def best_swap(self, a: int, b: int, site: dict, distance: list, lookahead: list[QuantumInstruction]):
+        """The SWAP, next to site `a` or `b`, that brings them closer and the lookahead gates closest."""
+        best, best_cost = None, None
+        for u, other in ((a, b), (b, a)):
+            for v in self.adjacency[u]:
+                if v >= len(distance) or distance[v][other] >= distance[u][other]:
+                    continue
+                moved = {u: v, v: u}
+                cost = 0
+                for gate in lookahead:
+                    x, y = (site[q] for q in gate.targets)
+                    cost += distance[moved.get(x, x)][moved.get(y, y)]
+                if best_cost is None or cost < best_cost:
+                    best, best_cost = (u, v), cost
+        return best
+
+    def distance(self, k: int) -> list[list[float]]:
+        """Distances between the first `k` sites, through those sites only."""
+        if k not in self.distances:
+            table = []
+            for source in range(k):
+                row = [float("inf")] * k
+                row[source] = 0
+                queue = deque([source])
+                while queue:
+                    u = queue.popleft()
+                    for v in self.adjacency.get(u, ()):
+                        if v < k and row[v] == float("inf"):
+                            row[v] = row[u] + 1
+                            queue.append(v)
+                table.append(row)
+            self.distances[k] = table
+        return self.distances[k]
@@ -0,0 +1,121 @@
+"""
+This module defines `SchedulingCompiler`, which groups the gates of each kernel into moments:
+layers of gates on disjoint qubits that can run at the same time.
+
+Gates are scheduled as soon as possible (ASAP): each gate goes in the layer right after the
+last gate on any of its qubits. With `alap`, the same is done from the end of the run, so gates
+are scheduled as late as possible. Both give the same depth.
+
+Each moment of two or more gates is emitted as a kernel without target or callback, which
+runs exactly like its gates in sequence; QPUs that can apply a moment as fewer operations do
+so when it is lowered to bytecode (see `QPU.combine`).
+
+As in `FusionCompiler`, kernels without a target or callback only group instructions and gates
+flow through them; kernels that allocate and measure a qubit, or that run a callback, are
+barriers that are scheduled on their own.
+"""
+
+from dataclasses import replace
+
+from ..compiler import Compiler
+from ..ast import QuantumInstruction, Kernel
+from ..instruction_set import InstructionSet
+
+type Moment = tuple[QuantumInstruction, ...]
+
+
+def moments(instructions: list[QuantumInstruction], alap: bool = False) -> list[Moment]:
+    """Group a run of gates into layers of gates on disjoint qubits, preserving the order of the
+    gates on each qubit."""
+    gates = list(reversed(instructions)) if alap else instructions
+    layers = []
+    # The first layer each qubit is free in.
+    free = {}
+    for gate in gates:
+        layer = max((free.get(q, 0) for q in gate.targets), default=0)
+        if layer == len(layers):
+            layers.append([])
+        layers[layer].append(gate)
+        for q in gate.targets:
+            free[q] = layer + 1
+
+    if alap:
+        return [tuple(reversed(layer)) for layer in reversed(layers)]
+    return [tuple(layer) for layer in layers]
+
+
+def is_moment(kernel: Kernel) -> bool:
+    """Whether the kernel only holds two or more gates on disjoint qubits."""
+    if kernel.target or kernel.callback or len(kernel.instructions) < 2:
+        return False
+    qubits = set()
+    for inst in kernel.instructions:
+        if isinstance(inst, Kernel) or qubits.intersection(inst.targets):
+            return False
+        qubits.update(inst.targets)
+    return True
+
+
+def circuit_depth(kernel: Kernel) -> int:
+    """Number of moments of the kernel. Barrier kernels are counted in sequence with the rest."""
+    depth = 0
+    run = []
+    for inst in flatten(kernel.instructions):
+        if isinstance(inst, Kernel):
+            depth += len(moments(run)) + circuit_depth(inst)
+            run = []
+        else:
+            run.append(inst)
+    return depth + len(moments(run))
+
+
+def flatten(instructions: tuple):
+    """The instructions, with the contents of grouping kernels inlined."""
+    for inst in instructions:
+        if isinstance(inst, Kernel) and inst.target is None and inst.callback is None:
+            yield from flatten(inst.instructions)
+        else:
+            yield inst
+
+
+class SchedulingCompiler(Compiler):
+    """
+    Groups the gates of each kernel into moments.
+
+    Constructor Arguments:
+        instruction_set (InstructionSet):
+            The instruction set of the programs to schedule; the pass does not change it.
+        alap (bool):
+            Schedule gates as late as possible instead of as soon as possible.
+    """
+
+    def __init__(self, instruction_set: InstructionSet, alap: bool = False):
+        super().__init__(
+            name="scheduling",
+            source=instruction_set,
+            target=instruction_set,
+            handlers={d.name: lambda inst: inst for d in instruction_set.quantum_definitions},
+        )
+        self.alap = alap
+
+    def translate_kernel(self, kernel: Kernel):
+        instructions = []
+        run = []
+        for inst in flatten(kernel.instructions):
+            if isinstance(inst, Kernel):
+                self.emit(run, instructions)
+                run = []
+                instructions.append(self.compile_kernel(inst))
+            else:
+                run.append(inst)
+        self.emit(run, instructions)
+
+        callback = self.compile_callback(kernel.callback)
+        return replace(kernel, instructions=tuple(instructions), callback=callback)
+
+    def emit(self, run: list[QuantumInstruction], instructions: list):
+        for moment in moments(run, self.alap):
+            if len(moment) == 1:
+                instructions.append(moment[0])
+            else:
+                instructions.append(Kernel(target=None, instructions=moment))
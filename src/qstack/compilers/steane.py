@@ -1,11 +1,11 @@
 import logging
-import numpy as np
 from dataclasses import replace
+from functools import lru_cache
 
 from ..compiler import Compiler
 from ..ast import QuantumInstruction, Kernel, QubitId
 from ..instruction_sets import cliffords_min as cliffords
-from ..classic_processor import ClassicContext, ClassicDefinition
+from ..classic_processor import ClassicContext, ClassicDefinition, bit_table
 
 logger = logging.getLogger("qstack")
 
@@ -14,22 +14,30 @@ logger = logging.getLogger("qstack")
 #    [1, 0, 1, 1, 0, 1, 0],
 #    [0, 1, 1, 1, 0, 0, 1],
 
+# The kernels below only depend on their (hashable) arguments and are immutable, so each one is
+# built once per logical qubit and shared by every gate that needs it.
+STEANE_CACHE_SIZE = 4096
 
+
+@lru_cache(maxsize=STEANE_CACHE_SIZE)
 def handle_x(inst: QuantumInstruction):
     target = tuple([QubitId(f"{inst.targets[0]}.{i}") for i in range(7)])
     return Kernel(target=None, instructions=[cliffords.X(q) for q in target])
 
 
+@lru_cache(maxsize=STEANE_CACHE_SIZE)
 def handle_z(inst: QuantumInstruction):
     target = tuple([QubitId(f"{inst.targets[0]}.{i}") for i in range(7)])
     return Kernel(target=None, instructions=[cliffords.Z(q) for q in target])
 
 
+@lru_cache(maxsize=STEANE_CACHE_SIZE)
 def handle_h(inst: QuantumInstruction):
     target = tuple([QubitId(f"{inst.targets[0]}.{i}") for i in range(7)])
     return Kernel(target=None, instructions=[cliffords.H(q) for q in target])
 
 
+@lru_cache(maxsize=STEANE_CACHE_SIZE)
 def handle_cx(inst: QuantumInstruction):
     ctrl = tuple([QubitId(f"{inst.targets[0]}.{i}") for i in range(7)])
     target = tuple([QubitId(f"{inst.targets[1]}.{i}") for i in range(7)])
@@ -37,6 +45,7 @@ def handle_cx(inst: QuantumInstruction):
     return Kernel(target=None, instructions=[cliffords.CX(c, t) for (c, t) in zip(ctrl, target)])
 
 
+@lru_cache(maxsize=STEANE_CACHE_SIZE)
 def handle_prepare_zero(t: QubitId):
     q = tuple([QubitId(f"{t}.{i}") for i in range(7)])
 
@@ -63,7 +72,8 @@ def handle_prepare_zero(t: QubitId):
     return Kernel(target=None, instructions=instructions)
 
 
-def x_syndrome_extraction(t: QubitId):
+@lru_cache(maxsize=STEANE_CACHE_SIZE)
+def x_syndrome_extraction(t: QubitId, pauli_frame: bool = False):
     target = tuple([QubitId(f"{t}.{i}") for i in range(7)])
     ancilla_ids = [f"{t}.z.{i}" for i in range(3)]
     a = tuple([QubitId(i) for i in ancilla_ids])
@@ -87,10 +97,14 @@ def x_syndrome_extraction(t: QubitId):
         + [cliffords.H(a) for a in a]
     )
 
+    if pauli_frame:
+        return Kernel.allocate(*ancilla_ids, instructions=x_syndrome_extraction, callback=Frame_Correct_X(qubit=t))
+
     return Kernel.allocate(*ancilla_ids, instructions=x_syndrome_extraction, callback=Correct_X(qubit=t))
 
 
-def z_syndrome_extraction(t: QubitId):
+@lru_cache(maxsize=STEANE_CACHE_SIZE)
+def z_syndrome_extraction(t: QubitId, pauli_frame: bool = False):
     target = tuple([QubitId(f"{t}.{i}") for i in range(7)])
     ancilla_ids = [f"{t}.z.{i}" for i in range(3)]
     a = tuple([QubitId(i) for i in ancilla_ids])
@@ -110,6 +124,9 @@ def z_syndrome_extraction(t: QubitId):
         cliffords.CX(target[6], a[2]),
     ]
 
+    if pauli_frame:
+        return Kernel.allocate(*ancilla_ids, instructions=z_syndrome_extraction, callback=Frame_Correct_Z(qubit=t))
+
     return Kernel.allocate(*ancilla_ids, instructions=z_syndrome_extraction, callback=Correct_Z(qubit=t))
 
 
@@ -125,76 +142,220 @@ syndrome_table = {
     (1, 1, 1): 0,
 }
 
+# The data qubits checked by each stabilizer, in the order the syndrome bits are consumed.
+STABILIZERS = ((0, 1, 3, 4), (0, 2, 3, 5), (1, 2, 3, 6))
 
-def correct_x(context: ClassicContext, *, qubit: QubitId):
-    syndrome = (context.consume(), context.consume(), context.consume())
+
+def logical_outcome(outcome: tuple[int, ...]) -> int:
+    """The logical outcome of the 7 data outcomes, in the order they are consumed, once corrected."""
+    syndrome = tuple(sum(outcome[i] for i in checks) & 1 for checks in STABILIZERS)
     fault = syndrome_table.get(syndrome)
+    return (sum(outcome) + (fault is not None)) & 1
+
+
+# Decoders run on every logical measurement of every shot, so they look their result up by the
+# consumed outcomes, packed into an int (see `ClassicContext.consume_bits`), instead of computing it.
+FAULTS = bit_table(3, syndrome_table.get)
+LOGICAL_OUTCOMES = bit_table(7, logical_outcome)
+
+
+@lru_cache(maxsize=STEANE_CACHE_SIZE)
+def correction(gate, qubit: QubitId, fault: int) -> Kernel:
+    return Kernel(target=None, instructions=[gate(QubitId(f"{qubit}.{fault}"))])
+
+
+def correct_x(context: ClassicContext, *, qubit: QubitId):
+    fault = FAULTS[context.consume_bits(3)]
 
     if fault is not None:
-        target = tuple([QubitId(f"{qubit}.{i}") for i in range(7)])
-        return Kernel(target=None, instructions=[cliffords.X(target[fault])])
+        return correction(cliffords.X, qubit, fault)
 
 
 def correct_z(context: ClassicContext, *, qubit: QubitId):
-    syndrome = (context.consume(), context.consume(), context.consume())
-    fault = syndrome_table.get(syndrome)
+    fault = FAULTS[context.consume_bits(3)]
 
     if fault is not None:
-        target = tuple([QubitId(f"{qubit}.{i}") for i in range(7)])
-        return Kernel(target=None, instructions=[cliffords.Z(target[fault])])
+        return correction(cliffords.Z, qubit, fault)
 
 
 def decode(context: ClassicContext):
-    outcome = np.array([context.consume() for _ in range(7)])
-    check1 = int(np.dot(outcome, np.array([1, 1, 0, 1, 1, 0, 0])) % 2)
-    check2 = int(np.dot(outcome, np.array([1, 0, 1, 1, 0, 1, 0])) % 2)
-    check3 = int(np.dot(outcome, np.array([0, 1, 1, 1, 0, 0, 1])) % 2)
-    syndrome = (check1, check2, check3)
-    fault = syndrome_table.get(syndrome)
-    logger.debug(f"outcome: {outcome}, syndrome: {syndrome}, correction: {fault}")
+    outcome = context.consume_bits(7)
+    logical = LOGICAL_OUTCOMES[outcome]
+    logger.debug("outcome: %s, logical: %s", f"{outcome:07b}"[::-1], logical)
+    context.collect(logical)
+
+
+Correct_X = ClassicDefinition.from_callback(correct_x, consumes=3)
+Correct_Z = ClassicDefinition.from_callback(correct_z, consumes=3)
+
+Decode = ClassicDefinition.from_callback(decode)
+
+
+## Pauli frame
+# With `pauli_frame`, logical X and Z and the syndrome corrections are not applied on the QPU:
+# they are recorded in the `PauliFrame` of the context, on the 7 data qubits. Logical H and CX
+# still run transversally, followed by a callback that moves the frame through them.
+#
+# A pending X on a data qubit flips the ancillas of the Z syndrome round that check it, and a
+# pending Z those of the X round, so the corrections XOR the measured syndrome with the syndrome
+# of the frame before looking up the fault. Final data outcomes are flipped by the pending X's.
+# Outcomes are then the same as when every Pauli is applied, while logical Paulis cost no gates
+# and no syndrome rounds.
+
+
+@lru_cache(maxsize=STEANE_CACHE_SIZE)
+def data_qubits(qubit: QubitId) -> tuple[QubitId, ...]:
+    return tuple(QubitId(f"{qubit}.{i}") for i in range(7))
+
+
+def frame_x(context: ClassicContext, *, qubit: QubitId):
+    for q in data_qubits(qubit):
+        context.frame.flip_x(q)
+
+
+def frame_z(context: ClassicContext, *, qubit: QubitId):
+    for q in data_qubits(qubit):
+        context.frame.flip_z(q)
+
+
+def frame_h(context: ClassicContext, *, qubit: QubitId):
+    if context.frame:
+        for q in data_qubits(qubit):
+            context.frame.h(q)
+
+
+def frame_cx(context: ClassicContext, *, control: QubitId, target: QubitId):
+    if context.frame:
+        for c, t in zip(data_qubits(control), data_qubits(target)):
+            context.frame.cx(c, t)
 
+
+def frame_syndrome(context: ClassicContext, qubit: QubitId, pending: set) -> int:
+    """The measured syndrome of `qubit`, packed, without the contribution of the `pending` Paulis."""
+    syndrome = context.consume_bits(3)
+    if not pending:
+        return syndrome
+    data = data_qubits(qubit)
+    for bit, checks in enumerate(STABILIZERS):
+        syndrome ^= (sum(data[i] in pending for i in checks) & 1) << bit
+    return syndrome
+
+
+def frame_correct_x(context: ClassicContext, *, qubit: QubitId):
+    fault = FAULTS[frame_syndrome(context, qubit, context.frame.z)]
+    if fault is not None:
+        context.frame.flip_x(data_qubits(qubit)[fault])
+
+
+def frame_correct_z(context: ClassicContext, *, qubit: QubitId):
+    fault = FAULTS[frame_syndrome(context, qubit, context.frame.x)]
     if fault is not None:
-        outcome[fault] = (outcome[fault] + 1) % 2
+        context.frame.flip_z(data_qubits(qubit)[fault])
 
-    context.collect(int(np.sum(outcome) % 2))
 
+def apply_frame(context: ClassicContext, *, qubit: QubitId):
+    """Flip the outcomes of the 7 data qubits just measured by their pending X, and drop their frame."""
+    data = data_qubits(qubit)
+    frame = context.frame
+    if frame.x:
+        measurements = context.measurements
+        for i, q in enumerate(data):
+            if q in frame.x:
+                # The last measured qubit, data[0], is on top of the stack.
+                measurements[-1 - i] ^= 1
+    frame.clear(data)
 
-Correct_X = ClassicDefinition.from_callback(correct_x)
-Correct_Z = ClassicDefinition.from_callback(correct_z)
 
-Decode = ClassicDefinition.from_callback(decode)
+Frame_X = ClassicDefinition.from_callback(frame_x)
+Frame_Z = ClassicDefinition.from_callback(frame_z)
+Frame_H = ClassicDefinition.from_callback(frame_h)
+Frame_CX = ClassicDefinition.from_callback(frame_cx)
+Frame_Correct_X = ClassicDefinition.from_callback(frame_correct_x)
+Frame_Correct_Z = ClassicDefinition.from_callback(frame_correct_z)
+Apply_Frame = ClassicDefinition.from_callback(apply_frame)
+
+
+def frame_handle_x(inst: QuantumInstruction):
+    return Kernel(target=None, instructions=(), callback=Frame_X(qubit=inst.targets[0]))
+
+
+def frame_handle_z(inst: QuantumInstruction):
+    return Kernel(target=None, instructions=(), callback=Frame_Z(qubit=inst.targets[0]))
+
+
+def frame_handle_h(inst: QuantumInstruction):
+    return replace(handle_h(inst), callback=Frame_H(qubit=inst.targets[0]))
+
+
+def frame_handle_cx(inst: QuantumInstruction):
+    return replace(handle_cx(inst), callback=Frame_CX(control=inst.targets[0], target=inst.targets[1]))
+
+
+def logical_qubits(kernels) -> set[QubitId]:
+    """The qubits allocated by `kernels` and their sub-kernels."""
+    qubits = set()
+    pending = list(kernels)
+    while pending:
+        kernel = pending.pop()
+        if kernel.target:
+            qubits.add(kernel.target)
+        pending.extend(inst for inst in kernel.instructions if isinstance(inst, Kernel))
+    return qubits
 
 
 class SteaneCompiler(Compiler):
-    def __init__(self):
-        super().__init__(
-            name="steane",
-            source=cliffords.instruction_set,
-            target=cliffords.instruction_set,
-            handlers={
+    """
+    Encodes each logical qubit of a cliffords-min program in 7 physical qubits.
+
+    Constructor Arguments:
+        pauli_frame (bool):
+            Track logical Paulis and syndrome corrections in a classical Pauli frame instead of
+            applying them; see above.
+    """
+
+    def __init__(self, pauli_frame: bool = False):
+        if pauli_frame:
+            handlers = {
+                cliffords.X.name: frame_handle_x,
+                cliffords.Z.name: frame_handle_z,
+                cliffords.H.name: frame_handle_h,
+                cliffords.CX.name: frame_handle_cx,
+            }
+            callbacks = {Frame_X, Frame_Z, Frame_H, Frame_CX, Frame_Correct_X, Frame_Correct_Z, Apply_Frame, Decode}
+        else:
+            handlers = {
                 cliffords.X.name: handle_x,
                 cliffords.Z.name: handle_z,
                 cliffords.H.name: handle_h,
                 cliffords.CX.name: handle_cx,
-            },
-            compiler_callbacks={Correct_X, Correct_Z, Decode},
+            }
+            callbacks = {Correct_X, Correct_Z, Decode}
+
+        super().__init__(
+            name="steane",
+            source=cliffords.instruction_set,
+            target=cliffords.instruction_set,
+            handlers=handlers,
+            compiler_callbacks=callbacks,
         )
+        self.pauli_frame = pauli_frame
 
     def decode(self, context):
-        outcome = np.array([context.consume() for _ in range(7)])
-        check1 = int(np.dot(outcome, np.array([1, 1, 0, 1, 1, 0, 0])) % 2)
-        check2 = int(np.dot(outcome, np.array([1, 0, 1, 1, 0, 1, 0])) % 2)
-        check3 = int(np.dot(outcome, np.array([0, 1, 1, 1, 0, 0, 1])) % 2)
-        syndrome = (check1, check2, check3)
-        fault = syndrome_table.get(syndrome)
-        logger.debug(f"outcome: {outcome}, syndrome: {syndrome}, correction: {fault}")
+        decode(context)
 
-        if fault is not None:
-            outcome[fault] = (outcome[fault] + 1) % 2
+    def prepare(self, program):
+        if self.pauli_frame:
+            return
+        # The corrections only depend on the 3 syndrome bits, so their tables are filled for every
+        # logical qubit before the shots; continuations allocating new qubits fill theirs when called.
+        for t in logical_qubits(program.kernels):
+            Correct_X.precompute(qubit=t)
+            Correct_Z.precompute(qubit=t)
 
-        context.collect(int(np.sum(outcome) % 2))
+    def syndrome_rounds(self, t: QubitId) -> list[Kernel]:
+        return [z_syndrome_extraction(t, self.pauli_frame), x_syndrome_extraction(t, self.pauli_frame)]
 
-    def compile_kernel(self, kernel: Kernel):
+    def translate_kernel(self, kernel: Kernel):
         # Build list: prepare_zero + instructions
         instructions = []
         if kernel.target:
@@ -202,12 +363,7 @@ class SteaneCompiler(Compiler):
 
         if len(kernel.instructions) > 0:
             if kernel.target:
-                instructions.extend(
-                    [
-                        z_syndrome_extraction(kernel.target),
-                        x_syndrome_extraction(kernel.target),
-                    ]
-                )
+                instructions.extend(self.syndrome_rounds(kernel.target))
 
             for i, inst in enumerate(kernel.instructions):
                 is_last = i == len(kernel.instructions) - 1
@@ -216,14 +372,10 @@ class SteaneCompiler(Compiler):
                     instructions.append(self.compile_kernel(inst))
                 else:
                     instructions.append(self.handlers[inst.name](inst))
-                    if not is_last:
+                    # Paulis tracked in the frame do not run on the QPU, so they need no syndrome round.
+                    if not is_last and not (self.pauli_frame and inst.name in ("x", "z")):
                         for t in inst.targets:
-                            instructions.extend(
-                                [
-                                    z_syndrome_extraction(t),
-                                    x_syndrome_extraction(t),
-                                ]
-                            )
+                            instructions.extend(self.syndrome_rounds(t))
 
         # Create the result kernel
         if kernel.target:
@@ -233,6 +385,12 @@ class SteaneCompiler(Compiler):
             # If there's an original callback, the wrapped version (via wrap_callbacks)
             # already includes decode. Otherwise, use standalone Decode.
             callback = self.compile_callback(kernel.callback) or Decode()
+            if self.pauli_frame:
+                # The frame is applied to the data outcomes as soon as they are measured, before decoding.
+                measured = Kernel.allocate(
+                    *qubits, instructions=instructions, callback=Apply_Frame(qubit=kernel.target)
+                )
+                return Kernel(target=None, instructions=(measured,), callback=callback)
             return Kernel.allocate(*qubits, instructions=instructions, callback=callback)
         else:
             # No targets, just return kernel with instructions and callback
@@ -1,29 +1,50 @@
 import logging
-import random
 
 from typing import Set
-from qsharp.noisy_simulator import StateVectorSimulator, Operation, Instrument
+
+import numpy as np
 
 from .processors import QPU
 from .ast import QuantumInstruction, QubitId
 from .instruction_set import QuantumDefinition, InstructionSet
-from .noise import NoiseChannel, NoiselessChannel
+from .noise import NoiseChannel, NoiselessChannel, channel_key, compile_channel
+from .statevector import NumpyEmulator
+from .cache import LRUCache, normalize_parameters, parse_parameters
+
+try:
+    from qsharp.noisy_simulator import StateVectorSimulator, Operation, Instrument
+except ImportError:
+    StateVectorSimulator = None
 
 
 logger = logging.getLogger("qstack")
 
+# Operations of parameterized gates, keyed on (definition, normalized parameters, channel key).
+OPERATION_CACHE = LRUCache(maxsize=1024)
+
 
 class StateVectorEmulator(QPU):
-    _builtin_not = Operation(
-        [
-            [[0.0, 1.0], [1.0, 0.0]],  # NOT gate
-        ]
-    )
+    """Emulator backed by the qsharp noisy simulator (install with `pip install qstack[qsharp]`)."""
 
-    def __init__(self, instructions: Set[QuantumDefinition], noise_channel: NoiseChannel):
+    def __init__(self, instructions: Set[QuantumDefinition], noise_channel: NoiseChannel, seed=None):
         super().__init__()
 
+        if StateVectorSimulator is None:
+            raise ImportError("StateVectorEmulator requires the qsharp package.")
+
+        self._builtin_not = Operation(
+            [
+                [[0.0, 1.0], [1.0, 0.0]],  # NOT gate
+            ]
+        )
         self.noise_channel = noise_channel
+        # Each shot seeds the simulator with a fresh 63-bit draw from this generator.
+        self.rng = np.random.default_rng(seed)
+
+        def make_operation(inst, parameters) -> Operation:
+            noiseless_op = inst.factory(**parse_parameters(parameters))
+            kraus_matrices = compile_channel(self.noise_channel, inst)
+            return Operation([K @ noiseless_op for K in kraus_matrices])
 
         # Create operators:
         operations = {}
@@ -32,14 +53,16 @@ class StateVectorEmulator(QPU):
                 assert inst.factory is not None, f"Invalid instruction {inst.name}"
 
                 def operation_maker(captured_inst=inst, **args) -> Operation:
-                    noiseless_op = captured_inst.factory(**args)
-                    kraus_matrices = self.noise_channel.get_kraus_matrices(captured_inst)
-                    return Operation([K @ noiseless_op for K in kraus_matrices])
+                    # The normalized parameters are only the key; the gate is built from the given ones.
+                    return OPERATION_CACHE.get(
+                        (captured_inst, normalize_parameters(args), channel_key(self.noise_channel)),
+                        lambda: make_operation(captured_inst, args),
+                    )
 
                 operations[inst.name.lower()] = operation_maker
             else:
-                logger.debug(f"Found gate {inst.name}: {inst.matrix}")
-                kraus_matrices = self.noise_channel.get_kraus_matrices(inst)
+                logger.debug("Found gate %s: %s", inst.name, inst.matrix)
+                kraus_matrices = compile_channel(self.noise_channel, inst)
                 operations[inst.name.lower()] = Operation([K @ inst.matrix for K in kraus_matrices])
         self.operations = operations
 
@@ -58,9 +81,12 @@ class StateVectorEmulator(QPU):
         ]
         self.instrument = Instrument(projectors)
 
+    def seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
     def restart(self, num_qubits: int):
-        logger.debug(f"restart: {num_qubits}")
-        self.sim = StateVectorSimulator(num_qubits, seed=random.randint(0, 1000))
+        logger.debug("restart: %s", num_qubits)
+        self.sim = StateVectorSimulator(num_qubits, seed=int(self.rng.integers(1 << 63)))
         self.allocations = []
         self.num_qubits = num_qubits
 
@@ -76,18 +102,30 @@ class StateVectorEmulator(QPU):
 
         assert gate_name in self.operations, f"Invalid instruction: {instruction}"
         operation = self.operations.get(gate_name)
-        logger.debug(f"eval: {gate_name} {qubits}")
+        logger.debug("eval: %s %s", gate_name, qubits)
         if callable(operation):
             self.sim.apply_operation(operation(**instruction.parameters), qubits)
         else:
             self.sim.apply_operation(operation, qubits)
             return None
 
+    def prepare(self, instruction: QuantumInstruction):
+        gate_name = instruction.name.lower()
+        assert gate_name in self.operations, f"Invalid instruction: {instruction}"
+        operation = self.operations.get(gate_name)
+        if callable(operation):
+            return operation(**instruction.parameters)
+        return operation
+
+    def execute(self, prepared, slots: tuple[int, ...]):
+        qubits = [self.num_qubits - s - 1 for s in reversed(slots)]
+        self.sim.apply_operation(prepared, qubits)
+
     def measure(self):
         id = len(self.allocations) - 1
         qubits = [self.num_qubits - 1 - id]
         outcome: int = self.sim.sample_instrument(self.instrument, qubits)
-        logger.debug(f"outcome: {outcome}")
+        logger.debug("outcome: %s", outcome)
         if outcome == 1 and len(qubits) == 1:
             self.sim.apply_operation(self._builtin_not, qubits)
         self.allocations.pop()
@@ -95,4 +133,4 @@ class StateVectorEmulator(QPU):
 
 
 def from_instruction_set(layer: InstructionSet, noise_channel: NoiseChannel = NoiselessChannel()):
-    return StateVectorEmulator(layer.quantum_definitions, noise_channel=noise_channel)
+    return NumpyEmulator(layer.quantum_definitions, noise_channel=noise_channel)
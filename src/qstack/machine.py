@@ -1,35 +1,28 @@
-from collections import Counter, OrderedDict
+import multiprocessing
+from functools import partial
 from typing import Callable
 
+import numpy as np
+
 from .instruction_set import InstructionSet
-from .processors import QPU, CPU
+from .processors import QPU, CPU, BatchedQPU, DeferredQPU
 from .program import Program
 from .ast import Kernel, QubitId
 from .noise import NoiseChannel
+from .bytecode import Bytecode, ALLOCATE, GATE, MEASURE
+from .results import Results, sorted_histogram
+from .profiling import Stats, InstrumentedQPU, InstrumentedCPU
 
+# Upper bound on the amplitudes held by a batched QPU at once (64MB of complex128).
+MAX_BATCH_AMPLITUDES = 1 << 22
 
-class Results:
-    def __init__(self, all_data: list[tuple]):
-        self.shots = len(all_data)
-        self.data = all_data
-        self._histogram = None
-
-    def get_histogram(self):
-        if not self._histogram:
-            hist = Counter(self.data)
-            self._histogram = OrderedDict()
-            for key in sorted(hist.keys(), key=lambda x: tuple([str(i) for i in x if i])):
-                self._histogram[key] = hist[key]
-        return self._histogram
-
-    def plot_histogram(self):
-        import matplotlib.pyplot as plt
+# Deferring measurements keeps every allocated qubit alive, so the register grows with the
+# total number of allocations; past this bound shots are simulated one at a time instead.
+MAX_DEFERRED_QUBITS = 20
 
-        histogram = self.get_histogram()
-        plt.bar([str(key) for key in histogram.keys()], histogram.values())
-        plt.xlabel("Outcomes")
-        plt.ylabel("Frequency")
-        plt.show()
+# Seeded runs split the shots in blocks of this size, each with its own random stream, so the
+# results depend on the seed but not on how the blocks are spread over workers.
+SHOTS_PER_BLOCK = 256
 
 
 class QuantumMachine:
@@ -38,22 +31,29 @@ class QuantumMachine:
         self.cpu = cpu
 
     def eval_kernel(self, kernel: Kernel) -> None:
+        # Explicit stack of (kernel, remaining instructions) instead of recursion. A finished kernel
+        # is popped before its continuation is pushed, so feed-forward loops run in constant depth.
+        stack = []
+        self.enter_kernel(stack, kernel)
+        while stack:
+            kernel, instructions = stack[-1]
+            for instruction in instructions:
+                if isinstance(instruction, Kernel):
+                    self.enter_kernel(stack, instruction)
+                    break
+                self.qpu.eval(instruction)
+            else:
+                stack.pop()
+                outcome = self.qpu.measure() if kernel.target else None
+                continuation = self.cpu.eval(kernel.callback, outcome)
+                self.enter_kernel(stack, continuation)
+
+    def enter_kernel(self, stack: list, kernel: Kernel | None) -> None:
         if not kernel:
             return
-
         if kernel.target:
             self.qpu.allocate(QubitId.wrap(kernel.target))
-
-        for instruction in kernel.instructions:
-            if isinstance(instruction, Kernel):
-                self.eval_kernel(instruction)
-            else:
-                self.qpu.eval(instruction)
-
-        outcome = self.qpu.measure() if kernel.target else None
-
-        continuation = self.cpu.eval(kernel.callback, outcome)
-        self.eval_kernel(continuation)
+        stack.append((kernel, iter(kernel.instructions)))
 
     def single_shot(self, program: Program):
         self.cpu.restart()
@@ -64,9 +64,316 @@ class QuantumMachine:
 
         return tuple(self.cpu.context)
 
-    def eval(self, program: Program, *, shots: int | None = 1000) -> Results:
+    def bytecode_shot(self, bytecode: Bytecode):
+        qpu = self.qpu
+        cpu = self.cpu
+        cpu.restart()
+        qpu.restart(num_qubits=bytecode.num_qubits)
+
+        # Frames of (code, pc); a continuation pushes its code and resumes the caller once done.
+        frames = [(bytecode.code, 0)]
+        while frames:
+            code, pc = frames.pop()
+            end = len(code)
+            while pc < end:
+                opcode, a, b = code[pc]
+                pc += 1
+                if opcode == GATE:
+                    qpu.execute(a, b)
+                elif opcode == ALLOCATE:
+                    qpu.allocate(a)
+                else:
+                    outcome = qpu.measure() if opcode == MEASURE else None
+                    continuation = cpu.eval(a, outcome)
+                    if continuation:
+                        # A continuation at the end of the code replaces its frame (tail call).
+                        if pc < end:
+                            frames.append((code, pc))
+                        frames.append((bytecode.continuation(continuation, b), 0))
+                        break
+
+        return tuple(cpu.context)
+
+    def eval(
+        self,
+        program: Program,
+        *,
+        shots: int | None = 1000,
+        batched: bool = False,
+        sample: bool | None = None,
+        bytecode: bool = True,
+        workers: int | None = None,
+        seed: int | None = None,
+        profile: bool = False,
+    ) -> Results:
+        """Run `shots` shots of the program.
+
+        With `batched`, all shots are evolved together on a batched QPU. With `sample`, the program
+        is simulated once with its measurements deferred and all shots are sampled from the final
+        state; by default this is done whenever the program has no callbacks and the QPU supports it.
+        Otherwise shots run one at a time, interpreting the program lowered to `Bytecode` unless
+        `bytecode` is False, in which case the AST is walked directly.
+
+        With `seed` or `workers`, shots run in blocks of SHOTS_PER_BLOCK; each block reseeds the QPU
+        with its own child of `numpy.random.SeedSequence(seed)`. Blocks are spread over a pool of
+        `workers` processes and merged in order, so a seed reproduces the same results for any
+        number of workers.
+
+        With `profile`, the run goes through instrumented processors and the returned results carry
+        a `Stats` with per-gate and per-callback counts and times; see `qstack.profiling`.
+        """
+        if profile:
+            return self.profiled(
+                program, shots=shots, batched=batched, sample=sample, bytecode=bytecode, workers=workers, seed=seed
+            )
+
+        if seed is None and workers is None:
+            return self.run_shots(program, shots, batched, sample, bytecode)
+
+        sizes = [min(SHOTS_PER_BLOCK, shots - start) for start in range(0, shots, SHOTS_PER_BLOCK)]
+        blocks = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+        options = (batched, sample, bytecode)
+        if workers is None or workers <= 1:
+            data = [self.run_block(program, block, options) for block in blocks]
+        else:
+            data = parallel_blocks(self, program, blocks, options, workers)
+        return Results.concatenate(data)
+
+    def profiled(self, program: Program, **options) -> Results:
+        stats = Stats()
+        machine = QuantumMachine(qpu=InstrumentedQPU(self.qpu, stats), cpu=InstrumentedCPU(self.cpu, stats))
+        results = machine.eval(program, **options)
+        # Blocks run by forked workers bring their own counters back with their results.
+        if results.stats is not None:
+            stats.merge(results.stats)
+        stats.shots = results.shots
+        results.stats = stats
+        return results
+
+    def eval_iter(
+        self,
+        program: Program,
+        *,
+        shots: int | None = None,
+        stop: Callable | list[Callable] | None = None,
+        bytecode: bool = True,
+        seed: int | None = None,
+    ) -> "ShotStream":
+        """Run the program one shot at a time, as an iterator over the outcomes.
+
+        The returned `ShotStream` keeps a running histogram instead of every outcome. Iteration ends
+        after `shots` shots (unlimited if None) or once one of the `stop` criteria returns True; see
+        `qstack.stream` for the built-in criteria.
+        """
+        from .stream import ShotStream
+
+        if seed is not None:
+            self.qpu.seed(seed)
+
+        if bytecode:
+            shot = partial(self.bytecode_shot, Bytecode(program, self.qpu))
+        else:
+            shot = partial(self.single_shot, program)
+        return ShotStream(shot, shots=shots, stop=stop)
+
+    def run_block(self, program: Program, block: tuple, options: tuple) -> Results:
+        size, seed = block
+        self.qpu.seed(seed)
+        return self.run_shots(program, size, *options)
+
+    def run_shots(self, program: Program, shots: int, batched: bool, sample: bool | None, bytecode: bool) -> Results:
+        if batched:
+            return Results(self.batched_shots(program, shots))
+
+        if sample is None:
+            sample = not any(has_callbacks(kernel) for kernel in program.kernels)
+            if sample and (allocations(program) > MAX_DEFERRED_QUBITS or not supports_deferred(self.qpu)):
+                sample = False
+        if sample:
+            return self.sampled_shots(program, shots)
+
+        if bytecode:
+            code = Bytecode(program, self.qpu)
+            return Results([self.bytecode_shot(code) for _ in range(shots)])
         return Results([self.single_shot(program) for _ in range(shots)])
 
+    def sampled_shots(self, program: Program, shots: int) -> Results:
+        """Simulate the program once with deferred measurements and sample all shots from it.
+        Callbacks are replayed per shot on the sampled outcomes and must not return continuations."""
+        qpu = self.qpu.deferred()
+        num_qubits = allocations(program)
+        if num_qubits > MAX_DEFERRED_QUBITS:
+            raise ValueError(f"Deferring {num_qubits} measurements exceeds the limit of {MAX_DEFERRED_QUBITS} qubits.")
+
+        qpu.restart(num_qubits=num_qubits)
+        for kernel in program.kernels:
+            self.eval_kernel_deferred(qpu, kernel)
+        bits = qpu.sample(shots)
+
+        callbacks = [kernel_callbacks(kernel) for kernel in program.kernels]
+        if not any(any(c is not None for c, _ in kernel) for kernel in callbacks):
+            return Results.from_bits(bits)
+
+        results = []
+        for row in bits.tolist():
+            self.cpu.restart()
+            outcomes = iter(row)
+            for kernel in callbacks:
+                for callback, measured in kernel:
+                    outcome = next(outcomes) if measured else None
+                    if self.cpu.eval(callback, outcome):
+                        raise ValueError("Sampled programs cannot continue with new kernels from callbacks.")
+            results.append(tuple(self.cpu.context))
+        return Results(results)
+
+    def eval_kernel_deferred(self, qpu: DeferredQPU, kernel: Kernel) -> None:
+        if not kernel:
+            return
+
+        if kernel.target:
+            qpu.allocate(QubitId.wrap(kernel.target))
+
+        for instruction in kernel.instructions:
+            if isinstance(instruction, Kernel):
+                self.eval_kernel_deferred(qpu, instruction)
+            else:
+                qpu.eval(instruction)
+
+        if kernel.target:
+            qpu.defer()
+
+    def batched_shots(self, program: Program, shots: int) -> list[tuple]:
+        """Run all shots together on a batched QPU, one register row per shot.
+        Shots are split in chunks so the batch stays within MAX_BATCH_AMPLITUDES."""
+        qpu = self.qpu.batched()
+        num_qubits = program.depth
+        chunk = max(1, MAX_BATCH_AMPLITUDES >> num_qubits)
+
+        results = []
+        for start in range(0, shots, chunk):
+            size = min(chunk, shots - start)
+            cpus = [self.cpu.fork() for _ in range(size)]
+            qpu.restart(num_qubits=num_qubits, shots=size)
+
+            rows = np.arange(size)
+            for kernel in program.kernels:
+                self.eval_kernel_batch(qpu, cpus, kernel, rows)
+
+            results.extend(tuple(cpu.context) for cpu in cpus)
+        return results
+
+    def eval_kernel_batch(self, qpu: BatchedQPU, cpus: list[CPU], kernel: Kernel, rows: np.ndarray) -> None:
+        # Same explicit stack as `eval_kernel`, with the rows each kernel applies to. Sub-batches are
+        # pushed together, so a kernel only allocates its qubit when it reaches the top of the stack.
+        stack = []
+        push_batch(stack, kernel, rows)
+        while stack:
+            kernel, instructions, rows = stack[-1]
+            if instructions is None:
+                if kernel.target:
+                    qpu.allocate(QubitId.wrap(kernel.target))
+                instructions = iter(kernel.instructions)
+                stack[-1] = (kernel, instructions, rows)
+
+            for instruction in instructions:
+                if isinstance(instruction, Kernel):
+                    push_batch(stack, instruction, rows)
+                    break
+                qpu.eval(instruction, rows)
+            else:
+                stack.pop()
+                outcomes = qpu.measure(rows) if kernel.target else [None] * len(rows)
+
+                # Callbacks run per shot; shots that continue with the same kernel form a sub-batch.
+                groups = []
+                for row, outcome in zip(rows.tolist(), outcomes):
+                    continuation = cpus[row].eval(kernel.callback, outcome)
+                    if not continuation:
+                        continue
+                    for group_kernel, group_rows in groups:
+                        if group_kernel == continuation:
+                            group_rows.append(row)
+                            break
+                    else:
+                        groups.append((continuation, [row]))
+
+                # Pushed in reverse so sub-batches run in the order their groups were formed.
+                for continuation, group_rows in reversed(groups):
+                    push_batch(stack, continuation, np.array(group_rows))
+
+
+def push_batch(stack: list, kernel: Kernel | None, rows: np.ndarray) -> None:
+    if kernel:
+        stack.append((kernel, None, rows))
+
+
+# The machine, program and options of the running `parallel_blocks` call, inherited by forked workers.
+_pool_task = None
+
+
+def _run_pool_block(block: tuple) -> Results:
+    machine, program, options = _pool_task
+    if not isinstance(machine.qpu, InstrumentedQPU):
+        return machine.run_block(program, block, options)
+
+    # Counters updated in a worker are lost with it, so each block returns its own.
+    stats = machine.qpu.stats = machine.cpu.stats = Stats()
+    results = machine.run_block(program, block, options)
+    results.stats = stats
+    return results
+
+
+def parallel_blocks(machine: QuantumMachine, program: Program, blocks: list, options: tuple, workers: int):
+    """Run shot blocks on a pool of forked processes, which inherit the machine and its callbacks
+    (closures that could not be pickled). Results come back in block order."""
+    global _pool_task
+    _pool_task = (machine, program, options)
+    try:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            return pool.map(_run_pool_block, blocks)
+    finally:
+        _pool_task = None
+
+
+def has_callbacks(kernel: Kernel) -> bool:
+    if not kernel:
+        return False
+    return kernel.callback is not None or any(
+        has_callbacks(instruction) for instruction in kernel.instructions if isinstance(instruction, Kernel)
+    )
+
+
+def allocations(program: Program) -> int:
+    """Total number of qubits the program allocates, counting every allocation separately."""
+
+    def count(kernel: Kernel) -> int:
+        if not kernel:
+            return 0
+        nested = sum(count(instruction) for instruction in kernel.instructions if isinstance(instruction, Kernel))
+        return nested + (1 if kernel.target else 0)
+
+    return sum(count(kernel) for kernel in program.kernels)
+
+
+def kernel_callbacks(kernel: Kernel) -> list[tuple]:
+    """The (callback, measured) pairs of a kernel in execution order."""
+    if not kernel:
+        return []
+    result = []
+    for instruction in kernel.instructions:
+        if isinstance(instruction, Kernel):
+            result.extend(kernel_callbacks(instruction))
+    result.append((kernel.callback, bool(kernel.target)))
+    return result
+
+
+def supports_deferred(qpu: QPU) -> bool:
+    try:
+        qpu.deferred()
+    except (NotImplementedError, ValueError):
+        return False
+    return True
+
 
 def create_callbacks(*definitions: list[Callable]):
     from .classic_processor import ClassicDefinition
@@ -78,9 +385,14 @@ def create_callbacks(*definitions: list[Callable]):
 def local_machine_for(instruction_set: InstructionSet, callbacks=None) -> QuantumMachine:
     from .classic_processor import from_callbacks as get_cpu
     from .emulator import from_instruction_set as get_qpu
+    from . import stabilizer
 
     cpu = get_cpu(callbacks)
-    qpu = get_qpu(instruction_set)
+    # Clifford-only programs run on the stabilizer tableau, which scales polynomially with the qubits.
+    if stabilizer.is_clifford(instruction_set):
+        qpu = stabilizer.from_instruction_set(instruction_set)
+    else:
+        qpu = get_qpu(instruction_set)
     return QuantumMachine(qpu=qpu, cpu=cpu)
 
 
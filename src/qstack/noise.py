@@ -2,11 +2,15 @@
 This module defines noise channels for quantum systems,
 including the base class `NoiseChannel` and specific implementations
 such as `NoiselessChannel`, `DepolarizingNoise`, and `PauliNoise`.
+
+`compile_channel` converts the Kraus operators of any channel to a minimal equivalent set,
+through the Choi matrix, and `ComposedNoise` stacks channels into one.
 """
 
 from abc import ABC, abstractmethod
 import numpy as np
 from qstack.instruction_set import QuantumDefinition
+from qstack.cache import LRUCache
 
 
 class NoiseChannel(ABC):
@@ -108,3 +112,81 @@ class PauliNoise(NoiseChannel):
         ]
 
         return kraus_operators
+
+
+class ComposedNoise(NoiseChannel):
+    """
+    Represents noise channels applied one after the other.
+
+    Constructor Arguments:
+        channels (NoiseChannel):
+            The channels to compose, in the order they act on the state.
+    """
+
+    def __init__(self, *channels: NoiseChannel):
+        self.channels = channels
+
+    def get_kraus_matrices(self, quantum_def: QuantumDefinition):
+        kraus_operators = [np.eye(2**quantum_def.targets_length)]
+        for channel in self.channels:
+            kraus_operators = [K @ A for K in channel.get_kraus_matrices(quantum_def) for A in kraus_operators]
+        return minimal_kraus(kraus_operators)
+
+
+def choi_matrix(kraus_operators) -> np.ndarray:
+    """The Choi matrix of a channel, sum_i vec(K_i) vec(K_i)^dagger, with row-major vec."""
+    vectors = np.array([np.asarray(K, dtype=np.complex128).reshape(-1) for K in kraus_operators])
+    return vectors.T @ vectors.conj()
+
+
+def minimal_kraus(kraus_operators, tolerance: float = 1e-12) -> list[np.ndarray]:
+    """
+    Returns an equivalent set of Kraus operators of minimal size: the rank of the Choi matrix.
+    Eigenvectors of the Choi matrix with eigenvalue above `tolerance` (relative to the largest one)
+    become the new operators.
+    """
+    dim = len(kraus_operators[0])
+    eigenvalues, eigenvectors = np.linalg.eigh(choi_matrix(kraus_operators))
+    keep = eigenvalues > tolerance * eigenvalues.max()
+    return [
+        np.sqrt(value) * vector.reshape(dim, dim)
+        for value, vector in zip(eigenvalues[keep][::-1], eigenvectors[:, keep].T[::-1])
+    ]
+
+
+# Compiled Kraus operators, keyed on (channel key, definition).
+KRAUS_CACHE = LRUCache(maxsize=1024)
+
+
+def channel_key(channel: NoiseChannel):
+    """A cache key for `channel`: equal for channels of the same type and attributes, composed channels
+    included, so separately built channels share entries and a changed channel gets new ones."""
+    if isinstance(channel, NoiseChannel):
+        return (type(channel), tuple(sorted((name, channel_key(value)) for name, value in vars(channel).items())))
+    if isinstance(channel, (list, tuple)):
+        return tuple(channel_key(value) for value in channel)
+    return channel
+
+
+def compile_channel(channel: NoiseChannel, quantum_def: QuantumDefinition) -> list[np.ndarray]:
+    """
+    Returns the Kraus operators of `channel` for `quantum_def`, compressed to the minimal number
+    of operators. The original operators are kept when they are already minimal, since they are
+    often proportional to unitaries, which emulators sample without computing state norms.
+    Results are cached, so emulators share them across machines and shots.
+    """
+
+    def build():
+        kraus_operators = [np.asarray(K) for K in channel.get_kraus_matrices(quantum_def)]
+        if len(kraus_operators) == 1:
+            return kraus_operators
+        minimal = minimal_kraus(kraus_operators)
+        return minimal if len(minimal) < len(kraus_operators) else kraus_operators
+
+    key = (channel_key(channel), quantum_def)
+    try:
+        hash(key)
+    except TypeError:
+        # Channels with unhashable attributes, like arrays.
+        return build()
+    return KRAUS_CACHE.get(key, build)
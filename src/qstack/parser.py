@@ -168,12 +168,13 @@ class QStackParser:
         if not content:
             raise ParsingError("Instruction content cannot be empty.", line_info.line_number, 1)
 
-        #     - (\w+): Captures the operation name, which consists of one or more word characters.
+        #     - ([\w:]+): Captures the operation name, which consists of one or more word characters, or
+        #       colons as in the names of compiled callbacks (e.g., "_steane_:decode").
         #     - (\(([^)]*)\))?: Optionally captures arguments enclosed in parentheses.
         #         - ([^)]*): Matches any characters inside the parentheses, excluding the closing parenthesis.
         #     - \s*: Matches zero or more whitespace characters.
         #     - (.*): Captures the remaining part of the line as targets.
-        match = re.match(r"(\w+)(\(([^)]*)\))?\s*(.*)", content)
+        match = re.match(r"([\w:]+)(\(([^)]*)\))?\s*(.*)", content)
         if not match:
             raise ParsingError("Invalid instruction format.", line_info.line_number, 1)
 
@@ -0,0 +1,156 @@
+"""
+This module defines `Pipeline`, which composes compilers into a single compiler.
+
+Calling `Compiler.compile` once per stage materializes a full `Program` between stages and
+wraps every callback once per stage, so a continuation returned at runtime goes through one
+closure, one `decode` hook and one compile pass per stage. A pipeline instead:
+
+  - Runs adjacent stages that only translate instructions through their `handlers` (the
+    stages that keep `Compiler.translate_kernel`) in one traversal: each instruction goes
+    through the chain of handlers directly, without building the kernels in between.
+  - Runs other stages, like the QEC codes that restructure kernels, one after the other on
+    each kernel, with no intermediate `Program`.
+  - Memoizes every step by node, so repeated sub-kernels and continuations are compiled once
+    for the whole pipeline.
+  - Wraps each callback once: the wrapper runs the `decode` hooks of all the stages that come
+    after the callback was defined, then compiles its continuation with a single lookup.
+
+Callbacks keep the names sequential compilation gives them, so a pipeline's output is the same
+as compiling stage by stage.
+"""
+
+from dataclasses import replace
+
+from .ast import Kernel, ClassicInstruction, Parameters
+from .cache import LRUCache
+from .classic_processor import ClassicDefinition
+from .compiler import Compiler, MAX_COMPILED_KERNELS
+
+
+def handlers_only(stage: Compiler) -> bool:
+    """Whether the stage translates instructions with its handlers and leaves kernels as they are."""
+    return (
+        type(stage).translate_kernel is Compiler.translate_kernel
+        and type(stage).compile_kernel is Compiler.compile_kernel
+    )
+
+
+class Pipeline(Compiler):
+    """
+    Compilers composed into one, applied in order.
+
+    Constructor Arguments:
+        stages (list[Compiler]): The compilers to run. The target instruction set of each stage must
+            be covered by the source instruction set of the next one.
+    """
+
+    def __init__(self, *stages: Compiler):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage.")
+        for previous, stage in zip(stages, stages[1:]):
+            if not previous.target.quantum_definitions <= stage.source.quantum_definitions:
+                raise ValueError(f"Stage {stage.name} cannot compile the output of {previous.name}.")
+
+        # Stages already warned about their own missing handlers; the pipeline has none of its own.
+        self.name = "+".join(stage.name for stage in stages)
+        self.stages = stages
+        self.source = stages[0].source
+        self.target = stages[-1].target
+        self.handlers = {}
+        self.compiled = LRUCache(MAX_COMPILED_KERNELS)
+
+        # Callbacks added by a stage are wrapped by the stages after it.
+        self.compiler_callbacks = set()
+        for i, stage in enumerate(stages):
+            self.compiler_callbacks |= {self.wrap(definition, i + 1) for definition in stage.compiler_callbacks}
+
+    def decode(self, context):
+        for stage in reversed(self.stages):
+            stage.decode(context)
+
+    def prepare(self, program):
+        for stage in self.stages:
+            stage.prepare(program)
+
+    def compile_callback(self, callback: ClassicInstruction | None, start: int = 0, stop: int | None = None):
+        for stage in self.stages[start:stop]:
+            callback = stage.compile_callback(callback)
+        return callback
+
+    def compile_kernel(self, kernel: Kernel):
+        return self.compile_from(kernel, 0)
+
+    def compile_continuation(self, kernel: Kernel, parameters: dict):
+        return self.compile_from(kernel, 0, parameters)
+
+    def callback_parameters(self, parameters: dict, start: int = 0) -> dict:
+        for stage in self.stages[start:]:
+            parameters = stage.callback_parameters(parameters)
+        return parameters
+
+    def compile_from(self, kernel: Kernel, start: int, parameters: dict | None = None) -> Kernel:
+        """Compile `kernel` through the stages from `start` on; `parameters` are those of the call site
+        of a continuation."""
+        key = (kernel, start, Parameters.wrap(parameters))
+        return self.memoized(key, lambda: self._compile_from(kernel, start, parameters))
+
+    def _compile_from(self, kernel: Kernel, start: int, parameters: dict | None) -> Kernel:
+        i = start
+        while i < len(self.stages):
+            if handlers_only(self.stages[i]):
+                stop = i + 1
+                while stop < len(self.stages) and handlers_only(self.stages[stop]):
+                    stop += 1
+                kernel = self.lower(kernel, i, stop)
+                i = stop
+            elif parameters is None:
+                kernel = self.stages[i].compile_kernel(kernel)
+                i += 1
+            else:
+                kernel = self.stages[i].compile_continuation(kernel, parameters)
+                i += 1
+        return kernel
+
+    def lower(self, node, start: int, stop: int):
+        """Translate `node` through the handlers of stages `start` to `stop` in one traversal."""
+        return self.memoized((node, start, stop), lambda: self._lower(node, start, stop))
+
+    def _lower(self, node, start: int, stop: int):
+        if isinstance(node, Kernel):
+            instructions = tuple(self.lower(inst, start, stop) for inst in node.instructions)
+            return replace(node, instructions=instructions, callback=self.compile_callback(node.callback, start, stop))
+
+        result = self.stages[start].handlers[node.name](node)
+        if start + 1 == stop:
+            return result
+        return self.lower(result, start + 1, stop)
+
+    def memoized(self, key, create):
+        try:
+            hash(key)
+        except TypeError:
+            # Parameters with unhashable values.
+            return create()
+        return self.compiled.get(key, create)
+
+    def wrap(self, definition: ClassicDefinition, start: int) -> ClassicDefinition:
+        """Wrap a callback defined before stage `start` for the stages from `start` on, in one closure."""
+        stages = self.stages[start:]
+        if not stages:
+            return definition
+        decoders = [stage.decode for stage in reversed(stages)]
+
+        def call_and_compile(context, **parameters):
+            for decode in decoders:
+                decode(context)
+            result = definition.call(context, self.callback_parameters(parameters, start))
+            if isinstance(result, Kernel):
+                return self.compile_from(result, start, parameters)
+            return result
+
+        name = self.compile_callback(ClassicInstruction(name=definition.name), start).name
+        parameters = definition.parameters + tuple(p for stage in stages for p in stage.site_parameters)
+        return ClassicDefinition(name=name, callback=call_and_compile, parameters=parameters)
+
+    def wrap_callbacks(self, source_callbacks: set[ClassicDefinition]):
+        return {self.wrap(definition, 0) for definition in source_callbacks}
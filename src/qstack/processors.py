@@ -1,4 +1,5 @@
 import abc
+import copy
 from .ast import QuantumInstruction, QubitId, ClassicInstruction, Kernel
 
 type Outcome = int
@@ -22,6 +23,81 @@ class QPU(abc.ABC):
     def measure(self) -> Outcome:
         pass
 
+    def prepare(self, instruction: QuantumInstruction):
+        """Resolve `instruction` ahead of execution. The result is passed to `execute` together with
+        the allocation-stack slots of its targets, slot 0 being the first allocated qubit."""
+        return instruction
+
+    def execute(self, prepared, slots: tuple[int, ...]):
+        """Apply an instruction returned by `prepare`."""
+        self.eval(prepared)
+
+    def combine(self, gates: list[tuple[object, tuple[int, ...]]]) -> list[tuple[object, tuple[int, ...]]]:
+        """Given the (prepared, slots) pairs of a moment, gates on disjoint slots, return an equivalent
+        list for `execute`, possibly with gates merged into fewer operations."""
+        return gates
+
+    def seed(self, seed):
+        """Reseed the QPU's random generator from an int or a `numpy.random.SeedSequence`."""
+        raise NotImplementedError(f"{type(self).__name__} does not support seeding.")
+
+    def batched(self) -> "BatchedQPU":
+        """Return a QPU with the same configuration that evolves many shots at once."""
+        raise NotImplementedError(f"{type(self).__name__} does not support batched execution.")
+
+    def deferred(self) -> "DeferredQPU":
+        """Return a QPU with the same configuration that defers measurements to the end of the program."""
+        raise NotImplementedError(f"{type(self).__name__} does not support deferred measurements.")
+
+
+class BatchedQPU(abc.ABC):
+    """A QPU that holds one register per shot. Operations take the rows (shots) they apply to,
+    so shots can be regrouped when their classical callbacks diverge."""
+
+    @abc.abstractmethod
+    def restart(self, num_qubits: int, shots: int):
+        pass
+
+    @abc.abstractmethod
+    def allocate(self, target: QubitId):
+        pass
+
+    @abc.abstractmethod
+    def eval(self, instruction: QuantumInstruction, rows):
+        pass
+
+    @abc.abstractmethod
+    def measure(self, rows) -> list[Outcome]:
+        pass
+
+
+class DeferredQPU(abc.ABC):
+    """A QPU that releases qubits without measuring them. By the deferred-measurement principle,
+    all shots of a program without feed-forward can then be sampled from a single simulation."""
+
+    @abc.abstractmethod
+    def restart(self, num_qubits: int):
+        pass
+
+    @abc.abstractmethod
+    def allocate(self, target: QubitId):
+        pass
+
+    @abc.abstractmethod
+    def eval(self, instruction: QuantumInstruction):
+        pass
+
+    @abc.abstractmethod
+    def defer(self):
+        """Release the most recently allocated qubit, deferring its measurement."""
+        pass
+
+    @abc.abstractmethod
+    def sample(self, shots: int):
+        """Sample the deferred measurements, returning a (shots, measurements) array of outcomes
+        in the order the qubits were released."""
+        pass
+
 
 class CPU(abc.ABC):
 
@@ -37,3 +113,9 @@ class CPU(abc.ABC):
     @abc.abstractmethod
     def context(self):
         pass
+
+    def fork(self) -> "CPU":
+        """Return a copy of this processor with a fresh context."""
+        cpu = copy.copy(self)
+        cpu.restart()
+        return cpu
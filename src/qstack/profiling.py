@@ -0,0 +1,228 @@
+"""
+This module defines `Stats`, the counters collected by `QuantumMachine.eval(profile=True)`,
+and the processor proxies that collect them.
+
+Profiling is opt-in: when it is enabled, the machine runs the program on an `InstrumentedQPU`
+and an `InstrumentedCPU` that wrap its processors, time every call and forward it. When it is
+disabled the processors are used directly, so the shot loop pays nothing for it.
+
+Counts are per call to the processors: a batched or sampled run applies each gate once to the
+whole batch, and its counts are per batch rather than per shot.
+"""
+
+import time
+from collections import Counter
+
+from .processors import QPU, CPU, Outcome
+from .ast import ClassicInstruction, Kernel, QuantumInstruction, QubitId
+
+
+class Stats:
+    """
+    Counters of a profiled run.
+
+    Attributes:
+        shots (int): Number of shots run.
+        gate_counts (Counter): Number of applications of each gate, by name.
+        gate_time (Counter): Seconds spent applying each gate, by name.
+        callback_counts (Counter): Number of calls to each classical callback, by name.
+        callback_time (Counter): Seconds spent in each classical callback, by name.
+        allocations (int): Number of qubits allocated.
+        measurements (int): Number of measurements, deferred ones included.
+        continuations (int): Number of kernels returned by callbacks.
+        max_continuation_depth (int): Most continuations running at once, each returned by a callback of
+            the one before, within a single shot.
+    """
+
+    def __init__(self):
+        self.shots = 0
+        self.gate_counts = Counter()
+        self.gate_time = Counter()
+        self.callback_counts = Counter()
+        self.callback_time = Counter()
+        self.allocations = 0
+        self.measurements = 0
+        self.continuations = 0
+        self.max_continuation_depth = 0
+
+    def merge(self, other: "Stats") -> "Stats":
+        """Add the counters of `other`, e.g. from another block of shots."""
+        self.shots += other.shots
+        self.gate_counts.update(other.gate_counts)
+        self.gate_time.update(other.gate_time)
+        self.callback_counts.update(other.callback_counts)
+        self.callback_time.update(other.callback_time)
+        self.allocations += other.allocations
+        self.measurements += other.measurements
+        self.continuations += other.continuations
+        self.max_continuation_depth = max(self.max_continuation_depth, other.max_continuation_depth)
+        return self
+
+    @property
+    def allocations_per_shot(self) -> float:
+        return self.allocations / self.shots if self.shots else 0.0
+
+    @property
+    def measurements_per_shot(self) -> float:
+        return self.measurements / self.shots if self.shots else 0.0
+
+    @property
+    def gates(self) -> int:
+        return sum(self.gate_counts.values())
+
+    @property
+    def total_time(self) -> float:
+        """Seconds spent in gates and callbacks."""
+        return sum(self.gate_time.values()) + sum(self.callback_time.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "shots": self.shots,
+            "gate_counts": dict(self.gate_counts),
+            "gate_time": dict(self.gate_time),
+            "callback_counts": dict(self.callback_counts),
+            "callback_time": dict(self.callback_time),
+            "allocations": self.allocations,
+            "measurements": self.measurements,
+            "continuations": self.continuations,
+            "max_continuation_depth": self.max_continuation_depth,
+        }
+
+    def __str__(self):
+        lines = [
+            f"shots: {self.shots}",
+            f"allocations/shot: {self.allocations_per_shot:.2f}",
+            f"measurements/shot: {self.measurements_per_shot:.2f}",
+            f"continuations: {self.continuations} (max depth {self.max_continuation_depth})",
+        ]
+        for name, count in self.gate_counts.most_common():
+            lines.append(f"gate {name}: {count} in {self.gate_time[name] * 1e3:.3f}ms")
+        for name, count in self.callback_counts.most_common():
+            lines.append(f"callback {name}: {count} in {self.callback_time[name] * 1e3:.3f}ms")
+        return "\n".join(lines)
+
+
+class InstrumentedQPU(QPU):
+    """
+    A QPU proxy that records gate, allocation and measurement counters in `stats`.
+
+    It also wraps the batched and deferred QPUs of the processor, whose `eval` and `measure`
+    take rows; extra arguments are forwarded unchanged.
+
+    Constructor Arguments:
+        qpu: The QPU (or batched or deferred QPU) to forward to.
+        stats (Stats): The counters to update.
+    """
+
+    def __init__(self, qpu, stats: Stats):
+        self.qpu = qpu
+        self.stats = stats
+
+    def restart(self, *args, **kwargs):
+        self.qpu.restart(*args, **kwargs)
+
+    def allocate(self, target: QubitId):
+        self.stats.allocations += 1
+        self.qpu.allocate(target)
+
+    def eval(self, instruction: QuantumInstruction, *args):
+        start = time.perf_counter()
+        self.qpu.eval(instruction, *args)
+        self.record(instruction.name, start)
+
+    def prepare(self, instruction: QuantumInstruction):
+        return (instruction.name, self.qpu.prepare(instruction))
+
+    def combine(self, gates: list[tuple[object, tuple[int, ...]]]) -> list[tuple[object, tuple[int, ...]]]:
+        # Gates of a moment are on disjoint slots, so each combined operation is named after the gates
+        # whose slots it covers, e.g. "cx+cx".
+        names = [(name, set(slots)) for (name, _), slots in gates]
+        combined = self.qpu.combine([(prepared, slots) for (_, prepared), slots in gates])
+        return [
+            (("+".join(name for name, covered in names if covered <= set(slots)), prepared), slots)
+            for prepared, slots in combined
+        ]
+
+    def execute(self, prepared, slots: tuple[int, ...]):
+        name, prepared = prepared
+        start = time.perf_counter()
+        self.qpu.execute(prepared, slots)
+        self.record(name, start)
+
+    def record(self, name: str, start: float):
+        self.stats.gate_time[name] += time.perf_counter() - start
+        self.stats.gate_counts[name] += 1
+
+    def measure(self, *args) -> Outcome:
+        self.stats.measurements += 1
+        return self.qpu.measure(*args)
+
+    def defer(self):
+        self.stats.measurements += 1
+        self.qpu.defer()
+
+    def sample(self, shots: int):
+        return self.qpu.sample(shots)
+
+    def seed(self, seed):
+        self.qpu.seed(seed)
+
+    def batched(self) -> "InstrumentedQPU":
+        return InstrumentedQPU(self.qpu.batched(), self.stats)
+
+    def deferred(self) -> "InstrumentedQPU":
+        return InstrumentedQPU(self.qpu.deferred(), self.stats)
+
+
+# Callback that `InstrumentedCPU` runs at the end of each continuation it returns.
+END_OF_CONTINUATION = ClassicInstruction(name="_profiling_:end_of_continuation")
+
+
+class InstrumentedCPU(CPU):
+    """
+    A CPU proxy that times each classical callback and tracks the continuations they return.
+
+    Each continuation is returned wrapped in a kernel whose callback is `END_OF_CONTINUATION`, so
+    the proxy knows when it finishes. A continuation returned at the end of another one then no
+    longer replaces it on the machine's stack: feed-forward loops use more stack when profiled.
+
+    Constructor Arguments:
+        cpu (CPU): The CPU to forward to.
+        stats (Stats): The counters to update.
+    """
+
+    def __init__(self, cpu: CPU, stats: Stats):
+        self.cpu = cpu
+        self.stats = stats
+        # Continuations running, each nested in the previous one.
+        self.depth = 0
+
+    def restart(self):
+        self.cpu.restart()
+        self.depth = 0
+
+    @property
+    def context(self):
+        return self.cpu.context
+
+    def eval(self, instruction: ClassicInstruction | None, outcome: Outcome | None) -> Kernel | None:
+        if instruction is None:
+            return self.cpu.eval(instruction, outcome)
+        if instruction == END_OF_CONTINUATION:
+            self.depth -= 1
+            return self.cpu.eval(None, outcome)
+
+        start = time.perf_counter()
+        continuation = self.cpu.eval(instruction, outcome)
+        self.stats.callback_time[instruction.name] += time.perf_counter() - start
+        self.stats.callback_counts[instruction.name] += 1
+
+        if continuation:
+            self.depth += 1
+            self.stats.continuations += 1
+            self.stats.max_continuation_depth = max(self.stats.max_continuation_depth, self.depth)
+            return Kernel(target=None, instructions=(continuation,), callback=END_OF_CONTINUATION)
+        return continuation
+
+    def fork(self) -> "InstrumentedCPU":
+        return InstrumentedCPU(self.cpu.fork(), self.stats)
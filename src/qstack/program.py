@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from functools import cached_property
 from .ast import Kernel
 from .instruction_set import InstructionSet
 
@@ -8,7 +9,11 @@ class Program:
     instruction_set: InstructionSet
     kernels: tuple[Kernel]
 
-    @property
+    def __post_init__(self):
+        if not isinstance(self.kernels, tuple):
+            object.__setattr__(self, "kernels", tuple(self.kernels))
+
+    @cached_property
     def depth(self):
         return max(k.depth for k in self.kernels)
 
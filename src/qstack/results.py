@@ -0,0 +1,311 @@
+"""
+This module defines `Results`, the outcomes of running a program for many shots.
+
+Outcomes are stored column-wise instead of as a list of tuples: the bits of each shot are
+packed into uint64 words, first outcome in the most significant bit, and the words of all
+shots are concatenated in one array. `offsets[i]:offsets[i + 1]` are the words of shot i and
+`lengths[i]` its number of outcomes, so shots of programs like repeat-until-success, whose
+length varies, are stored without padding. Histograms and marginals are computed with
+vectorized NumPy operations on the packed words.
+"""
+
+import hashlib
+import io
+import json
+import os
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from .profiling import Stats
+
+WORD_BITS = 64
+
+# Number of shots counted at once by `get_histogram`.
+HISTOGRAM_CHUNK = 1 << 22
+
+# Version of the on-disk layout written by `Results.save`.
+FORMAT_VERSION = 1
+
+
+def sorted_histogram(hist: Counter) -> OrderedDict:
+    histogram = OrderedDict()
+    for key in sorted(hist.keys(), key=lambda x: tuple([str(i) for i in x if i])):
+        histogram[key] = hist[key]
+    return histogram
+
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """Pack a (shots, n) array of bits into a (shots, ceil(n / 64)) array of uint64 words."""
+    shots, n = bits.shape
+    words = -(-n // WORD_BITS)
+    padded = np.zeros((shots, words * WORD_BITS), dtype=np.uint8)
+    padded[:, :n] = bits
+    return np.packbits(padded, axis=1).view(">u8").astype(np.uint64)
+
+
+def unpack_bits(words: np.ndarray, n: int) -> np.ndarray:
+    """Inverse of `pack_bits`: a (shots, n) array of bits."""
+    as_bytes = np.ascontiguousarray(words.astype(">u8")).view(np.uint8)
+    return np.unpackbits(as_bytes.reshape(len(words), -1), axis=1)[:, :n]
+
+
+def describe_noise(noise) -> dict | None:
+    if noise is None:
+        return None
+    return {"type": type(noise).__name__, **vars(noise)}
+
+
+def read_metadata(path: str) -> dict:
+    with open(os.path.join(path, "metadata.json")) as f:
+        return json.load(f)
+
+
+def append_npy(filename: str, rows: np.ndarray):
+    """Append rows to a 1-D .npy file in place, rewriting its header with the new length.
+
+    NumPy pads headers so the length can grow (`GROWTH_AXIS_MAX_DIGITS`), so the data never moves."""
+    with open(filename, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        data_start = f.tell()
+
+        write_header = (
+            np.lib.format.write_array_header_1_0 if version == (1, 0) else np.lib.format.write_array_header_2_0
+        )
+        header = io.BytesIO()
+        write_header(
+            header,
+            {
+                "descr": np.lib.format.dtype_to_descr(dtype),
+                "fortran_order": fortran_order,
+                "shape": (shape[0] + len(rows),),
+            },
+        )
+        if header.tell() != data_start:
+            raise ValueError(f"Header of {filename} cannot grow in place.")
+
+        f.seek(0, os.SEEK_END)
+        f.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+        f.seek(0)
+        f.write(header.getvalue())
+
+
+class Results:
+    """
+    Outcomes of a run, one row of bits per shot.
+
+    Constructor Arguments:
+        all_data (list[tuple]):
+            The outcomes of each shot. Use `from_bits` or `concatenate` to build results
+            without going through Python tuples.
+    """
+
+    def __init__(self, all_data: list[tuple]):
+        lengths = np.fromiter((len(shot) for shot in all_data), dtype=np.int64, count=len(all_data))
+        self._init_packed(*self._pack(all_data, lengths), lengths)
+
+    def _init_packed(self, words: np.ndarray, offsets: np.ndarray, lengths: np.ndarray):
+        self.words = words
+        self.offsets = offsets
+        self.lengths = lengths
+        self.shots = len(lengths)
+        self.metadata = {}
+        # Counters of the run, set by `QuantumMachine.eval(profile=True)`.
+        self.stats = None
+        self._data = None
+        self._histogram = None
+
+    @staticmethod
+    def _pack(all_data: list[tuple], lengths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        num_words = -(-lengths // WORD_BITS)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(num_words, out=offsets[1:])
+        words = np.zeros(offsets[-1], dtype=np.uint64)
+
+        # Shots of the same length are packed together.
+        for n in np.unique(lengths):
+            if n == 0:
+                continue
+            rows = np.flatnonzero(lengths == n)
+            bits = np.array([all_data[i] for i in rows], dtype=np.int64)
+            if ((bits != 0) & (bits != 1)).any():
+                raise ValueError("Results can only store outcomes of 0 or 1.")
+            packed = pack_bits(bits.astype(np.uint8))
+            words[offsets[rows][:, None] + np.arange(packed.shape[1])] = packed
+        return words, offsets
+
+    @classmethod
+    def from_packed(cls, words: np.ndarray, offsets: np.ndarray, lengths: np.ndarray) -> "Results":
+        results = cls.__new__(cls)
+        results._init_packed(words, offsets, lengths)
+        return results
+
+    @classmethod
+    def from_bits(cls, bits: np.ndarray) -> "Results":
+        """Results of shots with the same number of outcomes, from a (shots, n) array of bits."""
+        shots, n = bits.shape
+        packed = pack_bits(np.asarray(bits, dtype=np.uint8))
+        offsets = np.arange(shots + 1, dtype=np.int64) * packed.shape[1]
+        return cls.from_packed(packed.reshape(-1), offsets, np.full(shots, n, dtype=np.int64))
+
+    @classmethod
+    def concatenate(cls, parts: list["Results"]) -> "Results":
+        """The shots of all `parts`, in order."""
+        if not parts:
+            return cls([])
+        offsets = [parts[0].offsets[:1]]
+        base = 0
+        for part in parts:
+            offsets.append(part.offsets[1:] + base)
+            base += part.offsets[-1]
+        results = cls.from_packed(
+            np.concatenate([part.words for part in parts]),
+            np.concatenate(offsets),
+            np.concatenate([part.lengths for part in parts]),
+        )
+        for part in parts:
+            if part.stats is not None:
+                results.stats = (results.stats or Stats()).merge(part.stats)
+        return results
+
+    @property
+    def uniform(self) -> bool:
+        """Whether all shots have the same number of outcomes."""
+        return self.shots == 0 or bool((self.lengths == self.lengths[0]).all())
+
+    def _rows(self, rows: np.ndarray, n: int) -> np.ndarray:
+        """The (len(rows), n) bits of shots with n outcomes."""
+        num_words = -(-n // WORD_BITS)
+        words = self.words[self.offsets[rows][:, None] + np.arange(num_words)]
+        return unpack_bits(words.reshape(len(rows), num_words), n)
+
+    def bits(self) -> np.ndarray:
+        """The outcomes as a (shots, n) array of bits; all shots must have the same length."""
+        if not self.uniform:
+            raise ValueError("Shots have different numbers of outcomes.")
+        n = int(self.lengths[0]) if self.shots else 0
+        return self._rows(np.arange(self.shots), n)
+
+    @property
+    def data(self) -> list[tuple]:
+        """The outcomes of each shot as tuples, unpacked on first access."""
+        if self._data is None:
+            data = [()] * self.shots
+            for n in np.unique(self.lengths):
+                if n == 0:
+                    continue
+                rows = np.flatnonzero(self.lengths == n)
+                for row, bits in zip(rows.tolist(), self._rows(rows, int(n)).tolist()):
+                    data[row] = tuple(bits)
+            self._data = data
+        return self._data
+
+    def bit(self, position: int) -> np.ndarray:
+        """Outcome at `position` of every shot; negative positions count from the end of each shot."""
+        positions = np.full(self.shots, position, dtype=np.int64)
+        if position < 0:
+            positions += self.lengths
+        if ((positions < 0) | (positions >= self.lengths)).any():
+            raise IndexError(f"Outcome {position} is out of range for some shots.")
+
+        words = self.words[self.offsets[:-1] + positions // WORD_BITS]
+        shifts = (WORD_BITS - 1 - positions % WORD_BITS).astype(np.uint64)
+        return ((words >> shifts) & np.uint64(1)).astype(np.uint8)
+
+    def marginal(self, *positions: int) -> "Results":
+        """The results restricted to the outcomes at `positions`."""
+        if not positions:
+            return Results.from_bits(np.zeros((self.shots, 0), dtype=np.uint8))
+        return Results.from_bits(np.stack([self.bit(p) for p in positions], axis=1))
+
+    def get_histogram(self):
+        if not self._histogram:
+            # Shots are counted in chunks, so memory-mapped results are never loaded whole.
+            hist = Counter()
+            for start in range(0, self.shots, HISTOGRAM_CHUNK):
+                stop = min(start + HISTOGRAM_CHUNK, self.shots)
+                self._count(hist, np.asarray(self.lengths[start:stop]), np.asarray(self.offsets[start:stop]))
+            self._histogram = sorted_histogram(hist)
+        return self._histogram
+
+    def _count(self, hist: Counter, lengths: np.ndarray, offsets: np.ndarray):
+        for n in np.unique(lengths).tolist():
+            rows = np.flatnonzero(lengths == n)
+            if n == 0:
+                hist[()] += len(rows)
+                continue
+
+            num_words = -(-n // WORD_BITS)
+            words = self.words[offsets[rows][:, None] + np.arange(num_words)]
+            if num_words == 1:
+                # A 1-D unique sorts plain integers, much faster than rows.
+                unique, counts = np.unique(words[:, 0], return_counts=True)
+                unique = unique[:, None]
+            else:
+                unique, counts = np.unique(words, axis=0, return_counts=True)
+            for bits, count in zip(unpack_bits(unique, n).tolist(), counts.tolist()):
+                hist[tuple(bits)] += count
+
+    def save(self, path: str, *, append: bool = False, program=None, noise=None, seed=None, **metadata):
+        """
+        Save the results to the directory `path`, as `words.npy`, `offsets.npy` and `lengths.npy`
+        plus a `metadata.json` header. With `append`, the shots are added to existing results at
+        `path`, which must come from the same program.
+
+        The header records the program hash and instruction set, when `program` is given, and one
+        entry per run with its number of shots, noise parameters, seed and any extra `metadata`.
+        """
+        run = {"shots": self.shots, "seed": seed, "noise": describe_noise(noise), **metadata}
+        header = {"format": FORMAT_VERSION, "shots": self.shots, "runs": [run]}
+        if program is not None:
+            header["program"] = hashlib.sha256(str(program).encode()).hexdigest()
+            header["instruction_set"] = str(program.instruction_set)
+
+        files = {name: os.path.join(path, f"{name}.npy") for name in ("words", "offsets", "lengths")}
+        if append and os.path.exists(os.path.join(path, "metadata.json")):
+            existing = read_metadata(path)
+            if "program" in header and existing.get("program", header["program"]) != header["program"]:
+                raise ValueError(f"Results at {path} come from a different program.")
+            existing.update({k: v for k, v in header.items() if k not in ("shots", "runs")})
+            existing["shots"] += self.shots
+            existing["runs"].append(run)
+            header = existing
+
+            base = np.load(files["offsets"], mmap_mode="r")[-1]
+            append_npy(files["words"], np.asarray(self.words))
+            append_npy(files["offsets"], np.asarray(self.offsets[1:]) + base)
+            append_npy(files["lengths"], np.asarray(self.lengths))
+        else:
+            os.makedirs(path, exist_ok=True)
+            np.save(files["words"], np.asarray(self.words))
+            np.save(files["offsets"], np.asarray(self.offsets))
+            np.save(files["lengths"], np.asarray(self.lengths))
+
+        with open(os.path.join(path, "metadata.json"), "w") as f:
+            json.dump(header, f, indent=2, default=str)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "Results":
+        """
+        Load results saved with `save`. With `mmap`, the arrays are memory-mapped read-only,
+        so histograms and marginals only read the pages they need.
+        """
+        mode = "r" if mmap else None
+        results = cls.from_packed(
+            np.load(os.path.join(path, "words.npy"), mmap_mode=mode),
+            np.load(os.path.join(path, "offsets.npy"), mmap_mode=mode),
+            np.load(os.path.join(path, "lengths.npy"), mmap_mode=mode),
+        )
+        results.metadata = read_metadata(path)
+        return results
+
+    def plot_histogram(self):
+        import matplotlib.pyplot as plt
+
+        histogram = self.get_histogram()
+        plt.bar([str(key) for key in histogram.keys()], histogram.values())
+        plt.xlabel("Outcomes")
+        plt.ylabel("Frequency")
+        plt.show()
@@ -0,0 +1,211 @@
+"""
+This module defines a stabilizer emulator for Clifford-only instruction sets.
+
+Instead of a dense state vector, `StabilizerEmulator` tracks the CHP tableau
+(Aaronson & Gottesman, "Improved Simulation of Stabilizer Circuits", 2004):
+n destabilizer and n stabilizer generators, each stored as X and Z bit rows plus a
+sign bit. Gates cost O(n) and measurements O(n^2), so QEC workloads like Steane or
+rep3 can be simulated with hundreds of physical qubits.
+"""
+
+import logging
+
+import numpy as np
+
+from .processors import QPU
+from .ast import QuantumInstruction, QubitId
+from .instruction_set import InstructionSet, QuantumDefinition
+
+
+logger = logging.getLogger("qstack")
+
+_r = 1 / np.sqrt(2)
+
+# Reference matrices for the gates the tableau can apply. Definitions are matched
+# against these by matrix, so any instruction set whose gates are all Cliffords
+# from this list (e.g. toy without skew) can run on the stabilizer emulator.
+# fmt: off
+CLIFFORD_MATRICES = {
+    "x": [[0, 1], [1, 0]],
+    "y": [[0, -1j], [1j, 0]],
+    "z": [[1, 0], [0, -1]],
+    "s": [[1, 0], [0, 1j]],
+    "h": [[_r, _r], [_r, -_r]],
+    "cx": [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 1], [0, 0, 1, 0]],
+    "cz": [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, -1]],
+}
+# fmt: on
+
+
+def clifford_gate_of(definition: QuantumDefinition) -> str | None:
+    """Return the name of the Clifford gate implemented by `definition`, if any."""
+    if definition.matrix is None:
+        return None
+
+    matrix = np.asarray(definition.matrix, dtype=complex)
+    for name, expected in CLIFFORD_MATRICES.items():
+        expected = np.asarray(expected, dtype=complex)
+        # Tolerance is loose enough to accept the rounded 0.7071 used for H.
+        if matrix.shape == expected.shape and np.allclose(matrix, expected, atol=1e-3):
+            return name
+    return None
+
+
+def is_clifford(instruction_set: InstructionSet) -> bool:
+    return all(clifford_gate_of(d) is not None for d in instruction_set.quantum_definitions)
+
+
+class StabilizerEmulator(QPU):
+    def __init__(self, instructions: set[QuantumDefinition], seed=None):
+        super().__init__()
+        self.rng = np.random.default_rng(seed)
+
+        gates = {
+            "x": self._x,
+            "y": self._y,
+            "z": self._z,
+            "s": self._s,
+            "h": self._h,
+            "cx": self._cx,
+            "cz": self._cz,
+        }
+
+        operations = {}
+        for inst in instructions:
+            gate = clifford_gate_of(inst)
+            if gate is None:
+                raise ValueError(f"Instruction {inst.name} is not supported by the stabilizer emulator.")
+            operations[inst.name.lower()] = gates[gate]
+        self.operations = operations
+
+    def seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def restart(self, num_qubits: int):
+        logger.debug("restart: %s", num_qubits)
+        n = num_qubits
+        # Rows 0..n-1 are destabilizers, n..2n-1 stabilizers, and row 2n is scratch space
+        # used by deterministic measurements.
+        self.xs = np.zeros((2 * n + 1, n), dtype=np.uint8)
+        self.zs = np.zeros((2 * n + 1, n), dtype=np.uint8)
+        self.signs = np.zeros(2 * n + 1, dtype=np.uint8)
+        self.xs[np.arange(n), np.arange(n)] = 1
+        self.zs[np.arange(n) + n, np.arange(n)] = 1
+
+        self.allocations = []
+        self.num_qubits = num_qubits
+
+    def allocate(self, target: QubitId):
+        assert target not in self.allocations, f"Qubit {target} is already allocated"
+        self.allocations.append(target)
+
+    def eval(self, instruction: QuantumInstruction):
+        gate_name = instruction.name.lower()
+        assert gate_name in self.operations, f"Invalid instruction: {instruction}"
+
+        qubits = [self.allocations.index(t) for t in instruction.targets]
+        logger.debug("eval: %s %s", gate_name, qubits)
+        self.operations[gate_name](*qubits)
+
+    def prepare(self, instruction: QuantumInstruction):
+        gate_name = instruction.name.lower()
+        assert gate_name in self.operations, f"Invalid instruction: {instruction}"
+        return self.operations[gate_name]
+
+    def execute(self, prepared, slots: tuple[int, ...]):
+        prepared(*slots)
+
+    def measure(self):
+        a = len(self.allocations) - 1
+        outcome = self._measure(a)
+        logger.debug("outcome: %s", outcome)
+
+        # Reset the qubit to |0> so its slot can be reused by the next allocation.
+        if outcome == 1:
+            self._x(a)
+        self.allocations.pop()
+        return outcome
+
+    ## Gates
+    def _x(self, a: int):
+        self.signs ^= self.zs[:, a]
+
+    def _y(self, a: int):
+        self.signs ^= self.xs[:, a] ^ self.zs[:, a]
+
+    def _z(self, a: int):
+        self.signs ^= self.xs[:, a]
+
+    def _s(self, a: int):
+        self.signs ^= self.xs[:, a] & self.zs[:, a]
+        self.zs[:, a] ^= self.xs[:, a]
+
+    def _h(self, a: int):
+        self.signs ^= self.xs[:, a] & self.zs[:, a]
+        self.xs[:, a], self.zs[:, a] = self.zs[:, a].copy(), self.xs[:, a].copy()
+
+    def _cx(self, a: int, b: int):
+        xs, zs = self.xs, self.zs
+        self.signs ^= xs[:, a] & zs[:, b] & (xs[:, b] ^ zs[:, a] ^ 1)
+        xs[:, b] ^= xs[:, a]
+        zs[:, a] ^= zs[:, b]
+
+    def _cz(self, a: int, b: int):
+        self._h(b)
+        self._cx(a, b)
+        self._h(b)
+
+    ## Measurement
+    def _rowsum(self, rows: np.ndarray, i: int):
+        """Multiply generator `i` into each generator in `rows`, tracking the sign."""
+        x1 = self.xs[i].astype(np.int64)
+        z1 = self.zs[i].astype(np.int64)
+        x2 = self.xs[rows].astype(np.int64)
+        z2 = self.zs[rows].astype(np.int64)
+
+        # Exponent of i contributed by each single-qubit Pauli product.
+        g = np.where(
+            (x1 == 1) & (z1 == 1),
+            z2 - x2,
+            np.where(x1 == 1, z2 * (2 * x2 - 1), np.where(z1 == 1, x2 * (1 - 2 * z2), 0)),
+        )
+        phase = 2 * self.signs[rows].astype(np.int64) + 2 * int(self.signs[i]) + g.sum(axis=1)
+        self.signs[rows] = (phase % 4 == 2).astype(np.uint8)
+        self.xs[rows] ^= self.xs[i]
+        self.zs[rows] ^= self.zs[i]
+
+    def _measure(self, a: int) -> int:
+        n = self.num_qubits
+        candidates = np.flatnonzero(self.xs[n : 2 * n, a])
+
+        if len(candidates) > 0:
+            # Random outcome: some stabilizer anticommutes with Z_a.
+            p = n + int(candidates[0])
+            rows = np.flatnonzero(self.xs[: 2 * n, a])
+            rows = rows[rows != p]
+            if len(rows) > 0:
+                self._rowsum(rows, p)
+
+            self.xs[p - n] = self.xs[p]
+            self.zs[p - n] = self.zs[p]
+            self.signs[p - n] = self.signs[p]
+
+            outcome = int(self.rng.integers(2))
+            self.xs[p] = 0
+            self.zs[p] = 0
+            self.zs[p, a] = 1
+            self.signs[p] = outcome
+            return outcome
+
+        # Deterministic outcome: accumulate the stabilizers that generate Z_a in the scratch row.
+        scratch = 2 * n
+        self.xs[scratch] = 0
+        self.zs[scratch] = 0
+        self.signs[scratch] = 0
+        for i in np.flatnonzero(self.xs[:n, a]):
+            self._rowsum(np.array([scratch]), int(i) + n)
+        return int(self.signs[scratch])
+
+
+def from_instruction_set(layer: InstructionSet, seed=None):
+    return StabilizerEmulator(layer.quantum_definitions, seed=seed)
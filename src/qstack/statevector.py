@@ -0,0 +1,404 @@
+"""
+This module defines `NumpyEmulator`, a state-vector QPU implemented directly on NumPy.
+
+The register is kept as a flat complex128 array of 2^n amplitudes, viewed as a tensor with
+one axis of size 2 per qubit slot, where slot `i` is the i-th qubit on the allocation stack.
+Gates are applied by reshaping the state and contracting their matrix against the target
+axes, so there is no foreign-call or Kraus overhead for noiseless programs. Noise channels
+are simulated as quantum trajectories: one Kraus operator is sampled per gate according
+to its probability.
+
+By default the register is dynamic: since qubits are measured in reverse allocation order,
+`allocate` appends an axis and `measure` drops the last one, so gates only pay for the qubits
+alive at the time instead of the peak width of the program. With `dynamic=False` the state
+keeps the full `num_qubits` width and measured qubits are reset to |0> in place.
+"""
+
+import logging
+from functools import lru_cache
+from typing import Set
+
+import numpy as np
+
+from .processors import QPU, BatchedQPU, DeferredQPU
+from .ast import QuantumInstruction, QubitId
+from .instruction_set import QuantumDefinition, InstructionSet, Matrix
+from .noise import NoiseChannel, NoiselessChannel, channel_key, compile_channel
+from .cache import LRUCache, normalize_parameters, parse_parameters
+
+
+logger = logging.getLogger("qstack")
+
+# Kraus operators of a gate as (matrix, probability) pairs; see NumpyEmulator.make_operation.
+type Operation = tuple[tuple[np.ndarray, float | None], ...]
+
+# Operations of parameterized gates, keyed on (definition, normalized parameters, channel key).
+OPERATION_CACHE = LRUCache(maxsize=1024)
+
+# Multi-qubit gates of a moment are merged into operations on up to this many qubits, which
+# take one transpose and matmul instead of one per gate. Single-qubit gates are a plain
+# broadcast matmul and are cheaper on their own.
+MAX_COMBINED_QUBITS = 4
+
+
+@lru_cache(maxsize=4096)
+def _permutation(n: int, axes: tuple[int, ...]) -> tuple[tuple[int, ...], tuple[int, ...], tuple[int, ...]]:
+    """Shape and axis permutations that move `axes` last in an n-qubit tensor, and back."""
+    perm = [i for i in range(n) if i not in axes] + list(axes)
+    return (2,) * n, tuple(perm), tuple(np.argsort(perm).tolist())
+
+
+def apply_matrix_rows(states: np.ndarray, matrix: np.ndarray, axes: tuple[int, ...]) -> np.ndarray:
+    """Like `apply_matrix`, for a (rows, 2^n) stack of states."""
+    rows = len(states)
+    if len(axes) == 1:
+        return np.matmul(matrix, states.reshape(rows, 1 << axes[0], 2, -1)).reshape(rows, -1)
+
+    shape, perm, inverse = _permutation(states.shape[1].bit_length() - 1, axes)
+    perm = (0,) + tuple(i + 1 for i in perm)
+    inverse = (0,) + tuple(i + 1 for i in inverse)
+    moved = states.reshape((rows,) + shape).transpose(perm).reshape(-1, len(matrix))
+    return (moved @ matrix.T).reshape((rows,) + shape).transpose(inverse).reshape(rows, -1)
+
+
+def apply_matrix(state: np.ndarray, matrix: np.ndarray, axes: tuple[int, ...]) -> np.ndarray:
+    """Apply a (2^k x 2^k) matrix to the given axes of an n-qubit state of shape (2^n,).
+
+    Single-qubit gates are a broadcast matmul over a (left, 2, right) view of the state;
+    multi-qubit gates move the target axes last and contract them with one matmul.
+    """
+    if len(axes) == 1:
+        return np.matmul(matrix, state.reshape(1 << axes[0], 2, -1)).reshape(-1)
+
+    shape, perm, inverse = _permutation(state.size.bit_length() - 1, axes)
+    moved = state.reshape(shape).transpose(perm).reshape(-1, len(matrix))
+    return (moved @ matrix.T).reshape(shape).transpose(inverse).reshape(-1)
+
+
+class NumpyEmulator(QPU, DeferredQPU):
+    def __init__(
+        self,
+        instructions: Set[QuantumDefinition],
+        noise_channel: NoiseChannel = NoiselessChannel(),
+        seed=None,
+        dynamic: bool = True,
+    ):
+        super().__init__()
+
+        self.noise_channel = noise_channel
+        self.dynamic = dynamic
+        self.noiseless = isinstance(noise_channel, NoiselessChannel)
+        self.rng = np.random.default_rng(seed)
+
+        # Static gates are converted to matrices once; parameterized gates keep their
+        # definition and are built on each eval.
+        operations = {}
+        for inst in instructions:
+            if inst.matrix is None:
+                assert inst.factory is not None, f"Invalid instruction {inst.name}"
+                operations[inst.name.lower()] = inst
+            else:
+                operations[inst.name.lower()] = self.make_operation(inst, inst.matrix)
+        self.operations = operations
+
+    def make_operation(self, definition: QuantumDefinition, matrix: Matrix) -> Operation:
+        """Return the Kraus operators for `matrix` under the noise channel as (matrix, probability) pairs.
+
+        A single pair means the operation is unitary. Kraus operators proportional to a unitary
+        are stored normalized with their (state-independent) probability; for the rest the
+        probability is None and has to be computed from the state.
+        """
+        unitary = np.asarray(matrix, dtype=np.complex128)
+        if self.noiseless:
+            return ((unitary, 1.0),)
+
+        operation = []
+        for K in compile_channel(self.noise_channel, definition):
+            kraus = K @ unitary
+            gram = kraus.conj().T @ kraus
+            weight = gram[0, 0].real
+            if weight > 0 and np.allclose(gram, weight * np.eye(len(gram))):
+                operation.append((kraus / np.sqrt(weight), weight))
+            else:
+                operation.append((kraus, None))
+        return tuple(operation)
+
+    def seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def batched(self) -> "BatchedNumpyEmulator":
+        return BatchedNumpyEmulator(self)
+
+    def deferred(self) -> "NumpyEmulator":
+        if not self.noiseless:
+            raise ValueError("Deferred measurements require a noiseless channel.")
+        return self
+
+    def restart(self, num_qubits: int):
+        logger.debug("restart: %s", num_qubits)
+        # A dynamic register starts empty and grows one axis per live qubit.
+        self.state = np.zeros(1 if self.dynamic else 1 << num_qubits, dtype=np.complex128)
+        self.state[0] = 1.0
+        self.allocations = []
+        self.slots = {}
+        self.deferrals = []
+        self.num_qubits = num_qubits
+
+    def allocate(self, target: QubitId):
+        assert target not in self.slots, f"Qubit {target} is already allocated"
+        assert len(self.allocations) < self.num_qubits, f"No qubits available to allocate {target}"
+        self.slots[target] = len(self.allocations)
+        self.allocations.append(target)
+
+        if self.dynamic:
+            # Append the new qubit as the last axis, in |0>.
+            state = np.zeros(2 * len(self.state), dtype=np.complex128)
+            state[0::2] = self.state
+            self.state = state
+
+    def eval(self, instruction: QuantumInstruction):
+        operation = self.prepare(instruction)
+        axes = tuple(self.slots[t] for t in instruction.targets)
+        logger.debug("eval: %s %s", instruction.name, axes)
+        self.apply(operation, axes)
+
+    def prepare(self, instruction: QuantumInstruction) -> Operation:
+        gate_name = instruction.name.lower()
+        assert gate_name in self.operations, f"Invalid instruction: {instruction}"
+
+        operation = self.operations[gate_name]
+        if isinstance(operation, QuantumDefinition):
+            operation = self.parameterized_operation(operation, instruction.parameters)
+        return operation
+
+    def parameterized_operation(self, definition: QuantumDefinition, parameters: dict) -> Operation:
+        """The operation of a parameterized gate, cached on the normalized parameters."""
+        normalized = normalize_parameters(parameters)
+        return OPERATION_CACHE.get(
+            (definition, normalized, channel_key(self.noise_channel)),
+            lambda: self.make_operation(definition, definition.factory(**parse_parameters(parameters))),
+        )
+
+    def execute(self, prepared: Operation, slots: tuple[int, ...]):
+        self.apply(prepared, slots)
+
+    def combine(self, gates: list[tuple[Operation, tuple[int, ...]]]) -> list[tuple[Operation, tuple[int, ...]]]:
+        if not self.noiseless:
+            # Each gate samples its own Kraus operator.
+            return gates
+
+        combined = []
+        matrix, axes = None, ()
+        for operation, slots in gates:
+            if len(slots) == 1:
+                combined.append((operation, slots))
+            elif matrix is not None and len(axes) + len(slots) <= MAX_COMBINED_QUBITS:
+                matrix, axes = np.kron(matrix, operation[0][0]), axes + slots
+            else:
+                if matrix is not None:
+                    combined.append((((matrix, 1.0),), axes))
+                matrix, axes = operation[0][0], slots
+        if matrix is not None:
+            combined.append((((matrix, 1.0),), axes))
+        return combined
+
+    def apply(self, operation: Operation, axes: tuple[int, ...]):
+        if len(operation) == 1:
+            self.state = apply_matrix(self.state, operation[0][0], axes)
+            return
+
+        # Quantum trajectory: pick Kraus operator K_i with probability ||K_i psi||^2.
+        # Candidates are tried in order, so the (usually dominant) first one is often the only one computed.
+        threshold = self.rng.random()
+        cumulative = 0.0
+        for matrix, probability in operation:
+            if probability is not None:
+                cumulative += probability
+                if threshold < cumulative:
+                    self.state = apply_matrix(self.state, matrix, axes)
+                    return
+                continue
+
+            candidate = apply_matrix(self.state, matrix, axes)
+            probability = np.vdot(candidate, candidate).real
+            cumulative += probability
+            if threshold < cumulative:
+                self.state = candidate / np.sqrt(probability)
+                return
+
+        # Rounding left the threshold past the total; fall back to the first (dominant) operator.
+        matrix, probability = operation[0]
+        self.state = apply_matrix(self.state, matrix, axes)
+        if probability is None:
+            self.state /= np.linalg.norm(self.state)
+
+    def measure(self):
+        p1 = self.probability()
+        outcome = int(self.rng.random() < p1)
+        logger.debug("outcome: %s", outcome)
+        self.collapse(outcome)
+        return outcome
+
+    def defer(self):
+        # The qubit keeps its axis: a placeholder stays on the stack so new allocations get fresh slots.
+        target = max(self.slots, key=self.slots.get)
+        slot = self.slots.pop(target)
+        self.allocations[slot] = None
+        self.deferrals.append(slot)
+
+    def sample(self, shots: int) -> np.ndarray:
+        n = self.state.size.bit_length() - 1
+        probabilities = (np.abs(self.state) ** 2).reshape((2,) * n)
+
+        # Marginalize the qubits that were never released, then order the axes by release.
+        kept = sorted(self.deferrals)
+        probabilities = probabilities.sum(axis=tuple(i for i in range(n) if i not in kept))
+        probabilities = probabilities.transpose([kept.index(slot) for slot in self.deferrals]).reshape(-1)
+
+        m = len(self.deferrals)
+        samples = self.rng.choice(len(probabilities), size=shots, p=probabilities / probabilities.sum())
+        return (samples[:, None] >> np.arange(m - 1, -1, -1)) & 1
+
+    def probability(self) -> float:
+        """Probability of measuring 1 on the most recently allocated qubit."""
+        slot = len(self.allocations) - 1
+        one = self.state.reshape(1 << slot, 2, -1)[:, 1, :]
+        # Gate matrices given with a few digits (like 0.7071 for H) let the norm drift.
+        return np.vdot(one, one).real / np.vdot(self.state, self.state).real
+
+    def collapse(self, outcome: int):
+        """Collapse the most recently allocated qubit to `outcome`, renormalizing the state, then reset
+        it to |0> and release its slot."""
+        slot = len(self.allocations) - 1
+        # (left, 2, right) view of the measured axis; writes go through to self.state.
+        view = self.state.reshape(1 << slot, 2, -1)
+        branch = view[:, outcome, :]
+        norm = np.sqrt(np.vdot(branch, branch).real)
+        if self.dynamic:
+            # The measured qubit is the last axis; dropping it leaves the rest of the register.
+            self.state = view[:, outcome, 0] / norm
+        else:
+            view[:, 0, :] = branch / norm
+            view[:, 1, :] = 0.0
+
+        target = self.allocations.pop()
+        del self.slots[target]
+
+
+class BatchedNumpyEmulator(BatchedQPU):
+    """Evolves a (shots, 2^n) stack of state vectors, applying each gate to all selected rows at once.
+    Operations, noise channel and random generator are shared with the `NumpyEmulator` it was created from."""
+
+    def __init__(self, emulator: NumpyEmulator):
+        self.emulator = emulator
+        self.rng = emulator.rng
+
+    def restart(self, num_qubits: int, shots: int):
+        logger.debug("restart: %s x %s", num_qubits, shots)
+        self.states = np.zeros((shots, 1 << num_qubits), dtype=np.complex128)
+        self.states[:, 0] = 1.0
+        self.allocations = []
+        self.slots = {}
+        self.num_qubits = num_qubits
+
+    def allocate(self, target: QubitId):
+        assert target not in self.slots, f"Qubit {target} is already allocated"
+        assert len(self.allocations) < self.num_qubits, f"No qubits available to allocate {target}"
+        self.slots[target] = len(self.allocations)
+        self.allocations.append(target)
+
+    def eval(self, instruction: QuantumInstruction, rows: np.ndarray):
+        gate_name = instruction.name.lower()
+        operations = self.emulator.operations
+        assert gate_name in operations, f"Invalid instruction: {instruction}"
+
+        operation = operations[gate_name]
+        if isinstance(operation, QuantumDefinition):
+            operation = self.emulator.parameterized_operation(operation, instruction.parameters)
+
+        axes = tuple(self.slots[t] for t in instruction.targets)
+        logger.debug("eval: %s %s on %s rows", gate_name, axes, len(rows))
+        self.apply(operation, axes, rows)
+
+    def apply(self, operation: Operation, axes: tuple[int, ...], rows: np.ndarray):
+        all_rows = len(rows) == len(self.states)
+        states = self.states if all_rows else self.states[rows]
+
+        if len(operation) == 1:
+            states = apply_matrix_rows(states, operation[0][0], axes)
+        else:
+            states = self._apply_kraus(states, operation, axes)
+
+        if all_rows:
+            self.states = states
+        else:
+            self.states[rows] = states
+
+    def _apply_kraus(self, states: np.ndarray, operation: Operation, axes: tuple[int, ...]) -> np.ndarray:
+        # Every row samples its own trajectory; rows are resolved operator by operator.
+        thresholds = self.rng.random(len(states))
+        cumulative = np.zeros(len(states))
+        pending = np.ones(len(states), dtype=bool)
+        result = states.copy()
+
+        for matrix, probability in operation:
+            candidates = np.flatnonzero(pending)
+            if len(candidates) == 0:
+                break
+
+            updated = apply_matrix_rows(states[candidates], matrix, axes)
+            if probability is None:
+                probability = np.einsum("ij,ij->i", updated.conj(), updated).real
+                cumulative[candidates] += probability
+                chosen = thresholds[candidates] < cumulative[candidates]
+                updated = updated / np.sqrt(np.where(chosen, probability, 1.0))[:, None]
+            else:
+                cumulative[candidates] += probability
+                chosen = thresholds[candidates] < cumulative[candidates]
+
+            result[candidates[chosen]] = updated[chosen]
+            pending[candidates[chosen]] = False
+
+        # Rows left over by rounding fall back to the first (dominant) operator.
+        leftover = np.flatnonzero(pending)
+        if len(leftover) > 0:
+            matrix, probability = operation[0]
+            updated = apply_matrix_rows(states[leftover], matrix, axes)
+            if probability is None:
+                updated /= np.linalg.norm(updated, axis=1)[:, None]
+            result[leftover] = updated
+
+        return result
+
+    def measure(self, rows: np.ndarray) -> list[int]:
+        slot = len(self.allocations) - 1
+        all_rows = len(rows) == len(self.states)
+        states = self.states if all_rows else self.states[rows]
+
+        view = states.reshape(len(states), 1 << slot, 2, -1)
+        zero = view[:, :, 0, :]
+        one = view[:, :, 1, :]
+        n0 = np.einsum("ijk,ijk->i", zero.conj(), zero).real
+        n1 = np.einsum("ijk,ijk->i", one.conj(), one).real
+        # Normalized per row: the norm drifts with gate matrices given with a few digits.
+        outcomes = self.rng.random(len(states)) * (n0 + n1) < n1
+
+        # Collapse every row, renormalizing it, and reset the measured qubit to |0>.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = 1 / np.sqrt(np.where(outcomes, n1, n0))
+        collapsed = np.where(outcomes[:, None, None], one, zero) * scale[:, None, None]
+        view[:, :, 0, :] = collapsed
+        view[:, :, 1, :] = 0.0
+
+        if not all_rows:
+            self.states[rows] = states
+
+        target = self.allocations.pop()
+        del self.slots[target]
+        return outcomes.astype(int).tolist()
+
+
+def from_instruction_set(
+    layer: InstructionSet, noise_channel: NoiseChannel = NoiselessChannel(), seed=None, dynamic: bool = True
+):
+    return NumpyEmulator(layer.quantum_definitions, noise_channel=noise_channel, seed=seed, dynamic=dynamic)
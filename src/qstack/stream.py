@@ -0,0 +1,134 @@
+"""
+This module defines `ShotStream`, the iterator returned by `QuantumMachine.eval_iter`, and
+the stopping criteria it accepts.
+
+A stopping criterion is any callable that takes the stream and returns True once enough
+shots have run. It is checked after every shot, so it should be cheap.
+"""
+
+import math
+import time
+from collections import Counter
+from typing import Callable
+
+from .results import sorted_histogram
+
+
+class ShotStream:
+    """
+    Yields the outcome of each shot as it is produced and keeps a running histogram.
+
+    Constructor Arguments:
+        shot (Callable[[], tuple]):
+            Runs one shot and returns its outcome.
+        shots (int | None):
+            Maximum number of shots; None for no limit.
+        stop (Callable | list[Callable] | None):
+            Criteria that end the stream as soon as any of them returns True.
+    """
+
+    def __init__(self, shot: Callable[[], tuple], shots: int | None = None, stop=None):
+        if callable(stop):
+            stop = [stop]
+        if shots is None and not stop:
+            raise ValueError("An unbounded stream needs a stopping criterion.")
+
+        self.shot = shot
+        self.max_shots = shots
+        self.criteria = stop or []
+        self.histogram = Counter()
+        self.shots = 0
+        self.started = time.perf_counter()
+        self.stopped_by = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def done(self) -> bool:
+        if self.max_shots is not None and self.shots >= self.max_shots:
+            return True
+        for criterion in self.criteria:
+            if criterion(self):
+                self.stopped_by = criterion
+                return True
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple:
+        if self.stopped_by is not None or self.done():
+            raise StopIteration
+
+        outcome = self.shot()
+        self.histogram[outcome] += 1
+        self.shots += 1
+        return outcome
+
+    def run(self) -> "ShotStream":
+        """Consume the stream."""
+        for _ in self:
+            pass
+        return self
+
+    def get_histogram(self):
+        return sorted_histogram(self.histogram)
+
+    def frequency(self, outcome: tuple | Callable[[tuple], bool]) -> int:
+        """Number of shots with the given outcome, or whose outcome satisfies the predicate."""
+        if callable(outcome):
+            return sum(count for key, count in self.histogram.items() if outcome(key))
+        return self.histogram[outcome]
+
+
+class ConfidenceInterval:
+    """
+    Stops once the confidence interval of the probability of `outcome` is narrower than `epsilon`.
+
+    The interval is the Wilson score interval, which stays meaningful for probabilities close
+    to 0 or 1, like logical error rates.
+
+    Constructor Arguments:
+        outcome (tuple | Callable[[tuple], bool]):
+            The outcome whose probability is estimated, or a predicate on outcomes.
+        epsilon (float):
+            Target width of the interval.
+        z (float):
+            Standard score of the confidence level (1.96 for 95%).
+        min_shots (int):
+            Shots to run before the interval is trusted.
+    """
+
+    def __init__(self, outcome, epsilon: float, z: float = 1.96, min_shots: int = 100):
+        self.outcome = outcome
+        self.epsilon = epsilon
+        self.z = z
+        self.min_shots = min_shots
+
+    def width(self, stream: ShotStream) -> float:
+        n = stream.shots
+        if n == 0:
+            return math.inf
+        p = stream.frequency(self.outcome) / n
+        z2 = self.z * self.z
+        return 2 * self.z * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n)) / (1 + z2 / n)
+
+    def __call__(self, stream: ShotStream) -> bool:
+        return stream.shots >= self.min_shots and self.width(stream) < self.epsilon
+
+
+class TimeBudget:
+    """
+    Stops once the stream has run for `seconds` of wall-clock time.
+
+    Constructor Arguments:
+        seconds (float):
+            The time budget.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def __call__(self, stream: ShotStream) -> bool:
+        return stream.elapsed >= self.seconds
@@ -0,0 +1,95 @@
+"""
+Tests for the static resource estimator.
+"""
+
+import pytest
+
+from qstack import Program, Kernel, ClassicInstruction
+from qstack.analysis import estimate, layers
+from qstack.compilers.cliffords2h2 import CliffordsToH2Compiler
+from qstack.compilers.steane import SteaneCompiler
+from qstack.compilers.toy2cliffords import ToyCompiler
+from qstack.instruction_sets import cliffords_min, toy
+
+BELL = """
+allocate q1:
+  h q1
+  allocate q2:
+    cx q1 q2
+  measure
+measure"""
+
+RETRY = """
+@instruction-set: toy
+
+allocate q1:
+  mix q1
+measure
+?? retry
+"""
+
+
+def test_logical_counts():
+    resources = estimate(Program.from_string(BELL, cliffords_min.instruction_set))
+    assert resources.qubits == 2
+    assert resources.allocations == resources.measurements == 2
+    assert resources.gates == {"h": 1, "cx": 1}
+    assert resources.two_qubit_gates == 1
+    assert resources.syndrome_rounds == 0
+    assert sum(resources.callbacks.values()) == 0
+
+
+def test_steane_counts():
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    compiled, _ = SteaneCompiler().compile(program)
+    resources = estimate(compiled)
+
+    # Two blocks of 7 data qubits, plus 3 ancillas for syndrome extraction.
+    assert resources.qubits == 17
+    assert resources.gates["cx"] >= 7
+    # Each logical qubit gets a round after allocation, and q1 another after its H.
+    assert resources.syndrome_rounds == 6
+    assert resources.callbacks["decode"] == 2
+
+
+def test_continuations_are_expected_counts():
+    program = Program.from_string(RETRY)
+    retry = Kernel.allocate("q1", instructions=[toy.Mix("q1")], callback=ClassicInstruction("retry", parameters={}))
+
+    resources = estimate(program, continuations={"retry": (retry, 1.0)})
+    assert resources.gates == {"mix": 2}
+    assert resources.measurements == 2
+    assert estimate(program).gates == {"mix": 1}
+
+
+def test_layers():
+    program = Program.from_string(RETRY)
+    retry = Kernel.allocate("q1", instructions=[toy.Mix("q1")], callback=ClassicInstruction("retry", parameters={}))
+    report = layers(
+        program, ToyCompiler(), SteaneCompiler(), CliffordsToH2Compiler(), continuations={"retry": (retry, 0.5)}
+    )
+
+    assert [name for name, _ in report] == ["toy", "toy2cliffords", "steane", "cliffords2h2"]
+    assert report[0][1].gates == {"mix": 1.5}
+    assert report[1][1].gates == {"h": 1.5}
+    assert report[2][1].qubits == 10
+    assert report[3][1].total_gates > report[2][1].total_gates
+    assert report[3][1].callbacks["_cliffords2h2_:_steane_:_toy2cliffords_:retry"] == 1.5
+
+
+def test_depth_is_cached():
+    kernel = Program.from_string(BELL, cliffords_min.instruction_set).kernels[0]
+    assert kernel.depth == 2
+    assert kernel.__dict__["depth"] == 2
+
+
+def test_continuation_qubits_add_to_the_enclosing_scope():
+    inner = Kernel(target="q2", instructions=[], callback=ClassicInstruction("deep", parameters={}))
+    program = Program(
+        instruction_set=cliffords_min.instruction_set, kernels=(Kernel.allocate("q1", instructions=[inner]),)
+    )
+    deep = Kernel.allocate("a", "b", "c", instructions=[cliffords_min.CX("a", "c")])
+
+    # q1 is still live when the callback of q2 continues with 3 more qubits.
+    assert estimate(program).qubits == 2
+    assert estimate(program, continuations={"deep": (deep, 1.0)}).qubits == 4
@@ -0,0 +1,85 @@
+"""
+Tests for the immutable, hash-consed AST nodes and memoized compilation.
+"""
+
+import pickle
+
+from qstack import Program, Kernel, QubitId, ClassicInstruction
+from qstack.ast import Parameters
+from qstack.instruction_sets import cliffords_min
+from qstack.compilers.steane import SteaneCompiler
+from qstack.classic_processor import ClassicContext
+from qstack.machine import create_callbacks, local_machine_for
+
+
+def test_qubit_ids_are_interned():
+    assert QubitId("q1") is QubitId("q1")
+    assert QubitId.wrap("q1") is QubitId("q1")
+    assert pickle.loads(pickle.dumps(QubitId("q1"))) is QubitId("q1")
+
+
+def test_nodes_are_immutable_and_hashable():
+    kernel = Kernel(target="q1", instructions=[cliffords_min.H("q1")], callback=ClassicInstruction("f", {"n": 1}))
+    assert isinstance(kernel.instructions, tuple)
+    assert kernel.target is QubitId("q1")
+    assert isinstance(kernel.callback.parameters, Parameters)
+
+    same = Kernel(
+        target=QubitId("q1"), instructions=(cliffords_min.H("q1"),), callback=ClassicInstruction("f", {"n": 1})
+    )
+    assert kernel == same
+    assert hash(kernel) == hash(same)
+    assert len({kernel, same}) == 1
+
+    copy = pickle.loads(pickle.dumps(kernel))
+    assert copy == kernel and hash(copy) == hash(kernel)
+
+
+def test_parameters_mapping():
+    parameters = Parameters({"b": 2, "a": 1})
+    assert list(parameters) == ["b", "a"]
+    assert parameters == {"a": 1, "b": 2}
+    assert hash(parameters) == hash(Parameters({"a": 1, "b": 2}))
+    assert dict(**parameters) == {"a": 1, "b": 2}
+
+
+def test_compilation_is_memoized():
+    body = "\n".join("    h q1\n    cx q1 q2" for _ in range(20))
+    program = Program.from_string(
+        f"allocate q1:\n  allocate q2:\n{body}\n  measure\nmeasure", cliffords_min.instruction_set
+    )
+    compiler = SteaneCompiler()
+    compiled, _ = compiler.compile(program)
+
+    # Each gate of the logical program is followed by the same syndrome extraction kernels, which are shared.
+    def kernels(kernel):
+        yield kernel
+        for instruction in kernel.instructions:
+            if isinstance(instruction, Kernel):
+                yield from kernels(instruction)
+
+    nodes = list(kernels(compiled.kernels[0]))
+    assert len({id(k) for k in nodes}) < len(nodes) / 5
+
+    again, _ = compiler.compile(program)
+    assert again.kernels[0] is compiled.kernels[0]
+    assert compiler.compiled.hits > 0
+
+
+def flip_if_one(context: ClassicContext, *, q):
+    if context.consume() == 1:
+        return Kernel(target=[], instructions=[cliffords_min.X(q)])
+
+
+def test_continuations_with_an_empty_target():
+    assert Kernel(target=[], instructions=()).target is None
+    assert Kernel(target="", instructions=()) == Kernel.empty()
+
+    program = Program.from_string(
+        "allocate q1:\n  allocate q2:\n    h q2\n  measure\n  ?? flip_if_one(q=q1)\nmeasure",
+        cliffords_min.instruction_set,
+    )
+    machine = local_machine_for(cliffords_min.instruction_set, create_callbacks(flip_if_one))
+    histogram = machine.eval(program, shots=100, seed=1).get_histogram()
+    # q1 is flipped whenever q2 measured 1.
+    assert set(histogram) == {(0,), (1,)}
@@ -0,0 +1,100 @@
+"""
+Tests for the BranchCachingEmulator, which reuses simulated measurement branches across shots.
+"""
+
+import pytest
+
+from qstack import Program, Kernel
+from qstack.branch_cache import BranchCachingEmulator
+from qstack.classic_processor import ClassicContext, from_callbacks
+from qstack.instruction_sets import cliffords_min
+from qstack.machine import QuantumMachine, create_callbacks
+from qstack.noise import DepolarizingNoise
+from qstack.statevector import NumpyEmulator
+
+
+def fix(context: ClassicContext, *, q):
+    m1 = context.consume()
+    m2 = context.consume()
+
+    instructions = []
+    if m2 == 1:
+        instructions.append(cliffords_min.X(q))
+    if m1 == 1:
+        instructions.append(cliffords_min.Z(q))
+
+    return Kernel(target=None, instructions=instructions)
+
+
+# Teleports |1> from q1 to q3, so the final measurement is always 1.
+TELEPORT = """
+allocate q3:
+  allocate q1:
+    x q1
+    allocate q2:
+      h q2
+      cx q2 q3
+      cx q1 q2
+      h q1
+    measure
+  measure
+  ?? fix(q=q3)
+measure"""
+
+
+def caching_machine(instruction_set, callbacks=None, **kwargs):
+    qpu = BranchCachingEmulator(NumpyEmulator(instruction_set.quantum_definitions), **kwargs)
+    return QuantumMachine(qpu=qpu, cpu=from_callbacks(callbacks))
+
+
+def test_teleport_reuses_branches():
+    program = Program.from_string(TELEPORT, cliffords_min.instruction_set)
+    machine = caching_machine(program.instruction_set, create_callbacks(fix))
+
+    histogram = machine.eval(program, shots=200).get_histogram()
+    assert dict(histogram) == {(1,): 200}
+
+    # Two random measurements give at most 4 prefixes, each simulated once.
+    assert machine.qpu.misses <= 7
+    assert machine.qpu.hits > 400
+
+
+def test_eviction_keeps_results_correct():
+    program = Program.from_string(TELEPORT, cliffords_min.instruction_set)
+    machine = caching_machine(program.instruction_set, create_callbacks(fix), max_bytes=0, max_nodes=3)
+
+    histogram = machine.eval(program, shots=100).get_histogram()
+    assert dict(histogram) == {(1,): 100}
+    assert machine.qpu.nodes <= 3
+
+
+def test_different_program_invalidates_tree():
+    flip = Program.from_string("allocate q1:\n  x q1\nmeasure", cliffords_min.instruction_set)
+    keep = Program.from_string("allocate q1:\n  z q1\nmeasure", cliffords_min.instruction_set)
+    machine = caching_machine(cliffords_min.instruction_set)
+
+    assert dict(machine.eval(flip, shots=10).get_histogram()) == {(1,): 10}
+    assert dict(machine.eval(keep, shots=10).get_histogram()) == {(0,): 10}
+
+
+def test_requires_noiseless():
+    emulator = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions, DepolarizingNoise(0.1))
+    with pytest.raises(ValueError):
+        BranchCachingEmulator(emulator)
+
+
+def test_replaced_branches_release_their_nodes():
+    first = "allocate q1:\n  h q1\nmeasure\nallocate q2:\n  h q2\nmeasure\nallocate q3:\n  {} q3\nmeasure"
+    machine = caching_machine(cliffords_min.instruction_set)
+    for gate in ("x", "z", "x"):
+        machine.eval(Program.from_string(first.format(gate), cliffords_min.instruction_set), shots=50)
+
+    def tree(node):
+        yield node
+        for child in node.children.values():
+            yield from tree(child)
+
+    nodes = list(tree(machine.qpu.root))
+    assert machine.qpu.nodes == len(nodes)
+    assert set(machine.qpu.lru) <= set(nodes)
+    assert machine.qpu.cached_bytes == sum(node.state.nbytes for node in machine.qpu.lru)
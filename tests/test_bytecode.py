@@ -0,0 +1,66 @@
+"""
+Tests for lowering programs to bytecode.
+"""
+
+import pytest
+
+from qstack import Program, Kernel
+from qstack.bytecode import Bytecode, ALLOCATE, GATE, MEASURE
+from qstack.classic_processor import ClassicContext, from_callbacks
+from qstack.instruction_sets import cliffords_min
+from qstack.machine import QuantumMachine, create_callbacks
+from qstack.stabilizer import StabilizerEmulator
+from qstack.statevector import NumpyEmulator
+
+
+def fix(context: ClassicContext, *, q):
+    m1 = context.consume()
+    m2 = context.consume()
+
+    instructions = []
+    if m2 == 1:
+        instructions.append(cliffords_min.X(q))
+    if m1 == 1:
+        instructions.append(cliffords_min.Z(q))
+
+    return Kernel(target=None, instructions=tuple(instructions))
+
+
+TELEPORT = """
+allocate q3:
+  allocate q1:
+    x q1
+    allocate q2:
+      h q2
+      cx q2 q3
+      cx q1 q2
+      h q1
+    measure
+  measure
+  ?? fix(q=q3)
+measure"""
+
+
+def test_lowering_resolves_slots():
+    program = Program.from_string(TELEPORT, cliffords_min.instruction_set)
+    qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions)
+    bytecode = Bytecode(program, qpu)
+
+    opcodes = [op for op, _, _ in bytecode.code]
+    assert opcodes == [ALLOCATE, ALLOCATE, GATE, ALLOCATE, GATE, GATE, GATE, GATE, MEASURE, MEASURE, MEASURE]
+    # cx q2 q3: q3 is the bottom of the stack, q2 the third qubit allocated.
+    assert bytecode.code[5][2] == (2, 0)
+    # The callback runs after q1 is measured, with only q3 alive.
+    assert bytecode.code[9][1].name == "fix"
+    assert bytecode.code[9][2] == (bytecode.code[0][1],)
+
+
+@pytest.mark.parametrize("emulator", [NumpyEmulator, StabilizerEmulator])
+def test_bytecode_matches_ast(emulator):
+    program = Program.from_string(TELEPORT, cliffords_min.instruction_set)
+    qpu = emulator(cliffords_min.instruction_set.quantum_definitions)
+    machine = QuantumMachine(qpu=qpu, cpu=from_callbacks(create_callbacks(fix)))
+
+    for bytecode in [True, False]:
+        histogram = machine.eval(program, shots=100, bytecode=bytecode).get_histogram()
+        assert dict(histogram) == {(1,): 100}
@@ -0,0 +1,67 @@
+"""
+Tests for the operation cache of parameterized gates.
+"""
+
+import math
+
+import numpy as np
+
+from qstack.ast import QubitId
+from qstack.cache import LRUCache, normalize_parameters
+from qstack.instruction_sets import h2, toy
+from qstack.noise import DepolarizingNoise
+from qstack.statevector import NumpyEmulator, OPERATION_CACHE
+
+
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+    assert cache.get("a", lambda: 0) == 1
+    cache.get("c", lambda: 3)
+
+    assert "b" not in cache.entries
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 3, 1)
+
+
+def test_normalized_parameters():
+    assert normalize_parameters({"theta": "1.5707963"}) == normalize_parameters({"theta": math.pi / 2})
+    assert normalize_parameters({"phi": 0, "theta": 1}) == normalize_parameters({"theta": 1.0, "phi": "0.0"})
+    assert normalize_parameters({"q": QubitId("q1")}) == (("q", QubitId("q1")),)
+
+
+def test_emulator_reuses_operations():
+    qpu = NumpyEmulator(h2.instruction_set.quantum_definitions)
+    qpu.restart(2)
+    qpu.allocate(QubitId("q1"))
+    qpu.allocate(QubitId("q2"))
+
+    hits = OPERATION_CACHE.hits
+    first = qpu.prepare(h2.U1("q1", theta=math.pi / 2, phi=0.25))
+    second = qpu.prepare(h2.U1("q1", theta="1.5707963", phi="0.25"))
+    assert first is second
+    assert OPERATION_CACHE.hits == hits + 1
+
+    qpu.eval(h2.U1("q1", theta="1.5707963", phi="0.25"))
+    assert np.isclose(np.linalg.norm(qpu.state), 1.0)
+
+
+def test_noise_channel_is_part_of_the_key():
+    noiseless = NumpyEmulator(toy.instruction_set.quantum_definitions)
+    noisy = NumpyEmulator(toy.instruction_set.quantum_definitions, DepolarizingNoise(0.1))
+
+    instruction = toy.Skew("q1", bias=0.3)
+    assert len(noiseless.prepare(instruction)) == 1
+    assert len(noisy.prepare(instruction)) > 1
+
+
+def test_gates_are_built_from_the_given_parameters():
+    # Parameters are rounded in the key only: a tiny angle is not turned into the identity.
+    OPERATION_CACHE.clear()
+    qpu = NumpyEmulator(h2.instruction_set.quantum_definitions)
+    ((matrix, _),) = qpu.prepare(h2.RZ("q1", theta=1e-8))
+    assert np.array_equal(matrix, np.array(h2.rz(1e-8)))
+    assert not np.array_equal(matrix, np.eye(2))
+
+    ((matrix, _),) = qpu.prepare(h2.RZ("q1", theta="1e-8"))
+    assert np.array_equal(matrix, np.array(h2.rz(1e-8)))
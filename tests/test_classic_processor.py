@@ -0,0 +1,80 @@
+"""
+Tests for classical callbacks, including cached pure callbacks.
+"""
+
+from qstack import Kernel, Program
+from qstack.classic_processor import ClassicContext, ClassicDefinition, from_callbacks, bit_table
+from qstack.instruction_sets import cliffords_min
+from qstack.compilers.steane import Correct_X, SteaneCompiler
+from qstack.ast import QubitId
+
+calls = []
+
+
+def flip_if_one(context: ClassicContext, *, qubit):
+    first, second = context.consume(), context.consume()
+    calls.append((qubit, first, second))
+    if first == 1:
+        return Kernel(target=None, instructions=[cliffords_min.X(qubit)])
+
+
+def run(cpu, outcomes, instruction):
+    cpu.restart()
+    for outcome in outcomes:
+        cpu.eval(None, outcome)
+    return cpu.eval(instruction, None)
+
+
+def test_pure_callbacks_are_cached():
+    calls.clear()
+    definition = ClassicDefinition.from_callback(flip_if_one, consumes=2)
+    cpu = from_callbacks({definition})
+
+    first = run(cpu, (0, 1), definition(qubit="q1"))
+    second = run(cpu, (0, 1), definition(qubit="q1"))
+    assert first is second
+    assert first.instructions == (cliffords_min.X("q1"),)
+    assert run(cpu, (1, 0), definition(qubit="q1")) is None
+    assert run(cpu, (0, 1), definition(qubit="q2")).instructions == (cliffords_min.X("q2"),)
+
+    # The callback sees the outcomes in the order it would have consumed them.
+    assert calls == [("q1", 1, 0), ("q1", 0, 1), ("q2", 1, 0)]
+    assert definition.results.hits == 1
+
+
+def test_impure_callbacks_run_every_time():
+    calls.clear()
+    definition = ClassicDefinition.from_callback(flip_if_one)
+    cpu = from_callbacks({definition})
+    for _ in range(3):
+        run(cpu, (0, 1), definition(qubit="q1"))
+    assert len(calls) == 3
+    assert definition.results is None
+
+
+def test_steane_corrections_are_precomputed():
+    qubit = QubitId("pre")
+    program = Program(
+        instruction_set=cliffords_min.instruction_set,
+        kernels=(Kernel.allocate(qubit, instructions=[cliffords_min.H(qubit)]),),
+    )
+    cpu = from_callbacks({Correct_X})
+    compiler = SteaneCompiler()
+    # Every run fills the tables again, even when the compiled kernels are reused.
+    for _ in range(2):
+        Correct_X.results.clear()
+        compiler.compile(program)
+        misses = Correct_X.results.misses
+        for outcomes in [(0, 0, 0), (1, 0, 1), (1, 1, 1)]:
+            run(cpu, outcomes, Correct_X(qubit=qubit))
+        assert Correct_X.results.misses == misses
+
+
+def test_packed_outcomes_index_bit_tables():
+    context = ClassicContext.replay((1, 0, 1, 1))
+    assert context.consume_bits(3) == 0b101
+    assert context.consume() == 1
+
+    table = bit_table(3, lambda outcome: outcome)
+    assert table[0b110] == (0, 1, 1)
+    assert len(table) == 8
@@ -0,0 +1,92 @@
+"""
+Tests for the gate-fusion pass.
+"""
+
+import math
+
+import numpy as np
+
+from qstack import Program, Kernel
+from qstack.ast import QubitId
+from qstack.compilers.cliffords2h2 import CliffordsToH2Compiler
+from qstack.compilers.fusion import FusionCompiler
+from qstack.instruction_sets import cliffords_min, h2
+from qstack.noise import DepolarizingNoise
+from qstack.statevector import NumpyEmulator
+
+
+def flatten(kernel: Kernel):
+    for inst in kernel.instructions:
+        if isinstance(inst, Kernel):
+            yield from flatten(inst)
+        else:
+            yield inst
+
+
+def final_state(instruction_set, kernel: Kernel, qubits):
+    qpu = NumpyEmulator(instruction_set.quantum_definitions)
+    qpu.restart(len(qubits))
+    for q in qubits:
+        qpu.allocate(QubitId(q))
+    for inst in flatten(kernel):
+        qpu.eval(inst)
+    return qpu.state
+
+
+def test_fused_kernel_is_equivalent():
+    gates = [
+        cliffords_min.H("q1"),
+        cliffords_min.CX("q1", "q2"),
+        cliffords_min.H("q2"),
+        cliffords_min.CX("q3", "q2"),
+        cliffords_min.Z("q1"),
+        cliffords_min.CX("q2", "q1"),
+        cliffords_min.Y("q3"),
+        cliffords_min.H("q3"),
+    ]
+    kernel, _ = CliffordsToH2Compiler().compile(
+        Program(instruction_set=cliffords_min.instruction_set, kernels=[Kernel(target=None, instructions=gates)])
+    )
+    kernel = kernel.kernels[0]
+
+    compiler = FusionCompiler(h2.instruction_set)
+    fused = compiler.compile_kernel(kernel)
+
+    original_gates = len(list(flatten(kernel)))
+    assert len(list(flatten(fused))) == original_gates - compiler.fused
+    assert len(fused.instructions) <= 5
+
+    expected = final_state(h2.instruction_set, kernel, ["q1", "q2", "q3"])
+    actual = final_state(compiler.target, fused, ["q1", "q2", "q3"])
+    assert math.isclose(abs(np.vdot(expected, actual)), 1.0, abs_tol=1e-6)
+
+
+def test_inverse_gates_cancel():
+    kernel = Kernel(target=None, instructions=[cliffords_min.H("q1"), cliffords_min.H("q1")])
+    fused = FusionCompiler(cliffords_min.instruction_set).compile_kernel(kernel)
+    assert fused.instructions == ()
+
+
+def test_measured_kernels_are_barriers():
+    program = Program.from_string(
+        """
+allocate q1:
+  h q1
+  allocate q2:
+    h q1
+  measure
+  h q1
+measure""",
+        cliffords_min.instruction_set,
+    )
+    compiled, _ = FusionCompiler(cliffords_min.instruction_set).compile(program)
+
+    instructions = compiled.kernels[0].instructions
+    assert [inst.name for inst in instructions if not isinstance(inst, Kernel)] == ["h", "h"]
+    assert [inst.name for inst in instructions[1].instructions] == ["h"]
+
+
+def test_noise_disables_fusion():
+    kernel = Kernel(target=None, instructions=[cliffords_min.H("q1"), cliffords_min.X("q1")])
+    fused = FusionCompiler(cliffords_min.instruction_set, DepolarizingNoise(0.01)).compile_kernel(kernel)
+    assert [inst.name for inst in fused.instructions] == ["h", "x"]
@@ -0,0 +1,183 @@
+"""
+Tests for the QuantumMachine execution modes.
+"""
+
+import pytest
+
+from qstack import Program, Kernel, ClassicInstruction
+from qstack.classic_processor import ClassicContext
+from qstack.emulator import from_instruction_set
+from qstack.instruction_sets import cliffords_min, toy
+from qstack.machine import QuantumMachine, create_callbacks, local_machine_for
+from qstack.classic_processor import from_callbacks
+from qstack.noise import DepolarizingNoise, NoiselessChannel
+from qstack.statevector import NumpyEmulator
+
+
+def repeat_until_zero(context: ClassicContext):
+    """
+    Keeps re-running the bell pair until the first qubit is measured as 0.
+    """
+    m = context.consume()
+    if m == 1:
+        return Kernel.allocate(
+            "q1",
+            "q2",
+            instructions=[toy.Mix("q1"), toy.Entangle("q1", "q2")],
+            callback=ClassicInstruction("repeat_until_zero", parameters={}),
+        )
+
+
+BELL = """
+allocate q1:
+  h q1
+  allocate q2:
+    cx q1 q2
+  measure
+measure"""
+
+REPEAT_UNTIL_ZERO = """
+@instruction-set: toy
+
+allocate q1:
+  mix q1
+  allocate q2:
+    entangle q1 q2
+  measure
+measure
+?? repeat_until_zero
+"""
+
+
+def machine_for(instruction_set, callbacks=None):
+    return QuantumMachine(qpu=from_instruction_set(instruction_set), cpu=from_callbacks(callbacks))
+
+
+def test_batched_bell():
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    machine = machine_for(program.instruction_set)
+
+    histogram = machine.eval(program, shots=500, batched=True).get_histogram()
+    assert set(histogram.keys()) == {(0, 0), (1, 1)}
+    assert sum(histogram.values()) == 500
+
+
+def test_batched_continuations():
+    """
+    Shots whose callbacks return a continuation are regrouped into sub-batches.
+    """
+    program = Program.from_string(REPEAT_UNTIL_ZERO)
+    machine = machine_for(program.instruction_set, create_callbacks(repeat_until_zero))
+
+    results = machine.eval(program, shots=500, batched=True)
+    assert results.shots == 500
+    for outcome in results.data:
+        assert outcome[-1] == 0
+        assert all(m == 1 for m in outcome[:-1])
+    assert any(len(outcome) > 1 for outcome in results.data)
+
+
+def test_batched_requires_support():
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    machine = local_machine_for(program.instruction_set)
+
+    with pytest.raises(NotImplementedError):
+        machine.eval(program, shots=10, batched=True)
+
+
+def numpy_machine_for(instruction_set, callbacks=None, noise=None):
+    qpu = NumpyEmulator(instruction_set.quantum_definitions, noise or NoiselessChannel(), seed=7)
+    return QuantumMachine(qpu=qpu, cpu=from_callbacks(callbacks))
+
+
+def test_sampled_bell():
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    machine = numpy_machine_for(program.instruction_set)
+
+    histogram = machine.eval(program, shots=1000, sample=True).get_histogram()
+    assert set(histogram.keys()) == {(0, 0), (1, 1)}
+    assert 400 < histogram[(0, 0)] < 600
+
+
+def test_sampling_is_automatic_without_callbacks(monkeypatch):
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    machine = numpy_machine_for(program.instruction_set)
+
+    def fail(program):
+        raise AssertionError("shots should be sampled")
+
+    monkeypatch.setattr(machine, "single_shot", fail)
+    assert machine.eval(program, shots=100).shots == 100
+
+
+def test_sampled_slot_reuse():
+    """
+    Qubits released by one kernel are kept alive, so the next kernel gets a fresh slot.
+    """
+    program = Program.from_string(
+        "allocate q1:\n  x q1\nmeasure\nallocate q1:\n  h q1\n  h q1\nmeasure", cliffords_min.instruction_set
+    )
+    machine = numpy_machine_for(program.instruction_set)
+
+    assert dict(machine.eval(program, shots=50).get_histogram()) == {(1, 0): 50}
+
+
+def test_sampling_falls_back():
+    """
+    Feed-forward programs and noisy QPUs run shot by shot unless sampling is forced.
+    """
+    program = Program.from_string(REPEAT_UNTIL_ZERO)
+    machine = numpy_machine_for(program.instruction_set, create_callbacks(repeat_until_zero))
+    assert all(outcome[-1] == 0 for outcome in machine.eval(program, shots=50).data)
+    with pytest.raises(ValueError):
+        machine.eval(program, shots=50, sample=True)
+
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    machine = numpy_machine_for(program.instruction_set, noise=DepolarizingNoise(0.01))
+    assert machine.eval(program, shots=50).shots == 50
+    with pytest.raises(ValueError):
+        machine.eval(program, shots=50, sample=True)
+
+
+def test_seeded_runs_do_not_depend_on_workers():
+    program = Program.from_string(REPEAT_UNTIL_ZERO)
+    machine = numpy_machine_for(program.instruction_set, create_callbacks(repeat_until_zero))
+
+    serial = machine.eval(program, shots=600, seed=42)
+    assert serial.data == machine.eval(program, shots=600, seed=42).data
+    assert serial.data == machine.eval(program, shots=600, seed=42, workers=3).data
+    assert serial.data != machine.eval(program, shots=600, seed=43).data
+
+
+def test_seeded_stabilizer_runs():
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    machine = local_machine_for(program.instruction_set)
+
+    results = machine.eval(program, shots=300, seed=7, workers=2)
+    assert results.data == machine.eval(program, shots=300, seed=7).data
+    assert set(results.get_histogram().keys()) == {(0, 0), (1, 1)}
+
+
+def test_long_feed_forward_loops_do_not_recurse():
+    """
+    Each retry replaces the finished kernel, so loops longer than the recursion limit still run.
+    """
+    import sys
+
+    def count_down(context: ClassicContext, *, n):
+        context.consume()
+        if int(n) > 0:
+            return Kernel.allocate(
+                "q1", instructions=[], callback=ClassicInstruction("count_down", parameters={"n": int(n) - 1})
+            )
+
+    program = Program.from_string("allocate q1:\nmeasure\n?? count_down(n=1500)", cliffords_min.instruction_set)
+    callbacks = create_callbacks(count_down)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(200)
+    try:
+        for options in [{"bytecode": True}, {"bytecode": False}, {"batched": True}]:
+            machine = numpy_machine_for(program.instruction_set, callbacks)
+            assert machine.eval(program, shots=2, **options).shots == 2
+    finally:
+        sys.setrecursionlimit(limit)
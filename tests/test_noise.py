@@ -0,0 +1,75 @@
+"""
+Tests for noise-channel compilation.
+"""
+
+import numpy as np
+
+from qstack.instruction_sets import cliffords_min
+from qstack.noise import (
+    ComposedNoise,
+    DepolarizingNoise,
+    NoiseChannel,
+    PauliNoise,
+    choi_matrix,
+    compile_channel,
+    minimal_kraus,
+)
+
+
+class RedundantNoise(NoiseChannel):
+    """Bit-flip noise split over duplicated Kraus operators."""
+
+    def get_kraus_matrices(self, quantum_def):
+        x = np.array([[0, 1], [1, 0]])
+        return [np.sqrt(0.45) * np.eye(2), np.sqrt(0.45) * np.eye(2), np.sqrt(0.05) * x, np.sqrt(0.05) * x]
+
+
+def test_minimal_kraus_is_equivalent():
+    kraus = RedundantNoise().get_kraus_matrices(cliffords_min.X)
+    minimal = minimal_kraus(kraus)
+
+    assert len(minimal) == 2
+    assert np.allclose(choi_matrix(minimal), choi_matrix(kraus))
+    assert np.allclose(sum(K.conj().T @ K for K in minimal), np.eye(2))
+
+
+def test_composed_channels():
+    channel = ComposedNoise(PauliNoise(0.1), PauliNoise(0.2))
+    kraus = channel.get_kraus_matrices(cliffords_min.X)
+    assert len(kraus) == 4
+
+    products = [
+        B @ A
+        for B in PauliNoise(0.2).get_kraus_matrices(cliffords_min.X)
+        for A in PauliNoise(0.1).get_kraus_matrices(cliffords_min.X)
+    ]
+    assert np.allclose(choi_matrix(kraus), choi_matrix(products))
+
+
+def test_compile_channel_is_cached():
+    channel = RedundantNoise()
+    assert len(compile_channel(channel, cliffords_min.X)) == 2
+    assert compile_channel(channel, cliffords_min.X) is compile_channel(channel, cliffords_min.X)
+
+    # Depolarizing operators are already minimal and are kept as they are.
+    depolarizing = DepolarizingNoise(0.1)
+    assert len(compile_channel(depolarizing, cliffords_min.CX)) == 13
+
+
+def test_compile_channel_is_keyed_on_value():
+    # Equal channels share their operators, composed channels included.
+    assert compile_channel(DepolarizingNoise(0.01), cliffords_min.X) is compile_channel(
+        DepolarizingNoise(0.01), cliffords_min.X
+    )
+    composed = ComposedNoise(DepolarizingNoise(0.01), PauliNoise(0.02))
+    assert compile_channel(composed, cliffords_min.X) is compile_channel(
+        ComposedNoise(DepolarizingNoise(0.01), PauliNoise(0.02)), cliffords_min.X
+    )
+
+    # A changed channel gets new operators.
+    channel = DepolarizingNoise(0.01)
+    before = compile_channel(channel, cliffords_min.X)
+    channel.error_probability = 0.2
+    after = compile_channel(channel, cliffords_min.X)
+    assert not np.allclose(choi_matrix(before), choi_matrix(after))
+    assert np.allclose(choi_matrix(after), choi_matrix(compile_channel(DepolarizingNoise(0.2), cliffords_min.X)))
@@ -0,0 +1,129 @@
+"""
+Tests for the Clifford peephole optimizer.
+"""
+
+import numpy as np
+
+from qstack import Program, Kernel
+from qstack.ast import QubitId
+from qstack.compilers.peephole import CliffordOptimizer
+from qstack.compilers.rep3_trivial import TrivialRepetitionCompiler
+from qstack.instruction_sets import cliffords_min
+from qstack.machine import local_machine_for
+from qstack.statevector import NumpyEmulator
+
+X, Y, Z, S, H, CX, CZ = (
+    cliffords_min.X,
+    cliffords_min.Y,
+    cliffords_min.Z,
+    cliffords_min.S,
+    cliffords_min.H,
+    cliffords_min.CX,
+    cliffords_min.CZ,
+)
+
+
+def optimize(*gates):
+    optimizer = CliffordOptimizer()
+    kernel = optimizer.compile_kernel(Kernel(target=None, instructions=gates))
+    return kernel.instructions, optimizer.removed
+
+
+def unitary(gates, qubits=("q1", "q2", "q3")):
+    """The unitary of `gates`, column by column."""
+    columns = []
+    for basis in range(2 ** len(qubits)):
+        qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions, dynamic=False)
+        qpu.restart(len(qubits))
+        for q in qubits:
+            qpu.allocate(QubitId(q))
+        qpu.state = np.zeros_like(qpu.state)
+        qpu.state.reshape(-1)[basis] = 1
+        for gate in gates:
+            qpu.eval(gate)
+        columns.append(qpu.state.reshape(-1).copy())
+    return np.array(columns).T
+
+
+def equal_up_to_phase(a, b):
+    index = np.unravel_index(np.argmax(abs(a)), a.shape)
+    return np.allclose(a * (b[index] / a[index]), b, atol=1e-3)
+
+
+def test_cancelling_pairs():
+    assert optimize(H("q1"), H("q1")) == ((), 2)
+    assert optimize(X("q1"), X("q1")) == ((), 2)
+    assert optimize(CX("q1", "q2"), CX("q1", "q2")) == ((), 2)
+    assert optimize(CZ("q1", "q2"), CZ("q2", "q1")) == ((), 2)
+    assert optimize(CX("q1", "q2"), CX("q2", "q1")) == ((CX("q1", "q2"), CX("q2", "q1")), 0)
+
+
+def test_merges():
+    assert optimize(S("q1"), S("q1")) == ((Z("q1"),), 1)
+    assert optimize(X("q1"), Z("q1"), Y("q1")) == ((), 3)
+
+
+def test_commutation():
+    # Z on the control and X on the target commute with the CX between them.
+    assert optimize(Z("q1"), X("q2"), CX("q1", "q2"), X("q2"), Z("q1")) == ((CX("q1", "q2"),), 4)
+    # H on the control does not.
+    assert optimize(H("q1"), CX("q1", "q2"), H("q1"))[1] == 0
+    # CX gates sharing a control commute.
+    assert optimize(CX("q1", "q2"), CX("q1", "q3"), CX("q1", "q2")) == ((CX("q1", "q3"),), 2)
+
+
+def test_optimized_circuits_are_equivalent():
+    gates = [H, X, Y, Z, S]
+    rng = np.random.default_rng(3)
+    qubits = ["q1", "q2", "q3"]
+    for _ in range(30):
+        circuit = []
+        for _ in range(12):
+            if rng.random() < 0.3:
+                a, b = rng.choice(qubits, 2, replace=False)
+                circuit.append([CX, CZ][rng.integers(2)](a, b))
+            else:
+                circuit.append(gates[rng.integers(len(gates))](rng.choice(qubits)))
+        optimized, _ = optimize(*circuit)
+        assert equal_up_to_phase(unitary(circuit), unitary(optimized))
+
+
+def test_kernels_are_boundaries():
+    program = Program.from_string(
+        """
+allocate q1:
+  h q1
+  allocate q2:
+    h q1
+  measure
+  x q1
+  x q1
+measure""",
+        cliffords_min.instruction_set,
+    )
+    optimizer = CliffordOptimizer()
+    compiled, _ = optimizer.compile(program)
+    outer = compiled.kernels[0]
+    assert [str(i) for i in outer.instructions if not isinstance(i, Kernel)] == ["h q1"]
+    assert optimizer.removed == 2
+
+
+def test_removed_counts_repeated_kernels():
+    twice = "allocate q2:\n  h q2\n  h q2\nmeasure"
+    program = Program.from_string(f"{twice}\n{twice}", cliffords_min.instruction_set)
+    optimizer = CliffordOptimizer()
+    optimizer.compile(program)
+    assert optimizer.removed == 4
+    optimizer.compile(program)
+    assert optimizer.removed == 8
+
+
+def test_repetition_code_output():
+    program = Program.from_string("allocate q1:\n  x q1\n  x q1\n  h q1\nmeasure", cliffords_min.instruction_set)
+    compiled, callbacks = TrivialRepetitionCompiler().compile(program)
+    optimizer = CliffordOptimizer()
+    optimized, callbacks = optimizer.compile(compiled, callbacks)
+    assert optimizer.removed == 6
+
+    machine = local_machine_for(optimized.instruction_set, callbacks)
+    assert set(machine.eval(optimized, shots=50).get_histogram()) <= {(0,), (1,)}
@@ -0,0 +1,77 @@
+"""
+Tests for compiler pipelines.
+"""
+
+import pytest
+
+from qstack import Program, Kernel, ClassicInstruction
+from qstack.classic_processor import ClassicContext
+from qstack.compilers.cliffords2h2 import CliffordsToH2Compiler
+from qstack.compilers.rep3_trivial import TrivialRepetitionCompiler
+from qstack.compilers.steane import SteaneCompiler
+from qstack.compilers.toy2cliffords import ToyCompiler
+from qstack.instruction_sets import toy
+from qstack.machine import create_callbacks, local_machine_for
+from qstack.pipeline import Pipeline
+
+PROGRAM = """
+@instruction-set: toy
+
+allocate q1:
+  flip q1
+  mix q1
+measure
+?? retry
+"""
+
+
+def retry(context: ClassicContext):
+    if context.consume() == 0:
+        return Kernel.allocate("q1", instructions=[toy.Mix("q1")], callback=ClassicInstruction("retry", parameters={}))
+    context.collect(1)
+
+
+def compile_in_sequence(stages, program, callbacks):
+    for stage in stages:
+        program, callbacks = stage.compile(program, callbacks)
+    return program, callbacks
+
+
+@pytest.mark.parametrize(
+    "stages",
+    [
+        [ToyCompiler, CliffordsToH2Compiler],
+        [ToyCompiler, TrivialRepetitionCompiler, SteaneCompiler],
+    ],
+)
+def test_pipeline_matches_sequential_compilation(stages):
+    program = Program.from_string(PROGRAM)
+    callbacks = create_callbacks(retry)
+
+    expected, expected_callbacks = compile_in_sequence([stage() for stage in stages], program, callbacks)
+    compiled, compiled_callbacks = Pipeline(*[stage() for stage in stages]).compile(program, callbacks)
+
+    assert str(compiled) == str(expected)
+    assert compiled.instruction_set == expected.instruction_set
+    assert {d.name for d in compiled_callbacks} == {d.name for d in expected_callbacks}
+
+
+def test_pipeline_runs_continuations():
+    program = Program.from_string(PROGRAM)
+    stages = [ToyCompiler, TrivialRepetitionCompiler, SteaneCompiler]
+
+    histograms = []
+    for compiled, callbacks in [
+        compile_in_sequence([stage() for stage in stages], program, create_callbacks(retry)),
+        Pipeline(*[stage() for stage in stages]).compile(program, create_callbacks(retry)),
+    ]:
+        machine = local_machine_for(compiled.instruction_set, callbacks)
+        histograms.append(machine.eval(compiled, shots=10, seed=5).get_histogram())
+
+    # The callback retries until it reads a 1.
+    assert histograms[0] == histograms[1] == {(1,): 10}
+
+
+def test_pipeline_rejects_incompatible_stages():
+    with pytest.raises(ValueError):
+        Pipeline(CliffordsToH2Compiler(), ToyCompiler())
@@ -0,0 +1,124 @@
+"""
+Tests for profiled runs of the QuantumMachine.
+"""
+
+import pickle
+
+from qstack import Program, Kernel, ClassicInstruction, QuantumMachine
+from qstack.classic_processor import ClassicContext, from_callbacks
+from qstack.instruction_sets import cliffords_min, toy
+from qstack.machine import create_callbacks, local_machine_for
+from qstack.profiling import Stats
+from qstack.statevector import NumpyEmulator
+
+BELL = """
+allocate q1:
+  h q1
+  allocate q2:
+    cx q1 q2
+  measure
+measure"""
+
+RETRY = """
+@instruction-set: toy
+
+allocate q1:
+  mix q1
+measure
+?? retry_until_zero
+"""
+
+
+def retry_until_zero(context: ClassicContext):
+    if context.consume() == 1:
+        return Kernel.allocate(
+            "q1", instructions=[toy.Mix("q1")], callback=ClassicInstruction("retry_until_zero", parameters={})
+        )
+
+
+def test_profile_counts_gates_and_measurements():
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    machine = local_machine_for(program.instruction_set)
+
+    results = machine.eval(program, shots=20, sample=False, profile=True)
+    stats = results.stats
+    assert stats.shots == 20
+    assert stats.gate_counts == {"h": 20, "cx": 20}
+    assert stats.allocations_per_shot == 2
+    assert stats.measurements_per_shot == 2
+    assert stats.continuations == 0
+    assert stats.gate_time["h"] > 0
+
+
+def test_profile_is_opt_in():
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    machine = local_machine_for(program.instruction_set)
+    assert machine.eval(program, shots=5).stats is None
+
+
+def test_profile_tracks_callbacks_and_continuations():
+    program = Program.from_string(RETRY)
+    machine = local_machine_for(toy.instruction_set, create_callbacks(retry_until_zero))
+
+    for bytecode in (True, False):
+        stats = machine.eval(program, shots=50, bytecode=bytecode, seed=1, profile=True).stats
+        assert stats.callback_counts["retry_until_zero"] == 50 + stats.continuations
+        assert stats.continuations > 0
+        assert stats.max_continuation_depth >= 1
+        assert stats.gate_counts["mix"] == 50 + stats.continuations
+
+
+def three_times(context: ClassicContext):
+    return Kernel(target=None, instructions=[cliffords_min.X("q1")])
+
+
+def test_continuation_depth_counts_nesting():
+    call = Kernel.continue_with(ClassicInstruction("three_times", parameters={}))
+    program = Program(
+        instruction_set=cliffords_min.instruction_set,
+        kernels=(Kernel.allocate("q1", instructions=[call, call, call]),),
+    )
+    qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions)
+    machine = QuantumMachine(qpu=qpu, cpu=from_callbacks(create_callbacks(three_times)))
+
+    for options in ({"bytecode": True}, {"bytecode": False}, {"batched": True}):
+        results = machine.eval(program, shots=5, sample=False, profile=True, **options)
+        assert results.get_histogram() == {(1,): 5}
+        assert results.stats.continuations == 15
+        assert results.stats.max_continuation_depth == 1
+
+
+def test_profile_runs_combined_moments():
+    moment = Kernel(target=None, instructions=[cliffords_min.CX("a", "b"), cliffords_min.CX("c", "d")])
+    program = Program(
+        instruction_set=cliffords_min.instruction_set,
+        kernels=(Kernel.allocate("a", "b", "c", "d", instructions=[cliffords_min.X("a"), moment]),),
+    )
+    qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions)
+    machine = QuantumMachine(qpu=qpu, cpu=from_callbacks(None))
+
+    results = machine.eval(program, shots=5, sample=False, profile=True)
+    assert results.get_histogram() == {(0, 0, 1, 1): 5}
+    # The two CX of the moment run as one operation, as they do without profiling.
+    assert results.stats.gate_counts == {"x": 5, "cx+cx": 5}
+
+
+def test_profile_merges_worker_stats():
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    machine = local_machine_for(program.instruction_set)
+
+    stats = machine.eval(program, shots=600, sample=False, workers=2, seed=7, profile=True).stats
+    assert stats.shots == 600
+    assert stats.gate_counts == {"h": 600, "cx": 600}
+    assert stats.measurements == 1200
+
+
+def test_stats_merge_and_pickle():
+    a, b = Stats(), Stats()
+    a.gate_counts["h"] = 2
+    b.gate_counts["h"] = 3
+    b.max_continuation_depth = 4
+    merged = pickle.loads(pickle.dumps(a.merge(b)))
+    assert merged.gate_counts["h"] == 5
+    assert merged.max_continuation_depth == 4
+    assert "gate h: 5" in str(merged)
@@ -0,0 +1,89 @@
+"""
+Tests for the bit-packed Results storage.
+"""
+
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from qstack.machine import Results
+
+RAGGED = [(1, 0, 1), (0,), (), (1, 1, 0, 1, 0, 0, 1), (0,), (1, 0, 1), tuple([1, 0] * 40)]
+
+
+def test_round_trip():
+    results = Results(RAGGED)
+    assert results.shots == len(RAGGED)
+    assert results.data == RAGGED
+    assert not results.uniform
+    # 80 outcomes span two words.
+    assert results.offsets[-1] - results.offsets[-2] == 2
+
+
+def test_histogram_matches_counter():
+    rng = np.random.default_rng(0)
+    bits = rng.integers(0, 2, size=(2000, 7))
+    results = Results.from_bits(bits)
+
+    expected = Counter(tuple(row) for row in bits.tolist())
+    assert dict(results.get_histogram()) == dict(expected)
+    assert dict(Results(RAGGED).get_histogram()) == dict(Counter(RAGGED))
+
+
+def test_bits_and_marginals():
+    results = Results([(1, 0, 1), (0, 0, 1), (1, 1, 0)])
+    assert results.bits().tolist() == [[1, 0, 1], [0, 0, 1], [1, 1, 0]]
+    assert results.bit(-1).tolist() == [1, 1, 0]
+    assert dict(results.marginal(0, 2).get_histogram()) == {(1, 1): 1, (0, 1): 1, (1, 0): 1}
+
+    # Negative positions are relative to the end of each shot, whatever its length.
+    ragged = Results([(1, 1, 0), (1,), (0, 1)])
+    assert ragged.bit(-1).tolist() == [0, 1, 1]
+    with pytest.raises(IndexError):
+        ragged.bit(2)
+    with pytest.raises(ValueError):
+        ragged.bits()
+
+
+def test_concatenate():
+    parts = [Results(RAGGED[:3]), Results.from_bits(np.array([[1, 0], [0, 1]])), Results(RAGGED[3:])]
+    assert Results.concatenate(parts).data == RAGGED[:3] + [(1, 0), (0, 1)] + RAGGED[3:]
+
+
+def test_only_bits():
+    with pytest.raises(ValueError):
+        Results([(0, 2)])
+
+
+def test_save_append_and_load(tmp_path):
+    from qstack import Program
+    from qstack.instruction_sets import cliffords_min
+    from qstack.noise import DepolarizingNoise
+
+    program = Program.from_string("allocate q1:\n  x q1\nmeasure", cliffords_min.instruction_set)
+    path = str(tmp_path / "run")
+
+    Results(RAGGED).save(path, program=program, noise=DepolarizingNoise(0.01), seed=1)
+    Results.from_bits(np.array([[1, 0], [0, 1]])).save(path, append=True, program=program, seed=2)
+
+    loaded = Results.load(path)
+    assert isinstance(loaded.words, np.memmap)
+    assert loaded.data == RAGGED + [(1, 0), (0, 1)]
+    assert dict(loaded.get_histogram()) == dict(Counter(RAGGED + [(1, 0), (0, 1)]))
+
+    assert loaded.metadata["shots"] == len(RAGGED) + 2
+    assert loaded.metadata["instruction_set"] == "cliffords-min"
+    assert [run["seed"] for run in loaded.metadata["runs"]] == [1, 2]
+    assert loaded.metadata["runs"][0]["noise"] == {"type": "DepolarizingNoise", "error_probability": 0.01}
+
+    other = Program.from_string("allocate q1:\n  h q1\nmeasure", cliffords_min.instruction_set)
+    with pytest.raises(ValueError):
+        Results(RAGGED).save(path, append=True, program=other)
+
+
+def test_chunked_histogram(monkeypatch):
+    from qstack import results
+
+    monkeypatch.setattr(results, "HISTOGRAM_CHUNK", 3)
+    assert dict(Results(RAGGED).get_histogram()) == dict(Counter(RAGGED))
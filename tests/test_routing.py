@@ -0,0 +1,185 @@
+"""
+Tests for the connectivity-aware routing pass.
+"""
+
+from qstack import Program, Kernel, QuantumMachine, ClassicInstruction
+from qstack.ast import QubitId
+from qstack.classic_processor import from_callbacks
+from qstack.compilers.routing import RoutingCompiler, line, grid
+from qstack.compilers.steane import SteaneCompiler
+from qstack.instruction_sets import cliffords_min
+from qstack.machine import local_machine_for, create_callbacks
+from qstack.pipeline import Pipeline
+from qstack.compilers.peephole import CliffordOptimizer
+from qstack.statevector import NumpyEmulator
+
+FAR = """
+allocate q1:
+  h q1
+  allocate q2:
+    allocate q3:
+      allocate q4:
+        cx q1 q4
+        cx q1 q3
+        x q2
+      measure
+    measure
+  measure
+measure"""
+
+LOGICAL_CX = """
+allocate q1:
+  h q1
+  allocate q2:
+    cx q1 q2
+  measure
+measure"""
+
+
+def two_qubit_sites(kernel: Kernel, stack: list[QubitId]):
+    """The sites of every two-qubit gate of `kernel`, allocated on top of `stack`."""
+    if kernel.target:
+        stack = stack + [kernel.target]
+    for inst in kernel.instructions:
+        if isinstance(inst, Kernel):
+            yield from two_qubit_sites(inst, stack)
+        elif len(inst.targets) == 2:
+            yield tuple(stack.index(q) for q in inst.targets)
+
+
+def kernels(kernel: Kernel):
+    """`kernel` and its sub-kernels, with repetitions."""
+    yield kernel
+    for inst in kernel.instructions:
+        if isinstance(inst, Kernel):
+            yield from kernels(inst)
+
+
+def gate_count(program: Program) -> int:
+    return sum(
+        not isinstance(inst, Kernel) for kernel in program.kernels for k in kernels(kernel) for inst in k.instructions
+    )
+
+
+def coupled(program: Program, coupling) -> bool:
+    edges = {frozenset(edge) for edge in coupling}
+    return all(frozenset(sites) in edges for kernel in program.kernels for sites in two_qubit_sites(kernel, []))
+
+
+def histogram(program: Program, seed: int = 3):
+    qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions)
+    machine = QuantumMachine(qpu=qpu, cpu=from_callbacks(None))
+    return machine.eval(program, shots=200, sample=False, seed=seed).get_histogram()
+
+
+def test_routed_program_is_coupled_and_runs_the_same():
+    program = Program.from_string(FAR, cliffords_min.instruction_set)
+    compiler = RoutingCompiler(cliffords_min.instruction_set, line(4))
+    routed, _ = compiler.compile(program)
+
+    assert not coupled(program, line(4))
+    assert coupled(routed, line(4))
+    assert compiler.swaps > 0
+    assert histogram(routed) == histogram(program)
+
+
+def test_lookahead_reuses_swaps():
+    program = Program.from_string(FAR, cliffords_min.instruction_set)
+    compiler = RoutingCompiler(cliffords_min.instruction_set, line(4))
+    compiler.compile(program)
+    # q1 moves next to q4 with 2 SWAPs, where it also neighbours q3; both are undone.
+    assert compiler.swaps == 4
+
+
+def test_coupled_program_is_unchanged():
+    program = Program.from_string(FAR, cliffords_min.instruction_set)
+    all_to_all = [(a, b) for a in range(4) for b in range(a + 1, 4)]
+    compiler = RoutingCompiler(cliffords_min.instruction_set, all_to_all)
+    routed, _ = compiler.compile(program)
+    assert routed == program
+    assert compiler.swaps == 0
+
+
+def test_sites_are_reused_after_measurement():
+    program = Program.from_string(LOGICAL_CX, cliffords_min.instruction_set)
+    compiled, _ = SteaneCompiler().compile(program)
+
+    # 14 data qubits and 3 ancillas at most are live at once.
+    compiler = RoutingCompiler(cliffords_min.instruction_set, grid(3, 6))
+    routed, _ = compiler.compile(compiled)
+    assert coupled(routed, grid(3, 6))
+
+    try:
+        RoutingCompiler(cliffords_min.instruction_set, grid(4, 4)).compile(compiled)
+    except ValueError as e:
+        assert "sites" in str(e)
+    else:
+        assert False, "Expected the device to be too small."
+
+
+def test_routed_steane_program_with_continuations():
+    program = Program.from_string(LOGICAL_CX, cliffords_min.instruction_set)
+    steane = SteaneCompiler()
+    compiled, callbacks = steane.compile(program)
+    router = RoutingCompiler(cliffords_min.instruction_set, grid(3, 6))
+    translate = router.translate
+    translated = []
+    router.translate = lambda kernel, scope: translated.append(kernel) or translate(kernel, scope)
+    routed, callbacks = router.compile(compiled, callbacks)
+
+    # Repeated kernels are routed once; each gate needs at most 6 SWAPs on the 3x6 grid, undone after
+    # the run, and each SWAP is 3 CXs.
+    assert len(translated) <= len({k for kernel in compiled.kernels for k in kernels(kernel)})
+    pairs = sum(1 for kernel in compiled.kernels for _ in two_qubit_sites(kernel, []))
+    assert router.swaps <= 2 * 6 * pairs
+    assert gate_count(routed) == gate_count(compiled) + 3 * router.swaps
+
+    machine = local_machine_for(cliffords_min.instruction_set, callbacks)
+    results = machine.eval(routed, shots=10, sample=False, seed=1)
+    for outcome in results.get_histogram():
+        # The logical qubits of a Bell pair agree.
+        assert outcome[0] == outcome[1]
+
+
+def cont(context):
+    return Kernel(target=None, instructions=[cliffords_min.CX("a", "b")])
+
+
+def test_continuations_are_routed_on_their_call_site():
+    # The same continuation runs with z between a and b, then with a and b alone.
+    call = Kernel.continue_with(ClassicInstruction("cont"))
+    x = cliffords_min.X("a")
+    three = Kernel.allocate("a", "z", "b", instructions=[x, call])
+    two = Kernel.allocate("a", "b", instructions=[x, call])
+    program = Program(instruction_set=cliffords_min.instruction_set, kernels=(three, two))
+
+    for compiler in (
+        RoutingCompiler(cliffords_min.instruction_set, line(4)),
+        Pipeline(CliffordOptimizer(), RoutingCompiler(cliffords_min.instruction_set, line(4))),
+    ):
+        routed, callbacks = compiler.compile(program, create_callbacks(cont))
+        machine = local_machine_for(cliffords_min.instruction_set, callbacks)
+        for bytecode in (True, False):
+            results = machine.eval(routed, shots=5, sample=False, bytecode=bytecode)
+            assert results.get_histogram() == {(1, 0, 1, 1, 1): 5}
+
+
+def test_swaps_count_repeated_kernels():
+    # The second copy of the kernel, and the program compiled again, come from the memo.
+    program = Program.from_string(FAR, cliffords_min.instruction_set)
+    repeated = Program(instruction_set=program.instruction_set, kernels=program.kernels * 2)
+    compiler = RoutingCompiler(cliffords_min.instruction_set, line(4))
+    compiler.compile(repeated)
+    assert compiler.swaps == 8
+    compiler.compile(program)
+    assert compiler.swaps == 12
+
+
+def test_routed_continuations_print_and_parse():
+    call = Kernel.continue_with(ClassicInstruction("cont"))
+    program = Program(
+        instruction_set=cliffords_min.instruction_set,
+        kernels=(Kernel.allocate("a", "z", "b", instructions=[cliffords_min.X("a"), call]),),
+    )
+    routed, _ = RoutingCompiler(cliffords_min.instruction_set, line(4)).compile(program, create_callbacks(cont))
+    assert Program.from_string(str(routed), cliffords_min.instruction_set) == routed
@@ -0,0 +1,78 @@
+"""
+Tests for the ASAP/ALAP scheduling pass.
+"""
+
+from qstack import Program, Kernel, QuantumMachine
+from qstack.ast import QubitId
+from qstack.bytecode import Bytecode
+from qstack.classic_processor import from_callbacks
+from qstack.compilers.scheduling import SchedulingCompiler, moments, circuit_depth
+from qstack.compilers.steane import SteaneCompiler, z_syndrome_extraction
+from qstack.instruction_sets import cliffords_min
+from qstack.statevector import NumpyEmulator
+
+GHZ = """
+allocate q1:
+  h q1
+  allocate q2:
+    h q2
+    allocate q3:
+      h q3
+      cx q1 q2
+      cx q2 q3
+      x q1
+      x q2
+      h q3
+    measure
+  measure
+measure"""
+
+
+def innermost(kernel: Kernel) -> Kernel:
+    while isinstance(kernel.instructions[0], Kernel):
+        kernel = kernel.instructions[0]
+    return kernel
+
+
+def test_syndrome_round_moments():
+    gates = innermost(z_syndrome_extraction(QubitId("s"))).instructions
+    assert len(gates) == 12
+
+    layers = moments(gates)
+    assert len(layers) < 12
+    assert sum(len(layer) for layer in layers) == 12
+    for layer in layers:
+        qubits = [q for gate in layer for q in gate.targets]
+        assert len(qubits) == len(set(qubits))
+    assert len(moments(gates, alap=True)) == len(layers)
+
+
+def test_asap_and_alap_placement():
+    gates = [cliffords_min.H("a"), cliffords_min.CX("b", "c"), cliffords_min.CX("a", "b")]
+    assert moments(gates) == [(gates[0], gates[1]), (gates[2],)]
+
+    # A gate with slack moves to the end with ALAP.
+    gates = [cliffords_min.H("c"), cliffords_min.CX("a", "b"), cliffords_min.CX("b", "a")]
+    assert moments(gates, alap=True) == [(gates[1],), (gates[0], gates[2])]
+
+
+def test_scheduled_program_runs_the_same():
+    program = Program.from_string(GHZ, cliffords_min.instruction_set)
+    scheduled, _ = SchedulingCompiler(cliffords_min.instruction_set).compile(program)
+    assert circuit_depth(scheduled.kernels[0]) == circuit_depth(program.kernels[0]) == 5
+
+    histograms = []
+    for p in (program, scheduled):
+        qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions)
+        machine = QuantumMachine(qpu=qpu, cpu=from_callbacks(None))
+        histograms.append(machine.eval(p, shots=200, sample=False, seed=3).get_histogram())
+    assert histograms[0] == histograms[1]
+
+
+def test_moments_are_combined_in_bytecode():
+    program = Program.from_string(GHZ, cliffords_min.instruction_set)
+    compiled, _ = SteaneCompiler().compile(program)
+    scheduled, _ = SchedulingCompiler(cliffords_min.instruction_set).compile(compiled)
+
+    qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions)
+    assert len(Bytecode(scheduled, qpu).code) < len(Bytecode(compiled, qpu).code)
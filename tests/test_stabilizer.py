@@ -0,0 +1,86 @@
+"""
+Tests for the StabilizerEmulator, which simulates cliffords-min programs with a CHP tableau.
+"""
+
+from qstack import Program
+from qstack.ast import QubitId
+from qstack.compilers.steane import SteaneCompiler
+from qstack.instruction_sets import cliffords_min, toy
+from qstack.machine import local_machine_for
+from qstack.stabilizer import StabilizerEmulator, is_clifford
+
+
+def test_is_clifford():
+    """
+    The cliffords-min instruction set runs on the tableau; toy has a non-Clifford skew gate.
+    """
+    assert is_clifford(cliffords_min.instruction_set)
+    assert not is_clifford(toy.instruction_set)
+
+
+def test_local_machine_picks_stabilizer():
+    machine = local_machine_for(cliffords_min.instruction_set)
+    assert isinstance(machine.qpu, StabilizerEmulator)
+
+    machine = local_machine_for(toy.instruction_set)
+    assert not isinstance(machine.qpu, StabilizerEmulator)
+
+
+def test_bell():
+    program = Program.from_string(
+        """
+allocate q1:
+  h q1
+  allocate q2:
+    cx q1 q2
+  measure
+measure""",
+        cliffords_min.instruction_set,
+    )
+
+    machine = local_machine_for(program.instruction_set)
+    histogram = machine.eval(program, shots=200).get_histogram()
+    assert set(histogram.keys()) <= {(0, 0), (1, 1)}
+    assert len(histogram) == 2
+
+
+def test_deterministic_phases():
+    """
+    H S S H = X, and measured qubits are reset so their slot can be reused.
+    """
+    qpu = StabilizerEmulator(cliffords_min.instruction_set.quantum_definitions)
+    qpu.restart(2)
+    for _ in range(3):
+        qpu.allocate(QubitId("q1"))
+        qpu.eval(cliffords_min.H("q1"))
+        qpu.eval(cliffords_min.S("q1"))
+        qpu.eval(cliffords_min.S("q1"))
+        qpu.eval(cliffords_min.H("q1"))
+        assert qpu.measure() == 1
+
+    qpu.allocate(QubitId("q1"))
+    qpu.allocate(QubitId("q2"))
+    qpu.eval(cliffords_min.Y("q1"))
+    qpu.eval(cliffords_min.H("q2"))
+    qpu.eval(cliffords_min.CZ("q1", "q2"))
+    qpu.eval(cliffords_min.H("q2"))
+    assert qpu.measure() == 1
+    assert qpu.measure() == 1
+
+
+def test_steane_logical_x():
+    program = Program.from_string(
+        """
+allocate q1:
+  x q1
+  allocate q2:
+    cx q1 q2
+  measure
+measure""",
+        cliffords_min.instruction_set,
+    )
+    compiled, callbacks = SteaneCompiler().compile(program)
+
+    machine = local_machine_for(compiled.instruction_set, callbacks)
+    histogram = machine.eval(compiled, shots=20).get_histogram()
+    assert dict(histogram) == {(1, 1): 20}
@@ -0,0 +1,132 @@
+"""
+Tests for the NumpyEmulator, the native NumPy state-vector QPU.
+"""
+
+import math
+
+import numpy as np
+
+from qstack import Program
+from qstack.ast import QubitId
+from qstack.compilers.cliffords2h2 import CliffordsToH2Compiler
+from qstack.instruction_sets import cliffords_min, h2, toy
+from qstack.machine import QuantumMachine
+from qstack.classic_processor import from_callbacks
+from qstack.noise import DepolarizingNoise
+from qstack.statevector import NumpyEmulator, apply_matrix
+
+
+def test_apply_matrix_matches_kron():
+    """
+    Applying a two-qubit gate on arbitrary axes matches the full Kronecker-product matrix.
+    """
+    rng = np.random.default_rng(0)
+    n = 4
+    state = rng.normal(size=2**n) + 1j * rng.normal(size=2**n)
+    matrix = rng.normal(size=(4, 4)) + 1j * rng.normal(size=(4, 4))
+
+    # Reorder the qubits so the targets (3, 1) become the adjacent axes (1, 2).
+    order = [0, 3, 1, 2]
+    tensor = state.reshape((2,) * n).transpose(order).reshape(-1)
+    expected = np.kron(np.eye(2), np.kron(matrix, np.eye(2))) @ tensor
+    expected = expected.reshape((2,) * n).transpose(np.argsort(order)).reshape(-1)
+
+    assert np.allclose(apply_matrix(state, matrix, (3, 1)), expected)
+
+
+def test_slot_reuse():
+    qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions)
+    qpu.restart(2)
+    for _ in range(3):
+        qpu.allocate(QubitId("q1"))
+        qpu.allocate(QubitId("q2"))
+        qpu.eval(cliffords_min.X("q1"))
+        qpu.eval(cliffords_min.CX("q1", "q2"))
+        assert qpu.measure() == 1
+        assert qpu.measure() == 1
+
+
+def test_parameterized_gates():
+    """
+    The h2 decomposition of a bell program runs on the native emulator.
+    """
+    program = Program.from_string(
+        """
+allocate q1:
+  h q1
+  allocate q2:
+    cx q1 q2
+  measure
+measure""",
+        cliffords_min.instruction_set,
+    )
+    compiled, callbacks = CliffordsToH2Compiler().compile(program)
+
+    qpu = NumpyEmulator(h2.instruction_set.quantum_definitions)
+    machine = QuantumMachine(qpu=qpu, cpu=from_callbacks(callbacks))
+    histogram = machine.eval(compiled, shots=200).get_histogram()
+    assert set(histogram.keys()) == {(0, 0), (1, 1)}
+
+
+def test_noise_keeps_state_normalized():
+    qpu = NumpyEmulator(toy.instruction_set.quantum_definitions, DepolarizingNoise(0.5), seed=1)
+    qpu.restart(3)
+    for q in ["q1", "q2", "q3"]:
+        qpu.allocate(QubitId(q))
+    for _ in range(20):
+        qpu.eval(toy.Mix("q1"))
+        qpu.eval(toy.Entangle("q1", "q3"))
+        qpu.eval(toy.Skew("q2", bias=0.3))
+        assert math.isclose(np.linalg.norm(qpu.state), 1.0)
+
+
+def test_dynamic_register():
+    """
+    The dynamic register only holds the live qubits and matches the fixed-width one.
+    """
+    program = Program.from_string(
+        """
+allocate q1:
+  h q1
+  allocate q2:
+    cx q1 q2
+    allocate q3:
+      cx q2 q3
+    measure
+  measure
+  allocate q4:
+    x q4
+  measure
+measure""",
+        cliffords_min.instruction_set,
+    )
+
+    qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions)
+    qpu.restart(3)
+    assert qpu.state.size == 1
+    qpu.allocate(QubitId("q1"))
+    qpu.allocate(QubitId("q2"))
+    assert qpu.state.size == 4
+    qpu.measure()
+    assert qpu.state.size == 2
+
+    for dynamic in [True, False]:
+        qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions, dynamic=dynamic)
+        machine = QuantumMachine(qpu=qpu, cpu=from_callbacks(None))
+        histogram = machine.eval(program, shots=200, sample=False).get_histogram()
+        assert set(histogram.keys()) == {(0, 0, 1, 0), (1, 1, 1, 1)}
+
+
+def test_measurements_renormalize_the_state():
+    """
+    The 4-digit H matrix shrinks the norm a little with every gate; outcomes must not depend on it.
+    """
+    body = "\n".join(["  x q1"] + ["  h q1"] * 400)
+    program = Program.from_string(f"allocate q1:\n{body}\nmeasure", cliffords_min.instruction_set)
+
+    for dynamic in [True, False]:
+        qpu = NumpyEmulator(cliffords_min.instruction_set.quantum_definitions, dynamic=dynamic)
+        machine = QuantumMachine(qpu=qpu, cpu=from_callbacks(None))
+        for batched in [True, False]:
+            histogram = machine.eval(program, shots=500, sample=False, batched=batched, seed=1).get_histogram()
+            assert histogram == {(1,): 500}
@@ -0,0 +1,107 @@
+"""
+Tests for the Steane code compiler and its Pauli-frame mode.
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from qstack import Program, Kernel
+from qstack.ast import QubitId
+from qstack.classic_processor import ClassicContext
+from qstack.compilers import rep3_trivial
+from qstack.compilers.steane import SteaneCompiler, frame_correct_z, apply_frame, data_qubits, syndrome_table, decode
+from qstack.instruction_sets import cliffords_min
+from qstack.machine import local_machine_for
+
+PAULI_HEAVY = """
+allocate q1:
+  x q1
+  z q1
+  h q1
+  z q1
+  allocate q2:
+    x q2
+    cx q1 q2
+    x q1
+  measure
+measure"""
+
+SUPERPOSITION = """
+allocate q1:
+  h q1
+  x q1
+  allocate q2:
+    cx q1 q2
+    x q2
+  measure
+measure"""
+
+
+def gates(kernel: Kernel) -> int:
+    return sum(gates(i) if isinstance(i, Kernel) else 1 for i in kernel.instructions)
+
+
+def run(source: str, pauli_frame: bool, shots: int = 40):
+    program = Program.from_string(source, cliffords_min.instruction_set)
+    compiled, callbacks = SteaneCompiler(pauli_frame=pauli_frame).compile(program)
+    machine = local_machine_for(compiled.instruction_set, callbacks)
+    return compiled, machine.eval(compiled, shots=shots, seed=11).get_histogram()
+
+
+@pytest.mark.parametrize("source", [PAULI_HEAVY, SUPERPOSITION])
+def test_pauli_frame_matches_applied_paulis(source):
+    applied, expected = run(source, pauli_frame=False)
+    tracked, histogram = run(source, pauli_frame=True)
+
+    assert set(histogram) == set(expected)
+    assert gates(tracked.kernels[0]) < gates(applied.kernels[0])
+
+
+def test_pauli_frame_outcomes():
+    # X Z H Z takes q1 to |+>, so the CX onto q2 = |1> and the final X give (|00> + |11>) / sqrt(2).
+    _, histogram = run(PAULI_HEAVY, pauli_frame=True)
+    assert set(histogram) == {(0, 0), (1, 1)}
+    _, histogram = run(SUPERPOSITION, pauli_frame=True)
+    assert set(histogram) == {(0, 1), (1, 0)}
+
+
+def test_corrections_account_for_the_frame():
+    qubit = QubitId("f")
+    data = data_qubits(qubit)
+    context = ClassicContext()
+    context.frame.flip_x(data[3])
+
+    # The pending X is not on the QPU, so the ancillas read a trivial syndrome; the gate-based
+    # run would read (1, 1, 1) and apply the Z correction of that syndrome.
+    for bit in (0, 0, 0):
+        context.collect(bit)
+    frame_correct_z(context, qubit=qubit)
+    assert context.frame.z == {data[syndrome_table[(1, 1, 1)]]}
+
+    # The pending X flips the outcome of data qubit 3 once measured, then the frame is dropped.
+    for bit in [0] * 7:
+        context.collect(bit)
+    apply_frame(context, qubit=qubit)
+    assert list(context)[-7:] == [0, 0, 0, 1, 0, 0, 0]
+    assert not context.frame
+
+
+def test_decoder_tables_match_direct_decoding():
+    checks = np.array([[1, 1, 0, 1, 1, 0, 0], [1, 0, 1, 1, 0, 1, 0], [0, 1, 1, 1, 0, 0, 1]])
+    for outcome in itertools.product((0, 1), repeat=7):
+        bits = np.array(outcome)
+        fault = syndrome_table[tuple(int(c) for c in checks @ bits % 2)]
+        if fault is not None:
+            bits[fault] ^= 1
+
+        # The decoder consumes the replayed outcomes in order.
+        context = ClassicContext.replay(outcome)
+        decode(context)
+        assert context.consume() == int(bits.sum() % 2)
+
+    for outcome in itertools.product((0, 1), repeat=3):
+        context = ClassicContext.replay(outcome)
+        rep3_trivial.decode(context)
+        assert context.consume() == int(sum(outcome) > 1)
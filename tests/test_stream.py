@@ -0,0 +1,62 @@
+"""
+Tests for streaming shots with early stopping.
+"""
+
+import pytest
+
+from qstack import Program
+from qstack.instruction_sets import cliffords_min
+from qstack.machine import local_machine_for
+from qstack.stream import ConfidenceInterval, TimeBudget
+
+BELL = """
+allocate q1:
+  h q1
+  allocate q2:
+    cx q1 q2
+  measure
+measure"""
+
+
+def bell_machine():
+    program = Program.from_string(BELL, cliffords_min.instruction_set)
+    return program, local_machine_for(program.instruction_set)
+
+
+def test_stream_yields_outcomes():
+    program, machine = bell_machine()
+    stream = machine.eval_iter(program, shots=50, seed=3)
+
+    outcomes = list(stream)
+    assert len(outcomes) == 50
+    assert stream.shots == 50
+    assert sum(stream.histogram.values()) == 50
+    assert set(stream.get_histogram().keys()) <= {(0, 0), (1, 1)}
+
+
+def test_confidence_interval_stops_early():
+    program, machine = bell_machine()
+    criterion = ConfidenceInterval((1, 1), epsilon=0.1)
+    stream = machine.eval_iter(program, shots=100_000, stop=criterion, seed=3).run()
+
+    assert stream.stopped_by is criterion
+    # A width of 0.1 around p = 0.5 needs roughly (2 * 1.96 * 0.5 / 0.1) ** 2 ~ 384 shots.
+    assert 300 < stream.shots < 500
+    assert criterion.width(stream) < 0.1
+
+
+def test_predicates_and_time_budget():
+    program, machine = bell_machine()
+    criterion = ConfidenceInterval(lambda outcome: outcome[0] == outcome[1], epsilon=0.05, min_shots=10)
+    stream = machine.eval_iter(program, stop=criterion).run()
+    # Outcomes always agree, so the interval closes as soon as it is trusted.
+    assert stream.shots < 100
+
+    stream = machine.eval_iter(program, stop=TimeBudget(0.0)).run()
+    assert stream.shots == 0
+
+
+def test_unbounded_stream_needs_a_criterion():
+    program, machine = bell_machine()
+    with pytest.raises(ValueError):
+        machine.eval_iter(program)